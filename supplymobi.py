@@ -2,428 +2,1700 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 from plotly.subplots import make_subplots
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
 import warnings
 import sqlite3
 import os
-from datetime import datetime
+import sys
+import hashlib
+import json
+import shutil
+import tempfile
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures.process import BrokenProcessPool
+from openpyxl import load_workbook
+from workbook_ingest import (
+    SCS_COLUMNS_MAP, SAVING_COLUMNS_MAP, SHEETS, KEY_COLUMNS, INGEST_WORKERS,
+    iter_sheet_chunks, assign_line_keys, iter_frame_chunks, stage_chunks, create_ingest_pool, create_progress_manager,
+    stage_workbook_parallel
+)
 
 warnings.filterwarnings('ignore')
 
+# Copy-on-Write (padrão a partir do pandas 3): recortes das abas compartilhadas entre as sessões são
+# visões, e alterar um recorte nunca altera os dados carregados uma vez por processo
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+# Caminho do banco SQLite (configurável pela variável de ambiente SUPPLY_CHAIN_DB)
+DB_PATH = os.environ.get('SUPPLY_CHAIN_DB', 'supply_chain.db')
+
+# Diretório do snapshot colunar do último upload (um arquivo .npy por coluna), ao lado do banco
+SNAPSHOT_DIR = os.path.splitext(DB_PATH)[0] + '_snapshot'
+
+# Configuração aplicada a cada conexão com o banco
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',         # leitores não bloqueiam durante os uploads
+    'synchronous': 'NORMAL',       # seguro com WAL e bem mais rápido que FULL
+    'cache_size': -64000,          # ~64 MB de cache de páginas por conexão
+    'mmap_size': 268435456,        # leitura do arquivo por mapeamento de memória (256 MB)
+    'temp_store': 'MEMORY',        # tabelas temporárias em memória
+    'busy_timeout': 30000,         # aguardar até 30 s por um lock antes de falhar
+}
+SQLITE_READ_CONNECTIONS = 4
+
+# Orçamento de memória do cache de resultados dos filtros (posições das linhas)
+FILTER_CACHE_BYTES = 64 * 1024 * 1024
+
+# Orçamento de memória do cache das seções do dashboard (tabelas, KPIs e gráficos já montados)
+SECTION_CACHE_BYTES = 128 * 1024 * 1024
+
+# Campos dos filtros da sidebar; cada resultado memorizado declara de quais depende
+FILTER_FIELDS = ('data_inicio', 'data_fim', 'trimestres_selecionados', 'meses_selecionados',
+                 'incluir_fins_semana', 'comprador_selecionado')
+
+# Dimensões de baixa cardinalidade mantidas como categorias (códigos inteiros + dicionário)
+CATEGORICAL_COLUMNS = ['Comprador', 'Fornecedor', 'Categoria', 'Status',
+                       'Prioridade', 'Departamento', 'Solicitante']
+
+
+class ConnectionManager:
+    """Conexões do processo com o banco: um pool pequeno de leitura e um único escritor"""
+
+    def __init__(self, path, max_readers=SQLITE_READ_CONNECTIONS):
+        self.path = path
+        self.max_readers = max_readers
+        self._readers = queue.LifoQueue()
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+        self._writer = None
+        self._writer_lock = threading.RLock()
+        self._writer_depth = 0
+
+    def _connect(self):
+        """Abre uma conexão com os pragmas do dashboard"""
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        for pragma, value in SQLITE_PRAGMAS.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+        return conn
+
+    def _acquire_reader(self):
+        """Pega uma conexão livre do pool ou abre outra enquanto houver vaga"""
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._reader_lock:
+            if self._reader_count < self.max_readers:
+                self._reader_count += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._reader_lock:
+                    self._reader_count -= 1
+                raise
+
+        # Pool cheio: aguardar uma conexão ser devolvida
+        return self._readers.get()
+
+    @contextmanager
+    def read(self):
+        """Conexão de leitura emprestada do pool"""
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    @contextmanager
+    def write(self):
+        """Conexão única de escrita; chamadas aninhadas na mesma thread reutilizam a conexão"""
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+
+            self._writer_depth += 1
+            try:
+                yield self._writer
+            finally:
+                self._writer_depth -= 1
+                # Transação deixada aberta por um erro não pode vazar para o próximo escritor
+                if self._writer_depth == 0 and self._writer.in_transaction:
+                    self._writer.rollback()
+
+
+class LRUCache:
+    """Cache LRU thread-safe com orçamento de memória em bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Valor guardado para a chave (e marca como usado recentemente) ou None"""
+        with self._lock:
+            if key not in self._entries:
+                return None
+
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value, size):
+        """Guarda o valor e descarta os menos usados até caber no orçamento"""
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+
+            self._entries[key] = (value, size)
+            self.bytes += size
+
+            while self.bytes > self.max_bytes:
+                _, (_, removed_size) = self._entries.popitem(last=False)
+                self.bytes -= removed_size
+
+
+@st.cache_resource
+def get_connection_manager():
+    """Gerenciador de conexões do banco, criado uma vez por servidor"""
+    return ConnectionManager(DB_PATH)
+
 
 # Função para inicializar o banco de dados
+@st.cache_resource
 def init_database():
-    """Inicializa o banco de dados SQLite"""
-    conn = sqlite3.connect('supply_chain.db', check_same_thread=False )
-    cursor = conn.cursor()
-
-    # Criar tabela para SC's
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS scs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            data DATE,
-            descricao TEXT,
-            status TEXT,
-            prioridade TEXT,
-            solicitante TEXT,
-            departamento TEXT,
-            categoria TEXT,
-            data_compra DATE,
-            pedido INTEGER,
-            tmc INTEGER,
-            pmp INTEGER,
-            valor REAL,
-            fornecedor TEXT,
-            comprador TEXT,
-            upload_timestamp DATETIME
-        )
-    ''')
+    """Inicializa o banco de dados SQLite, uma vez por processo (as execuções seguintes não usam o escritor)"""
+    with get_connection_manager().write() as conn:
+        cursor = conn.cursor()
+
+        # Criar tabela para SC's
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                data DATE,
+                descricao TEXT,
+                status TEXT,
+                prioridade TEXT,
+                solicitante TEXT,
+                departamento TEXT,
+                categoria TEXT,
+                data_compra DATE,
+                pedido INTEGER,
+                tmc INTEGER,
+                pmp INTEGER,
+                valor REAL,
+                fornecedor TEXT,
+                comprador TEXT,
+                upload_timestamp DATETIME,
+                linha INTEGER,
+                chave_linha TEXT
+            )
+        ''')
+
+        # Criar tabela para Saving
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS saving (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                data DATE,
+                numero_pedido INTEGER,
+                fornecedor TEXT,
+                valor_inicial REAL,
+                valor_final REAL,
+                reducao_reais REAL,
+                reducao_percentual REAL,
+                comentarios_negociacao TEXT,
+                tipo_saving TEXT,
+                comprador TEXT,
+                upload_timestamp DATETIME,
+                linha INTEGER,
+                chave_linha TEXT
+            )
+        ''')
+
+        # Chave da carga incremental: número do pedido + chave da linha calculada do conteúdo
+        migrated = [ensure_line_key(cursor, table, KEY_COLUMNS[table], columns_map)
+                    for table, columns_map, _ in SHEETS.values()]
+
+        # Índices das consultas filtradas pela sidebar (buscas por pedido usam o índice único acima)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_scs_data ON scs (data)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_scs_comprador_data ON scs (comprador, data)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_saving_data ON saving (data)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_saving_comprador_data ON saving (comprador, data)')
+
+        # Criar tabela para controle de uploads
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS upload_control (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                last_update DATETIME,
+                filename TEXT,
+                total_scs INTEGER,
+                total_saving INTEGER,
+                file_hash TEXT,
+                mode TEXT
+            )
+        ''')
+
+        # Bancos criados antes do controle por hash e modo não têm as colunas file_hash e mode
+        upload_columns = [row[1] for row in cursor.execute('PRAGMA table_info(upload_control)')]
+        if 'file_hash' not in upload_columns:
+            cursor.execute('ALTER TABLE upload_control ADD COLUMN file_hash TEXT')
+        if 'mode' not in upload_columns:
+            cursor.execute('ALTER TABLE upload_control ADD COLUMN mode TEXT')
+
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_upload_control_hash ON upload_control (file_hash)')
+
+        # Cubo das SCs pré-agregado no upload: contagens e somas por dia e dimensões
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fato_compras (
+                dia DATE,
+                comprador TEXT,
+                fornecedor TEXT,
+                categoria TEXT,
+                prioridade TEXT,
+                qtd INTEGER,
+                valor REAL,
+                tmc_soma REAL,
+                tmc_qtd INTEGER,
+                pmp_soma REAL,
+                pmp_qtd INTEGER,
+                pmp_valor_soma REAL
+            )
+        ''')
+
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_fato_compras_dia ON fato_compras (dia)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_fato_compras_comprador_dia ON fato_compras (comprador, dia)')
+
+        # Conciliação Saving x SC's calculada no upload: uma linha por linha do Saving
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS audit_results (
+                saving_id INTEGER,
+                pedido INTEGER,
+                comprador TEXT,
+                data DATE,
+                valor_final REAL,
+                linhas_sc INTEGER,
+                valor_scs REAL,
+                valor_scs_soma REAL,
+                data_scs DATE
+            )
+        ''')
 
-    # Criar tabela para Saving
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS saving (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            data DATE,
-            numero_pedido INTEGER,
-            fornecedor TEXT,
-            valor_inicial REAL,
-            valor_final REAL,
-            reducao_reais REAL,
-            reducao_percentual REAL,
-            comentarios_negociacao TEXT,
-            tipo_saving TEXT,
-            comprador TEXT,
-            upload_timestamp DATETIME
-        )
-    ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_results_pedido ON audit_results (pedido)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_results_data ON audit_results (data)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_results_comprador_data ON audit_results (comprador, data)')
 
-    # Criar tabela para controle de uploads
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS upload_control (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            last_update DATETIME,
-            filename TEXT,
-            total_scs INTEGER,
-            total_saving INTEGER
-        )
-    ''')
+        # Bancos carregados antes do cubo e da auditoria: montar a partir das abas já gravadas
+        cube_empty = cursor.execute('SELECT 1 FROM fato_compras LIMIT 1').fetchone() is None
+        scs_empty = cursor.execute('SELECT 1 FROM scs LIMIT 1').fetchone() is None
+        if cube_empty and not scs_empty:
+            refresh_purchase_cube(conn)
 
-    conn.commit()
-    conn.close()
+        audit_empty = cursor.execute('SELECT 1 FROM audit_results LIMIT 1').fetchone() is None
+        saving_empty = cursor.execute('SELECT 1 FROM saving LIMIT 1').fetchone() is None
+        if (audit_empty or any(migrated)) and not saving_empty:
+            # Bancos gravados antes da chave por conteúdo: a carga incremental só recalcula os pedidos
+            # alterados, então a auditoria é refeita inteira com a ordem atual das linhas
+            refresh_audit_results(conn)
+
+        conn.commit()
 
     # Criar dimensão de datas
     create_date_dimension()
 
 
+def ensure_line_key(cursor, table, key_column, columns_map):
+    """
+    Garante as colunas linha e chave_linha e o índice único (pedido, chave_linha) da carga incremental;
+    retorna True quando as linhas gravadas precisaram receber a chave
+    """
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+    migrated = 'chave_linha' not in columns
+
+    if migrated:
+        for column, column_type in (('linha', 'INTEGER'), ('chave_linha', 'TEXT')):
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+        # Linhas gravadas antes da chave por conteúdo recebem a chave na ordem em que estão
+        assign_line_keys(cursor.connection, table, key_column, columns_map,
+                         'linha, id' if 'linha' in columns else 'id')
+
+    # A posição da linha deixou de ser chave: muda quando linhas entram ou saem do pedido
+    cursor.execute(f'DROP INDEX IF EXISTS ux_{table}_{key_column}_linha')
+    cursor.execute(f'''
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_{table}_{key_column}_chave_linha
+        ON {table} ({key_column}, chave_linha)
+    ''')
+
+    return migrated
+
+
 def create_date_dimension():
     """Cria tabela dimensão de datas"""
-    conn = sqlite3.connect('supply_chain.db', check_same_thread=False)
-    cursor = conn.cursor()
-
-    # Criar tabela dimensão de datas
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS dim_datas (
-            data_key DATE PRIMARY KEY,
-            ano INTEGER,
-            mes INTEGER,
-            dia INTEGER,
-            nome_mes TEXT,
-            trimestre INTEGER,
-            semestre INTEGER,
-            dia_semana INTEGER,
-            nome_dia_semana TEXT,
-            dia_ano INTEGER,
-            semana_ano INTEGER,
-            eh_fim_semana BOOLEAN,
-            eh_inicio_mes BOOLEAN,
-            eh_fim_mes BOOLEAN
-        )
-    ''')
+    with get_connection_manager().write() as conn:
+        cursor = conn.cursor()
+
+        # Criar tabela dimensão de datas
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS dim_datas (
+                data_key DATE PRIMARY KEY,
+                ano INTEGER,
+                mes INTEGER,
+                dia INTEGER,
+                nome_mes TEXT,
+                trimestre INTEGER,
+                semestre INTEGER,
+                dia_semana INTEGER,
+                nome_dia_semana TEXT,
+                dia_ano INTEGER,
+                semana_ano INTEGER,
+                eh_fim_semana BOOLEAN,
+                eh_inicio_mes BOOLEAN,
+                eh_fim_mes BOOLEAN
+            )
+        ''')
 
-    conn.commit()
-    conn.close()
+        conn.commit()
 
 
-def apply_calendar_filters(scs_df, saving_df, data_inicio, data_fim,
-                           trimestres_selecionados=None, meses_selecionados=None,
-                           incluir_fins_semana=True):
+# Ordinal reservado para linhas sem data (ficam no fim do frame ordenado)
+NAT_ORDINAL = np.iinfo(np.int64).max
+
+
+def date_ordinals(datas):
+    """Converte uma coluna de datas em ordinais de dia int64 (dias desde 1970-01-01)"""
+    dias = pd.to_datetime(datas).to_numpy().astype('datetime64[D]')
+    ordinais = dias.astype(np.int64)
+    ordinais[np.isnat(dias)] = NAT_ORDINAL
+    return ordinais
+
+
+def sort_by_date(df):
     """
-    Aplica filtros usando a tabela calendário nas duas abas
+    Ordena o frame por Data (linhas sem data no fim), mantendo a ordem original entre datas iguais;
+    o índice continua sendo a posição da linha na planilha
     """
+    if 'Data' not in df.columns:
+        return df
 
-    # Carregar dimensão de datas
-    dim_datas = load_date_dimension()
+    ordinais = date_ordinals(df['Data'])
+    if np.all(ordinais[1:] >= ordinais[:-1]):
+        return df
 
-    if dim_datas is None or dim_datas.empty:
-        # Fallback para filtro básico se dimensão não estiver disponível
-        scs_filtered = scs_df[
-            (scs_df['Data'] >= pd.to_datetime(data_inicio)) &
-            (scs_df['Data'] <= pd.to_datetime(data_fim))
-            ]
-        saving_filtered = saving_df[
-            (saving_df['Data'] >= pd.to_datetime(data_inicio)) &
-            (saving_df['Data'] <= pd.to_datetime(data_fim))
-            ]
-        return scs_filtered, saving_filtered
+    return df.iloc[np.argsort(ordinais, kind='stable')]
 
-    # Filtrar dimensão conforme seleções
-    dim_filtrada = dim_datas.copy()
 
-    # Filtro por período
-    dim_filtrada = dim_filtrada[
-        (dim_filtrada['data_key'].dt.date >= data_inicio) &
-        (dim_filtrada['data_key'].dt.date <= data_fim)
-        ]
+class DateIndex:
+    """Índice de datas de um frame ordenado por Data: períodos resolvidos por busca binária"""
 
-    # Filtros adicionais da dimensão
-    if trimestres_selecionados:
-        dim_filtrada = dim_filtrada[dim_filtrada['trimestre'].isin(trimestres_selecionados)]
+    def __init__(self, datas):
+        self.ordinais = date_ordinals(datas)
 
-    if meses_selecionados:
-        dim_filtrada = dim_filtrada[dim_filtrada['mes'].isin(meses_selecionados)]
+        if np.any(self.ordinais[1:] < self.ordinais[:-1]):
+            raise ValueError("O frame precisa estar ordenado por Data")
 
-    if not incluir_fins_semana:
-        dim_filtrada = dim_filtrada[dim_filtrada['eh_fim_semana'] == False]
+    def range(self, data_inicio, data_fim):
+        """Fatia contígua das linhas com data entre data_inicio e data_fim (inclusive)"""
+        inicio = np.datetime64(data_inicio, 'D').astype(np.int64)
+        fim = np.datetime64(data_fim, 'D').astype(np.int64)
 
-    # Obter datas válidas
-    datas_validas = set(dim_filtrada['data_key'].dt.date)
+        return slice(int(np.searchsorted(self.ordinais, inicio, side='left')),
+                     int(np.searchsorted(self.ordinais, fim, side='right')))
 
-    # Aplicar filtro na aba SC's
-    scs_filtered = scs_df[scs_df['Data'].dt.date.isin(datas_validas)].copy()
 
-    # Aplicar filtro na aba Saving
-    saving_filtered = saving_df[saving_df['Data'].dt.date.isin(datas_validas)].copy()
+class BitmapIndex:
+    """Bitmaps compactados (np.packbits) por comprador, trimestre, mês e fim de semana de uma aba"""
 
-    return scs_filtered, saving_filtered
+    def __init__(self, df, ordinais):
+        self.linhas = len(df)
+        self.vazio = np.packbits(np.zeros(self.linhas, dtype=bool))
 
+        # Atributos de calendário de cada linha (1970-01-01 foi uma quinta-feira)
+        com_data = ordinais != NAT_ORDINAL
+        meses = ordinais.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) % 12 + 1
+        trimestres = (meses - 1) // 3 + 1
+        dias_semana = (ordinais + 3) % 7  # 0=Segunda, 6=Domingo
 
-def populate_date_dimension(scs_df, saving_df):
-    """Popula a tabela dimensão com todas as datas únicas das duas abas"""
-    conn = sqlite3.connect('supply_chain.db', check_same_thread=False)
+        self.meses = {mes: np.packbits(com_data & (meses == mes)) for mes in range(1, 13)}
+        self.trimestres = {trimestre: np.packbits(com_data & (trimestres == trimestre))
+                           for trimestre in range(1, 5)}
+        self.dias_uteis = np.packbits(com_data & (dias_semana < 5))
+        self.fins_semana = np.packbits(com_data & (dias_semana >= 5))
 
-    try:
-        # Coletar todas as datas únicas das duas abas
-        datas_scs = set()
-        datas_saving = set()
-
-        # Extrair datas da aba SC's
-        if 'Data' in scs_df.columns:
-            datas_scs.update(pd.to_datetime(scs_df['Data']).dt.date)
-        if 'Data da Compra' in scs_df.columns:
-            datas_scs.update(pd.to_datetime(scs_df['Data da Compra']).dt.date)
-
-        # Extrair datas da aba Saving
-        if 'Data' in saving_df.columns:
-            datas_saving.update(pd.to_datetime(saving_df['Data']).dt.date)
-
-        # Unir todas as datas
-        todas_datas = datas_scs.union(datas_saving)
-
-        # Se não há datas, criar pelo menos um ano de dimensão
-        if not todas_datas:
-            inicio = datetime(2024, 1, 1).date()
-            fim = datetime(2025, 12, 31).date()
-            todas_datas = set()
-            data_atual = inicio
-            while data_atual <= fim:
-                todas_datas.add(data_atual)
-                data_atual += pd.DateOffset(days=1).date()
-
-        # Limpar tabela anterior
-        conn.execute('DELETE FROM dim_datas')
-
-        # Nomes dos meses e dias
-        meses = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
-                 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-
-        dias_semana = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
-
-        # Inserir cada data na dimensão
-        for data in todas_datas:
-            dt = pd.to_datetime(data)
-
-            # Calcular atributos da data
-            ano = dt.year
-            mes = dt.month
-            dia = dt.day
-            nome_mes = meses[mes - 1]
-            trimestre = (mes - 1) // 3 + 1
-            semestre = 1 if mes <= 6 else 2
-            dia_semana = dt.weekday()  # 0=Segunda, 6=Domingo
-            nome_dia_semana = dias_semana[dia_semana]
-            dia_ano = dt.dayofyear
-            semana_ano = dt.isocalendar().week
-            eh_fim_semana = dia_semana >= 5  # Sábado ou Domingo
-            eh_inicio_mes = dia == 1
-            eh_fim_mes = (dt + pd.DateOffset(days=1)).day == 1
-
-            # Inserir na tabela
-            conn.execute('''
-                INSERT OR REPLACE INTO dim_datas 
+        # Um bitmap por comprador presente na aba
+        self.compradores = {}
+        if 'Comprador' in df.columns:
+            codigos, compradores = pd.factorize(df['Comprador'])
+            for codigo, comprador in enumerate(compradores):
+                self.compradores[comprador] = np.packbits(codigos == codigo)
+
+    def select(self, linhas, trimestres_selecionados=None, meses_selecionados=None,
+               incluir_fins_semana=True, comprador_selecionado='Todos'):
+        """Combina os bitmaps das seleções (OR dentro do filtro, AND entre filtros) dentro da fatia de linhas"""
+        # Só os bytes que cobrem a fatia de datas participam das operações
+        inicio_byte, fim_byte = linhas.start // 8, (linhas.stop + 7) // 8
+        bytes_fatia = slice(inicio_byte, fim_byte)
+        filtros = []
+
+        if trimestres_selecionados:
+            filtros.append(np.bitwise_or.reduce([
+                self.trimestres.get(int(trimestre), self.vazio)[bytes_fatia]
+                for trimestre in trimestres_selecionados
+            ]))
+
+        if meses_selecionados:
+            filtros.append(np.bitwise_or.reduce([
+                self.meses.get(int(mes), self.vazio)[bytes_fatia] for mes in meses_selecionados
+            ]))
+
+        if not incluir_fins_semana:
+            filtros.append(self.dias_uteis[bytes_fatia])
+
+        if comprador_selecionado != 'Todos' and self.compradores:
+            filtros.append(self.compradores.get(comprador_selecionado, self.vazio)[bytes_fatia])
+
+        if not filtros:
+            return linhas
+
+        bits = np.bitwise_and.reduce(filtros)
+        mascara = np.unpackbits(bits)[linhas.start - inicio_byte * 8:linhas.stop - inicio_byte * 8]
+        return linhas.start + np.flatnonzero(mascara)
+
+
+@st.cache_resource(max_entries=8)
+def get_date_index(versao, tabela, _df):
+    """Índice de datas de uma aba, criado uma vez por versão dos dados"""
+    return DateIndex(_df['Data'])
+
+
+@st.cache_resource(max_entries=8)
+def get_bitmap_index(versao, tabela, _df):
+    """Bitmaps dos filtros da sidebar de uma aba, criados uma vez por versão dos dados"""
+    return BitmapIndex(_df, get_date_index(versao, tabela, _df).ordinais)
+
+
+@st.cache_resource
+def get_filter_cache():
+    """Cache das posições de linha por combinação de filtros, compartilhado entre as sessões"""
+    return LRUCache(FILTER_CACHE_BYTES)
+
+
+@st.cache_resource
+def get_section_cache():
+    """Cache dos resultados das seções por versão dos dados e filtros, compartilhado entre as sessões"""
+    return LRUCache(SECTION_CACHE_BYTES)
+
+
+def payload_size(valor):
+    """Tamanho aproximado em bytes de um resultado memorizado (tabelas, gráficos e valores)"""
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return int(np.sum(valor.memory_usage(deep=True)))
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(payload_size(k) + payload_size(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(payload_size(item) for item in valor)
+    return sys.getsizeof(valor)
+
+
+def select_rows(df, tabela, data_inicio, data_fim, trimestres_selecionados=None, meses_selecionados=None,
+                incluir_fins_semana=True, comprador_selecionado='Todos', versao=None):
+    """Linhas da aba que atendem aos filtros: período por busca binária, calendário e comprador pelos bitmaps"""
+    if versao is not None:
+        indice_datas = get_date_index(versao, tabela, df)
+        bitmaps = get_bitmap_index(versao, tabela, df)
+    else:
+        indice_datas = DateIndex(df['Data'])
+        bitmaps = BitmapIndex(df, indice_datas.ordinais)
+
+    linhas = indice_datas.range(data_inicio, data_fim)
+    return bitmaps.select(linhas, trimestres_selecionados, meses_selecionados,
+                          incluir_fins_semana, comprador_selecionado)
+
+
+def select_filtered_rows(scs_df, saving_df, data_inicio, data_fim,
+                         trimestres_selecionados=None, meses_selecionados=None,
+                         incluir_fins_semana=True, comprador_selecionado='Todos', versao=None):
+    """
+    Linhas das duas abas (ordenadas por Data) que atendem aos filtros da sidebar, como fatia ou posições;
+    com versão dos dados, as posições ficam no cache compartilhado entre sessões
+    """
+    filtros = (data_inicio, data_fim, trimestres_selecionados, meses_selecionados,
+               incluir_fins_semana, comprador_selecionado)
+
+    if versao is None:
+        selecoes = tuple(select_rows(df, tabela, *filtros)
+                         for tabela, df in (('scs', scs_df), ('saving', saving_df)))
+    else:
+        cache = get_filter_cache()
+        chave = (versao, data_inicio, data_fim,
+                 tuple(trimestres_selecionados) if trimestres_selecionados else None,
+                 tuple(meses_selecionados) if meses_selecionados else None,
+                 incluir_fins_semana, comprador_selecionado)
+
+        selecoes = cache.get(chave)
+        if selecoes is None:
+            selecoes = tuple(select_rows(df, tabela, *filtros, versao=versao)
+                             for tabela, df in (('scs', scs_df), ('saving', saving_df)))
+
+            # Posições compartilhadas entre sessões não podem ser alteradas
+            for selecao in selecoes:
+                if isinstance(selecao, np.ndarray):
+                    selecao.setflags(write=False)
+
+            cache.put(chave, selecoes, sum(getattr(selecao, 'nbytes', 64) for selecao in selecoes))
+
+    return selecoes
+
+
+def build_calendar_frame(inicio, fim):
+    """Gera as linhas da dimensão de datas para o intervalo contínuo [inicio, fim] de forma vetorizada"""
+    datas = pd.date_range(inicio, fim, freq='D')
+
+    # Nomes dos meses e dias
+    meses = np.array(['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+                      'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro'], dtype=object)
+
+    dias_semana = np.array(['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo'], dtype=object)
+
+    mes = datas.month.to_numpy()
+    dia = datas.day.to_numpy()
+    dia_semana = datas.weekday.to_numpy()  # 0=Segunda, 6=Domingo
+
+    return pd.DataFrame({
+        'data_key': datas.strftime('%Y-%m-%d'),
+        'ano': datas.year.to_numpy(),
+        'mes': mes,
+        'dia': dia,
+        'nome_mes': meses[mes - 1],
+        'trimestre': (mes - 1) // 3 + 1,
+        'semestre': np.where(mes <= 6, 1, 2),
+        'dia_semana': dia_semana,
+        'nome_dia_semana': dias_semana[dia_semana],
+        'dia_ano': datas.dayofyear.to_numpy(),
+        'semana_ano': datas.isocalendar().week.to_numpy(dtype=np.int64),
+        'eh_fim_semana': dia_semana >= 5,  # Sábado ou Domingo
+        'eh_inicio_mes': dia == 1,
+        'eh_fim_mes': datas.is_month_end,
+    })
+
+
+def populate_date_dimension():
+    """Estende a dimensão de datas até cobrir o período das duas abas já gravadas no banco"""
+    with get_connection_manager().write() as conn:
+        try:
+            # Primeira e última data das duas abas (MIN/MAX de data usam os índices)
+            limites = conn.execute('''
+                SELECT MIN(inicio), MAX(fim) FROM (
+                    SELECT date(MIN(data)) AS inicio, date(MAX(data)) AS fim FROM scs
+                    UNION ALL
+                    SELECT date(MIN(data_compra)), date(MAX(data_compra)) FROM scs
+                    UNION ALL
+                    SELECT date(MIN(data)), date(MAX(data)) FROM saving
+                )
+            ''').fetchone()
+
+            dimensao = conn.execute('''
+                SELECT MIN(data_key), MAX(data_key), COUNT(*) FROM dim_datas
+            ''').fetchone()
+
+            if limites[0] is None:
+                if dimensao[2] > 0:
+                    return True, 0
+
+                # Se não há datas, criar pelo menos um ano de dimensão
+                limites = ('2024-01-01', '2025-12-31')
+
+            inicio, fim = pd.Timestamp(limites[0]), pd.Timestamp(limites[1])
+
+            if dimensao[2] == 0:
+                intervalos = [(inicio, fim)]
+            else:
+                atual_inicio, atual_fim = pd.Timestamp(dimensao[0]), pd.Timestamp(dimensao[1])
+
+                if dimensao[2] < (atual_fim - atual_inicio).days + 1:
+                    # Dimensão com lacunas (gravada só com as datas presentes): completar uma única vez
+                    intervalos = [(min(inicio, atual_inicio), max(fim, atual_fim))]
+                else:
+                    # Só as datas novas antes e depois do intervalo já gravado
+                    intervalos = [(inicio, atual_inicio - pd.Timedelta(days=1)),
+                                  (atual_fim + pd.Timedelta(days=1), fim)]
+
+            novas_datas = [build_calendar_frame(de, ate) for de, ate in intervalos if de <= ate]
+
+            if not novas_datas:
+                return True, 0
+
+            calendario = pd.concat(novas_datas, ignore_index=True)
+
+            conn.executemany('''
+                INSERT OR IGNORE INTO dim_datas 
                 (data_key, ano, mes, dia, nome_mes, trimestre, semestre, 
                  dia_semana, nome_dia_semana, dia_ano, semana_ano, 
                  eh_fim_semana, eh_inicio_mes, eh_fim_mes)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (data, ano, mes, dia, nome_mes, trimestre, semestre,
-                  dia_semana, nome_dia_semana, dia_ano, semana_ano,
-                  eh_fim_semana, eh_inicio_mes, eh_fim_mes))
+            ''', calendario.astype(object).itertuples(index=False, name=None))
 
-        conn.commit()
-        return True, len(todas_datas)
+            conn.commit()
+            return True, len(calendario)
 
-    except Exception as e:
-        conn.rollback()
-        return False, str(e)
-    finally:
-        conn.close()
+        except Exception as e:
+            conn.rollback()
+            return False, str(e)
 
 
-@st.cache_data
+@st.cache_resource
 def load_date_dimension():
-    """Carrega a dimensão de datas"""
-    if not os.path.exists('supply_chain.db'):
+    """Carrega a dimensão de datas, uma vez por processo e somente para leitura"""
+    if not os.path.exists(DB_PATH):
         return None
 
-    conn = sqlite3.connect('supply_chain.db', check_same_thread=False)
+    with get_connection_manager().read() as conn:
+        try:
+            dim_datas = pd.read_sql_query('''
+                SELECT * FROM dim_datas 
+                ORDER BY data_key
+            ''', conn)
+
+            if not dim_datas.empty:
+                dim_datas['data_key'] = pd.to_datetime(dim_datas['data_key'])
+
+            return dim_datas
 
+        except Exception as e:
+            st.error(f"Erro ao carregar dimensão de datas: {str(e)}")
+            return None
+
+# Função para salvar dados no banco
+def save_to_database(scs_df, saving_df, filename, file_hash=None, mode='incremental'):
+    """Salva os dados no banco SQLite (upsert por pedido ou substituindo os anteriores)"""
     try:
-        dim_datas = pd.read_sql_query('''
-            SELECT * FROM dim_datas 
-            ORDER BY data_key
-        ''', conn)
+        # Timestamp do upload
+        upload_time = datetime.now()
+        declared_types = staging_column_types()
 
-        if not dim_datas.empty:
-            dim_datas['data_key'] = pd.to_datetime(dim_datas['data_key'])
+        # As abas são convertidas em blocos nos arquivos de staging, sem segurar o escritor do banco
+        with upload_staging() as paths:
+            for sheet_name, df in (("SC's", scs_df), ("Saving", saving_df)):
+                table = SHEETS[sheet_name][0]
+                stage_chunks(paths[table], sheet_name, iter_frame_chunks(df), declared_types[table], upload_time)
 
-        return dim_datas
+            apply_upload(paths, mode, upload_time, filename, file_hash)
+
+        return True, upload_time
 
     except Exception as e:
-        st.error(f"Erro ao carregar dimensão de datas: {str(e)}")
-        return None
+        return False, str(e)
+
+
+def staging_column_types():
+    """Tipos declarados das colunas das tabelas finais, repetidos nas tabelas de staging"""
+    with get_connection_manager().read() as conn:
+        return {
+            table: {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info({table})')}
+            for table, _, _ in SHEETS.values()
+        }
+
+
+@contextmanager
+def upload_staging():
+    """Arquivos de staging do upload (um por aba) ao lado do banco, apagados ao final"""
+    folder = os.path.dirname(os.path.abspath(DB_PATH))
+    paths = {}
+
+    try:
+        for table, _, _ in SHEETS.values():
+            handle, paths[table] = tempfile.mkstemp(prefix=f'staging_{table}_', suffix='.db', dir=folder)
+            os.close(handle)
+
+        yield paths
     finally:
-        conn.close()
+        for path in paths.values():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
 
-# Função para salvar dados no banco
-def save_to_database(scs_df, saving_df, filename):
-    """Salva os dados no banco SQLite substituindo os anteriores"""
-    conn = sqlite3.connect('supply_chain.db', check_same_thread=False )
+
+@contextmanager
+def spilled_workbook(file_bytes):
+    """Planilha enviada gravada num arquivo temporário ao lado do banco, apagado ao final"""
+    handle, path = tempfile.mkstemp(prefix='upload_', suffix='.xlsx',
+                                    dir=os.path.dirname(os.path.abspath(DB_PATH)))
 
     try:
-        # Limpar dados anteriores
-        conn.execute('DELETE FROM scs')
-        conn.execute('DELETE FROM saving')
-        conn.execute('DELETE FROM upload_control')
+        with os.fdopen(handle, 'wb') as workbook_file:
+            workbook_file.write(file_bytes)
+
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def apply_upload(paths, mode, upload_time, filename, file_hash):
+    """Aplica as abas preparadas no banco: o escritor só é usado na junção com as tabelas finais"""
+    with get_connection_manager().write() as conn:
+        for table, path in paths.items():
+            conn.execute(f'ATTACH DATABASE ? AS staging_{table}', (path,))
+
+        try:
+            # Aplicar nas tabelas finais e registrar controle do upload
+            merge_upload(conn, mode, upload_time, filename, file_hash)
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            for table in paths:
+                conn.execute(f'DETACH DATABASE staging_{table}')
+
+    # Popular dimensão de datas
+    populate_date_dimension()
+
+    # Gerar o snapshot colunar usado na carga do dashboard (leitura completa das abas, sem o escritor)
+    build_snapshot()
+
+
+def merge_staging_table(conn, table, key_column, columns_map, mode):
+    """
+    Aplica a tabela de staging (anexada como staging_<tabela>) na tabela final. No modo incremental cada
+    pedido da planilha substitui as linhas gravadas do pedido; pedidos ausentes da planilha ficam como estão
+    """
+    column_list = ', '.join(list(columns_map.values()) + ['upload_timestamp', 'linha', 'chave_linha'])
+    staged = f'staging_{table}.{table}'
+
+    if mode == 'substituir':
+        conn.execute(f'DELETE FROM {table}')
+        conn.execute(f'INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staged} ORDER BY stage_id')
+        return
+
+    # Pedido e dia das linhas apagadas, movidas ou inseridas, para atualizar só o que mudou no cubo e na auditoria
+    record_changes = f'INSERT INTO temp.alteradas_{table} (pedido, dia) SELECT {key_column}, date(data) FROM {table}'
+    same_line = f's.{key_column} = {table}.{key_column} AND s.chave_linha = {table}.chave_linha'
+
+    # Linhas que saíram dos pedidos da planilha são apagadas (linhas sem número de pedido não têm chave
+    # e são sempre trocadas pelas da planilha)
+    removed = f'''
+        {key_column} IS NULL
+        OR ({key_column} IN (SELECT {key_column} FROM {staged})
+            AND NOT EXISTS (SELECT 1 FROM {staged} AS s WHERE {same_line}))
+    '''
+    conn.execute(f'{record_changes} WHERE {removed}')
+    conn.execute(f'DELETE FROM {table} WHERE {removed}')
+
+    # Linhas mantidas acompanham a nova posição dentro do pedido
+    conn.execute(f'''
+        {record_changes}
+        WHERE EXISTS (SELECT 1 FROM {staged} AS s WHERE {same_line} AND {table}.linha IS NOT s.linha)
+    ''')
+    conn.execute(f'''
+        UPDATE {table} SET linha = s.linha
+        FROM {staged} AS s
+        WHERE {same_line} AND {table}.linha IS NOT s.linha
+    ''')
+
+    # Linhas novas ou alteradas (o conteúdo faz parte da chave) são inseridas; linhas iguais ficam intactas
+    last_id = conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+    conn.execute(f'''
+        INSERT INTO {table} ({column_list})
+        SELECT {column_list} FROM {staged} WHERE true ORDER BY stage_id
+        ON CONFLICT ({key_column}, chave_linha) DO NOTHING
+    ''')
+    conn.execute(f'{record_changes} WHERE id > ?', (last_id,))
+
+
+def merge_upload(conn, mode, upload_time, filename, file_hash):
+    """Aplica as duas abas preparadas e registra o upload em uma única transação curta"""
+    for table, columns_map, _ in SHEETS.values():
+        conn.execute(f'DROP TABLE IF EXISTS temp.alteradas_{table}')
+        conn.execute(f'CREATE TEMP TABLE alteradas_{table} (pedido INTEGER, dia DATE)')
+
+        merge_staging_table(conn, table, KEY_COLUMNS[table], columns_map, mode)
+
+    # O cubo agregado e a conciliação da auditoria acompanham as abas na mesma transação
+    if mode == 'substituir':
+        refresh_purchase_cube(conn)
+        refresh_audit_results(conn)
+    else:
+        # Carga incremental: só os dias e pedidos das linhas alteradas
+        refresh_purchase_cube(conn, 'SELECT dia FROM temp.alteradas_scs')
+        refresh_audit_results(conn, 'SELECT pedido FROM temp.alteradas_scs UNION SELECT pedido FROM temp.alteradas_saving')
+
+    # Registrar controle do upload com o total de linhas das tabelas após a carga
+    total_scs = conn.execute('SELECT COUNT(*) FROM scs').fetchone()[0]
+    total_saving = conn.execute('SELECT COUNT(*) FROM saving').fetchone()[0]
+    conn.execute('''
+        INSERT INTO upload_control (last_update, filename, total_scs, total_saving, file_hash, mode)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (upload_time, filename, total_scs, total_saving, file_hash, mode))
+
+    conn.commit()
+
+    for table in KEY_COLUMNS:
+        conn.execute(f'DROP TABLE IF EXISTS temp.alteradas_{table}')
+
+
+def refresh_purchase_cube(conn, days_query=None):
+    """
+    Recalcula o cubo fato_compras (dia, comprador, fornecedor, categoria, prioridade) a partir das SCs;
+    com days_query (consulta que devolve a coluna dia), só os dias listados
+    """
+    source = 'scs'
+
+    if days_query is None:
+        conn.execute('DELETE FROM fato_compras')
+    else:
+        null_day = conn.execute(f'SELECT 1 FROM ({days_query}) WHERE dia IS NULL LIMIT 1').fetchone() is not None
+        conn.execute(f'''
+            DELETE FROM fato_compras
+            WHERE dia IN ({days_query}) {'OR dia IS NULL' if null_day else ''}
+        ''')
+
+        # Cada dia vira uma faixa de scs.data, que usa o índice da coluna
+        source = f'''(
+            SELECT scs.* FROM (SELECT DISTINCT dia FROM ({days_query}) WHERE dia IS NOT NULL) AS dias
+            JOIN scs ON scs.data >= dias.dia AND scs.data < date(dias.dia, '+1 day')
+            {'UNION ALL SELECT * FROM scs WHERE date(data) IS NULL' if null_day else ''}
+        )'''
+
+    conn.execute(f'''
+        INSERT INTO fato_compras (dia, comprador, fornecedor, categoria, prioridade, qtd, valor,
+                                  tmc_soma, tmc_qtd, pmp_soma, pmp_qtd, pmp_valor_soma)
+        SELECT date(data), comprador, fornecedor, categoria, prioridade,
+               COUNT(*), TOTAL(valor),
+               TOTAL(tmc), COUNT(tmc),
+               TOTAL(pmp), COUNT(pmp),
+               TOTAL(pmp * valor)
+        FROM {source}
+        GROUP BY date(data), comprador, fornecedor, categoria, prioridade
+    ''')
+
+
+def refresh_audit_results(conn, orders_query=None):
+    """
+    Recalcula a conciliação Saving x SC's por pedido (soma, quantidade de linhas e a primeira linha
+    na ordem da planilha: posição da linha no pedido e id); com orders_query (consulta que devolve a
+    coluna pedido), só os pedidos listados e as linhas do Saving sem número de pedido
+    """
+    saving_filter = scs_filter = ''
+
+    if orders_query is None:
+        conn.execute('DELETE FROM audit_results')
+    else:
+        conn.execute(f'DELETE FROM audit_results WHERE pedido IN ({orders_query}) OR pedido IS NULL')
+        saving_filter = f'WHERE s.numero_pedido IN ({orders_query}) OR s.numero_pedido IS NULL'
+        scs_filter = f'AND pedido IN ({orders_query})'
+
+    # Resumo das SCs por pedido numa tabela com chave, para a junção com o Saving usar o índice
+    conn.execute('DROP TABLE IF EXISTS temp.resumo_pedidos')
+    conn.execute('''
+        CREATE TEMP TABLE resumo_pedidos (
+            pedido INTEGER PRIMARY KEY, valor REAL, data DATE, linhas INTEGER, valor_soma REAL
+        )
+    ''')
+    conn.execute(f'''
+        INSERT INTO temp.resumo_pedidos (pedido, valor, data, linhas, valor_soma)
+        SELECT pedido, valor, data, linhas, valor_soma
+        FROM (
+            SELECT pedido, valor, data,
+                   ROW_NUMBER() OVER (PARTITION BY pedido ORDER BY linha, id) AS ordem,
+                   COUNT(*) OVER (PARTITION BY pedido) AS linhas,
+                   TOTAL(valor) OVER (PARTITION BY pedido) AS valor_soma
+            FROM scs
+            WHERE pedido IS NOT NULL {scs_filter}
+        )
+        WHERE ordem = 1
+    ''')
+
+    conn.execute(f'''
+        INSERT INTO audit_results (saving_id, pedido, comprador, data, valor_final,
+                                   linhas_sc, valor_scs, valor_scs_soma, data_scs)
+        SELECT s.id, s.numero_pedido, s.comprador, s.data, s.valor_final,
+               p.linhas, p.valor, p.valor_soma, p.data
+        FROM saving s
+        LEFT JOIN temp.resumo_pedidos p ON p.pedido = s.numero_pedido
+        {saving_filter}
+    ''')
+    conn.execute('DROP TABLE temp.resumo_pedidos')
+
+
+def stream_to_database(uploaded_file, filename, file_hash=None, progress_callback=None, mode='incremental'):
+    """Carrega a planilha em streaming (openpyxl read-only) para o banco SQLite"""
+    workbook = None
+
+    try:
+        workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+
+        for sheet_name in SHEETS:
+            if sheet_name not in workbook.sheetnames:
+                raise ValueError(f"Aba '{sheet_name}' não encontrada no arquivo")
 
         # Timestamp do upload
         upload_time = datetime.now()
+        declared_types = staging_column_types()
 
-        # Preparar dados SCs para inserção
-        scs_data = scs_df.copy()
-        scs_data['upload_timestamp'] = upload_time
-
-        # Mapear colunas do DataFrame para o banco
-        scs_columns_map = {
-            'Data': 'data',
-            'Descrição': 'descricao',
-            'Status': 'status',
-            'Prioridade': 'prioridade',
-            'Solicitante': 'solicitante',
-            'Departamento': 'departamento',
-            'Categoria': 'categoria',
-            'Data da Compra': 'data_compra',
-            'Pedido': 'pedido',
-            'TMC': 'tmc',
-            'PMP': 'pmp',
-            'Valor': 'valor',
-            'Fornecedor': 'fornecedor',
-            'Comprador': 'comprador'
-        }
+        # A planilha é lida para os arquivos de staging sem segurar o escritor do banco
+        with upload_staging() as paths:
+            for sheet_name, (table, _, _) in SHEETS.items():
+                report = None
+                if progress_callback is not None:
+                    total_rows = workbook[sheet_name].max_row
+                    report = lambda written, sheet_name=sheet_name, total_rows=total_rows: \
+                        progress_callback(sheet_name, written, total_rows)
 
-        # Renomear colunas
-        scs_renamed = scs_data.rename(columns=scs_columns_map)
-
-        # Inserir dados SCs
-        scs_renamed.to_sql('scs', conn, if_exists='append', index=False)
-
-        # Preparar dados Saving para inserção
-        saving_data = saving_df.copy()
-        saving_data['upload_timestamp'] = upload_time
-
-        # Mapear colunas Saving
-        saving_columns_map = {
-            'Data': 'data',
-            'Número Pedido': 'numero_pedido',
-            'Fornecedor': 'fornecedor',
-            'VALOR INICIAL': 'valor_inicial',
-            'VALOR FINAL': 'valor_final',
-            'Redução R$': 'reducao_reais',
-            'Redução %': 'reducao_percentual',
-            'Comentários Negocição': 'comentarios_negociacao',
-            'Tipo de Saving': 'tipo_saving',
-            'Comprador': 'comprador'
-        }
+                stage_chunks(paths[table], sheet_name, iter_sheet_chunks(workbook, sheet_name),
+                             declared_types[table], upload_time, report)
 
-        # Renomear colunas
-        saving_renamed = saving_data.rename(columns=saving_columns_map)
+            apply_upload(paths, mode, upload_time, filename, file_hash)
 
-        # Inserir dados Saving
-        saving_renamed.to_sql('saving', conn, if_exists='append', index=False)
+        return True, upload_time
 
-        # Registrar controle do upload
-        conn.execute('''
-            INSERT INTO upload_control (last_update, filename, total_scs, total_saving)
-            VALUES (?, ?, ?, ?)
-        ''', (upload_time, filename, len(scs_df), len(saving_df)))
+    except Exception as e:
+        return False, str(e)
+    finally:
+        if workbook is not None:
+            workbook.close()
 
-        conn.commit()
 
-        # Popular dimensão de datas
-        populate_date_dimension(scs_df, saving_df)
+@st.cache_resource
+def get_ingest_pool():
+    """Pool de processos da leitura paralela, criado uma vez por servidor"""
+    return create_ingest_pool()
+
+
+@st.cache_resource
+def get_ingest_manager():
+    """Gerenciador das filas de progresso da leitura paralela, criado uma vez por servidor"""
+    return create_progress_manager()
+
+
+def parallel_ingest_to_database(file_bytes, filename, file_hash=None, progress_callback=None, mode='incremental'):
+    """Lê as duas abas em paralelo (uma por processo) para o staging e grava o resultado no banco"""
+    try:
+        # Timestamp do upload
+        upload_time = datetime.now()
+        declared_types = staging_column_types()
+
+        with upload_staging() as paths, spilled_workbook(file_bytes) as workbook_path:
+            progress_queue = get_ingest_manager().Queue() if progress_callback is not None else None
+
+            try:
+                stage_workbook_parallel(workbook_path, get_ingest_pool(), paths, declared_types, upload_time,
+                                        progress_callback, progress_queue)
+            except BrokenProcessPool:
+                # Um processo morto inutiliza o pool; o próximo upload cria outro
+                get_ingest_pool.clear()
+                raise
+
+            apply_upload(paths, mode, upload_time, filename, file_hash)
 
         return True, upload_time
 
+    except BrokenProcessPool:
+        raise
     except Exception as e:
-        conn.rollback()
         return False, str(e)
-    finally:
-        conn.close()
+
+
+def ingest_workbook(uploaded_file, filename, file_hash=None, progress_callback=None, mode='incremental'):
+    """Carrega uma planilha .xlsx no banco, em paralelo quando há mais de um processador"""
+    # Com um único processador o pool só acrescentaria o custo de criar processos
+    if INGEST_WORKERS > 1:
+        try:
+            return parallel_ingest_to_database(uploaded_file.getvalue(), filename, file_hash,
+                                               progress_callback, mode)
+        except BrokenProcessPool:
+            # Sem pool disponível, seguir com a leitura em streaming no próprio processo
+            pass
+
+    return stream_to_database(uploaded_file, filename, file_hash, progress_callback, mode)
+
+
+def compute_file_hash(uploaded_file):
+    """Calcula o SHA-256 do conteúdo do arquivo enviado"""
+    hasher = hashlib.sha256()
+
+    uploaded_file.seek(0)
+    for block in iter(lambda: uploaded_file.read(1024 * 1024), b''):
+        hasher.update(block)
+    uploaded_file.seek(0)
+
+    return hasher.hexdigest()
+
+
+def get_upload_hash(uploaded_file):
+    """Retorna o hash do arquivo, calculado uma única vez por arquivo na sessão"""
+    file_key = getattr(uploaded_file, 'file_id', None) or (uploaded_file.name, uploaded_file.size)
+    hashes = st.session_state.setdefault('upload_hashes', {})
+
+    if file_key not in hashes:
+        hashes[file_key] = compute_file_hash(uploaded_file)
+
+    return hashes[file_key]
+
+
+def is_upload_already_loaded(file_hash, mode):
+    """Verifica se o último upload gravado no banco veio de um arquivo com o mesmo conteúdo, no mesmo modo"""
+    if not os.path.exists(DB_PATH):
+        return False
+
+    with get_connection_manager().read() as conn:
+        last_upload = conn.execute('''
+            SELECT file_hash, mode FROM upload_control
+            ORDER BY last_update DESC
+            LIMIT 1
+        ''').fetchone()
+        return last_upload is not None and tuple(last_upload) == (file_hash, mode)
+
+
+def build_filter_query(table, data_inicio, data_fim, trimestres_selecionados=None,
+                       meses_selecionados=None, incluir_fins_semana=True, comprador_selecionado='Todos',
+                       date_column='data'):
+    """Monta a consulta (SQL e parâmetros) das linhas da tabela que atendem aos filtros da sidebar"""
+    # Período direto na coluna de data (texto 'AAAA-MM-DD...'), usando o índice
+    conditions = [f't.{date_column} >= ?', f't.{date_column} < ?']
+    params = [data_inicio.strftime('%Y-%m-%d'), (data_fim + timedelta(days=1)).strftime('%Y-%m-%d')]
+
+    if comprador_selecionado != 'Todos':
+        conditions.append('t.comprador = ?')
+        params.append(comprador_selecionado)
+
+    # Trimestre, mês e fim de semana vêm da dimensão de datas
+    join = ''
+    if trimestres_selecionados or meses_selecionados or not incluir_fins_semana:
+        join = f'JOIN dim_datas d ON d.data_key = date(t.{date_column})'
+
+        if trimestres_selecionados:
+            conditions.append(f'd.trimestre IN ({", ".join("?" * len(trimestres_selecionados))})')
+            params.extend(int(trimestre) for trimestre in trimestres_selecionados)
+
+        if meses_selecionados:
+            conditions.append(f'd.mes IN ({", ".join("?" * len(meses_selecionados))})')
+            params.extend(int(mes) for mes in meses_selecionados)
+
+        if not incluir_fins_semana:
+            conditions.append('d.eh_fim_semana = 0')
+
+    query = f'''
+        SELECT t.* FROM {table} t
+        {join}
+        WHERE {' AND '.join(conditions)}
+    '''
+    return query, params
+
+
+def read_tables_from_database(conn):
+    """Lê as tabelas scs e saving ordenadas por data, com os nomes de coluna da planilha"""
+    # Carregar SCs (linhas sem data no fim, como no índice de datas)
+    scs_df = pd.read_sql_query('SELECT * FROM scs ORDER BY data IS NULL, data, id', conn)
+
+    # Carregar Saving
+    saving_df = pd.read_sql_query('SELECT * FROM saving ORDER BY data IS NULL, data, id', conn)
+
+    if not scs_df.empty:
+        # Converter colunas de data
+        scs_df['data'] = pd.to_datetime(scs_df['data'])
+        scs_df['data_compra'] = pd.to_datetime(scs_df['data_compra'])
+
+    if not saving_df.empty:
+        saving_df['data'] = pd.to_datetime(saving_df['data'])
+
+    # Renomear colunas de volta para o padrão original
+    scs_columns_reverse = {v: k for k, v in SCS_COLUMNS_MAP.items()}
+    saving_columns_reverse = {v: k for k, v in SAVING_COLUMNS_MAP.items()}
+
+    scs_df = scs_df.rename(columns=scs_columns_reverse)
+    saving_df = saving_df.rename(columns=saving_columns_reverse)
+
+    return apply_categorical_schema(scs_df, saving_df)
+
+
+def apply_categorical_schema(scs_df, saving_df):
+    """Converte as dimensões de baixa cardinalidade em categorias com o mesmo dicionário nas duas abas"""
+    scs_df = scs_df.copy(deep=False)
+    saving_df = saving_df.copy(deep=False)
+
+    for column in CATEGORICAL_COLUMNS:
+        frames = [df for df in (scs_df, saving_df) if column in df.columns]
+
+        if not frames:
+            continue
+
+        # Dicionário compartilhado: união dos valores das duas abas, em ordem alfabética
+        categories = None
+        for df in frames:
+            series = df[column]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                values = series.cat.categories
+            else:
+                values = pd.Index(series.dropna().unique())
+            categories = values.sort_values() if categories is None else categories.union(values)
+
+        dtype = pd.CategoricalDtype(categories)
+
+        for df in frames:
+            if df[column].dtype != dtype:
+                df[column] = df[column].astype(dtype)
+
+    return scs_df, saving_df
+
+
+def write_snapshot(upload_id, tables):
+    """Grava o snapshot colunar (um arquivo .npy por coluna) identificado pelo id do upload"""
+    final_dir = os.path.join(SNAPSHOT_DIR, str(upload_id))
+    temp_dir = final_dir + '.tmp'
+
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+
+    manifest = {'upload_id': upload_id, 'tables': {}, 'categories': {}}
+
+    for table, df in tables.items():
+        columns = []
+
+        for position, column in enumerate(df.columns):
+            series = df[column]
+            file_name = f'{table}.{position}.npy'
+
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                # Categorias: códigos como estão e um único dicionário por coluna para as duas abas
+                np.save(os.path.join(temp_dir, file_name), series.cat.codes.to_numpy())
+                manifest['categories'][column] = [str(value) for value in series.cat.categories]
+                columns.append({'name': column, 'file': file_name, 'encoding': 'categorical'})
+            elif pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_dtype(series):
+                # Colunas numéricas e de data são gravadas como estão
+                np.save(os.path.join(temp_dir, file_name), series.to_numpy())
+                columns.append({'name': column, 'file': file_name, 'encoding': 'plain'})
+            else:
+                # Colunas de texto: códigos inteiros + dicionário de valores (-1 para ausentes)
+                codes, uniques = pd.factorize(series)
+                np.save(os.path.join(temp_dir, file_name), codes.astype(np.int32))
+                columns.append({'name': column, 'file': file_name, 'encoding': 'dictionary',
+                                'dictionary': [str(value) for value in uniques]})
+
+        manifest['tables'][table] = {'rows': len(df), 'columns': columns}
+
+    with open(os.path.join(temp_dir, 'manifest.json'), 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, ensure_ascii=False)
+
+    # Publicar o snapshot completo de uma vez e descartar os de uploads anteriores
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(temp_dir, final_dir)
+
+    for entry in os.listdir(SNAPSHOT_DIR):
+        if entry != str(upload_id):
+            shutil.rmtree(os.path.join(SNAPSHOT_DIR, entry), ignore_errors=True)
+
+
+def read_snapshot(upload_id):
+    """Mapeia o snapshot colunar do upload em memória (np.load com mmap), sem ler o banco"""
+    snapshot_dir = os.path.join(SNAPSHOT_DIR, str(upload_id))
+    manifest_path = os.path.join(snapshot_dir, 'manifest.json')
+
+    if not os.path.exists(manifest_path):
+        return None
+
+    with open(manifest_path, encoding='utf-8') as manifest_file:
+        manifest = json.load(manifest_file)
+
+    # Snapshot de outro upload não serve
+    if manifest.get('upload_id') != upload_id:
+        return None
+
+    # Um dtype por dimensão, compartilhado pelas duas abas
+    dtypes = {
+        column: pd.CategoricalDtype(categories)
+        for column, categories in manifest.get('categories', {}).items()
+    }
+
+    tables = {}
+
+    for table, spec in manifest['tables'].items():
+        data = {}
+
+        for column in spec['columns']:
+            # Arquivos vazios não podem ser mapeados
+            mmap_mode = 'r' if spec['rows'] > 0 else None
+            # np.asarray devolve uma visão ndarray comum do mapeamento, sem cópia
+            values = np.asarray(np.load(os.path.join(snapshot_dir, column['file']), mmap_mode=mmap_mode))
+
+            if column['encoding'] == 'categorical':
+                # Os códigos mapeados viram a categoria diretamente, sem cópia
+                values = pd.Categorical.from_codes(values, dtype=dtypes[column['name']])
+            elif column['encoding'] == 'dictionary':
+                # O código -1 aponta para o último item (None)
+                dictionary = np.array(column['dictionary'] + [None], dtype=object)
+                values = dictionary[values]
+
+            data[column['name']] = values
+
+        tables[table] = pd.DataFrame(data, copy=False)
+
+    return tables
+
+
+def build_snapshot():
+    """
+    Gera o snapshot colunar do último upload a partir das tabelas do banco. O snapshot é sempre refeito
+    inteiro, também na carga incremental: as linhas vêm ordenadas por data e os dicionários das colunas
+    valem para a aba toda, então não há como trocar só as linhas alteradas
+    """
+    with get_connection_manager().read() as conn:
+        try:
+            last_upload = conn.execute('''
+                SELECT id FROM upload_control
+                ORDER BY last_update DESC
+                LIMIT 1
+            ''').fetchone()
+
+            if last_upload is None:
+                return False
+
+            scs_df, saving_df = read_tables_from_database(conn)
+            write_snapshot(last_upload[0], {'scs': scs_df, 'saving': saving_df})
+            return True
+
+        except Exception:
+            # Sem snapshot, a carga do dashboard usa o banco diretamente
+            return False
 
 
 # Função para carregar dados do banco
-@st.cache_data
+@st.cache_resource
 def load_from_database():
-    """Carrega dados do banco SQLite"""
-    if not os.path.exists('supply_chain.db'):
+    """Carrega dados do snapshot colunar do último upload ou, na falta dele, do banco SQLite"""
+    if not os.path.exists(DB_PATH):
         return None, None, None
 
-    conn = sqlite3.connect('supply_chain.db', check_same_thread=False)
+    with get_connection_manager().read() as conn:
+        try:
+            # Carregar info do último upload
+            upload_info = pd.read_sql_query('''
+                SELECT id, last_update, filename, total_scs, total_saving 
+                FROM upload_control 
+                ORDER BY last_update DESC 
+                LIMIT 1
+            ''', conn)
+
+            upload_id = int(upload_info.iloc[0]['id']) if not upload_info.empty else None
+
+            if upload_id is not None:
+                try:
+                    snapshot = read_snapshot(upload_id)
+                except Exception:
+                    snapshot = None
+
+                if snapshot is not None:
+                    # Snapshots antigos podem trazer as dimensões como texto e as linhas na ordem do id
+                    scs_df, saving_df = apply_categorical_schema(snapshot['scs'], snapshot['saving'])
+                    return sort_by_date(scs_df), sort_by_date(saving_df), upload_info
+
+            scs_df, saving_df = read_tables_from_database(conn)
+
+            if upload_id is not None:
+                # Banco sem snapshot (ex.: carregado por versão anterior): gerar para as próximas cargas
+                try:
+                    write_snapshot(upload_id, {'scs': scs_df, 'saving': saving_df})
+                except Exception:
+                    pass
+
+            return scs_df, saving_df, upload_info
 
-    try:
-        # Carregar SCs
-        scs_df = pd.read_sql_query('SELECT * FROM scs', conn)
+        except Exception as e:
+            st.error(f"Erro ao carregar do banco: {str(e)}")
+            return None, None, None
 
-        # Carregar Saving
-        saving_df = pd.read_sql_query('SELECT * FROM saving', conn)
 
-        # Carregar info do último upload
-        upload_info = pd.read_sql_query('''
-            SELECT last_update, filename, total_scs, total_saving 
-            FROM upload_control 
-            ORDER BY last_update DESC 
-            LIMIT 1
-        ''', conn)
-
-        if not scs_df.empty:
-            # Converter colunas de data
-            scs_df['data'] = pd.to_datetime(scs_df['data'])
-            scs_df['data_compra'] = pd.to_datetime(scs_df['data_compra'])
-
-        if not saving_df.empty:
-            saving_df['data'] = pd.to_datetime(saving_df['data'])
-
-        # Renomear colunas de volta para o padrão original
-        scs_columns_reverse = {
-            'data': 'Data',
-            'descricao': 'Descrição',
-            'status': 'Status',
-            'prioridade': 'Prioridade',
-            'solicitante': 'Solicitante',
-            'departamento': 'Departamento',
-            'categoria': 'Categoria',
-            'data_compra': 'Data da Compra',
-            'pedido': 'Pedido',
-            'tmc': 'TMC',
-            'pmp': 'PMP',
-            'valor': 'Valor',
-            'fornecedor': 'Fornecedor',
-            'comprador': 'Comprador'
-        }
+# Agregações ponderadas reutilizáveis (PMPP e afins) para qualquer dimensão
+def safe_divide(numerador, denominador):
+    """Divide elemento a elemento (escalares, arrays ou Series) devolvendo NaN onde o denominador é zero"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        resultado = np.divide(numerador, denominador)
 
-        saving_columns_reverse = {
-            'data': 'Data',
-            'numero_pedido': 'Número Pedido',
-            'fornecedor': 'Fornecedor',
-            'valor_inicial': 'VALOR INICIAL',
-            'valor_final': 'VALOR FINAL',
-            'reducao_reais': 'Redução R$',
-            'reducao_percentual': 'Redução %',
-            'comentarios_negociacao': 'Comentários Negocição',
-            'tipo_saving': 'Tipo de Saving',
-            'comprador': 'Comprador'
-        }
+    if isinstance(resultado, pd.Series):
+        # Series mantém o índice; um denominador também Series é alinhado pelo índice
+        if isinstance(denominador, pd.Series):
+            return resultado.mask(denominador == 0)
+        return resultado.mask(np.broadcast_to(np.asarray(denominador) == 0, resultado.shape))
 
-        scs_df = scs_df.rename(columns=scs_columns_reverse)
-        saving_df = saving_df.rename(columns=saving_columns_reverse)
+    # Escalares e arrays: [()] devolve escalar quando as entradas são escalares
+    return np.where(np.asarray(denominador) == 0, np.nan, resultado)[()]
 
-        return scs_df, saving_df, upload_info
 
-    except Exception as e:
-        st.error(f"Erro ao carregar do banco: {str(e)}")
-        return None, None, None
-    finally:
-        conn.close()
+def weighted_mean(df, by, value, weight):
+    """Média de value ponderada por weight em cada grupo de by: Σ(value × weight) ÷ Σ(weight)"""
+    keys = [by] if isinstance(by, str) else list(by)
+    somas = df[keys].assign(
+        _produto=df[value] * df[weight],
+        _peso=df[weight]
+    ).groupby(keys, observed=True)[['_produto', '_peso']].sum()
+
+    return safe_divide(somas['_produto'], somas['_peso']).rename(value)
+
+
+def weighted_percentile(df, by, value, weight, q=0.5):
+    """Percentil ponderado de value: menor valor cujo peso acumulado atinge q do peso do grupo (by=None para o total)"""
+    keys = [] if by is None else ([by] if isinstance(by, str) else list(by))
+    dados = df[keys + [value, weight]].dropna(subset=[value])
+    dados = dados[dados[weight] > 0].sort_values(keys + [value], kind='stable')
+
+    if not keys:
+        acumulado = dados[weight].cumsum().to_numpy()
+        if len(acumulado) == 0:
+            return np.nan
+        posicao = np.searchsorted(acumulado, q * acumulado[-1], side='left')
+        return dados[value].iloc[min(posicao, len(acumulado) - 1)]
+
+    acumulado = dados.groupby(keys, observed=True)[weight].cumsum()
+    total = acumulado.groupby([dados[key] for key in keys], observed=True).transform('max')
+    return dados[acumulado >= q * total].groupby(keys, observed=True)[value].first()
+
+
+def share_of_total(valores):
+    """Participação de cada valor no total (0 a 1), NaN quando o total é zero"""
+    return safe_divide(valores, valores.sum())
+
+
+# Medidas aditivas do cubo de SCs
+CUBE_MEASURES = ['qtd', 'valor', 'tmc_soma', 'tmc_qtd', 'pmp_soma', 'pmp_qtd', 'pmp_valor_soma']
+
+
+@st.cache_data(max_entries=16)
+def load_cube_from_database(upload_id, data_inicio, data_fim, trimestres_selecionados=None,
+                            meses_selecionados=None, incluir_fins_semana=True,
+                            comprador_selecionado='Todos'):
+    """Busca no banco as linhas do cubo fato_compras que atendem aos filtros da sidebar"""
+    query, params = build_filter_query(
+        'fato_compras', data_inicio, data_fim, trimestres_selecionados, meses_selecionados,
+        incluir_fins_semana, comprador_selecionado, date_column='dia'
+    )
+
+    with get_connection_manager().read() as conn:
+        cubo = pd.read_sql_query(query, conn, params=params)
+
+    cubo['dia'] = pd.to_datetime(cubo['dia'])
+    return cubo.rename(columns={'dia': 'Dia', 'comprador': 'Comprador', 'fornecedor': 'Fornecedor',
+                                'categoria': 'Categoria', 'prioridade': 'Prioridade'})
+
+
+def build_purchase_cube(scs_df):
+    """Monta o cubo das SCs em memória (dados de exemplo ou upload não salvo), no mesmo formato do banco"""
+    scs_df = scs_df.copy(deep=False)
+
+    # Planilhas sem o cabeçalho 'Categoria' usam a coluna G
+    if 'Categoria' not in scs_df.columns and len(scs_df.columns) > 6:
+        scs_df['Categoria'] = scs_df[scs_df.columns[6]]
+
+    scs_df['Dia'] = scs_df['Data'].dt.normalize()
+    scs_df['pmp_valor'] = scs_df['PMP'] * scs_df['Valor']
+
+    dimensions = [column for column in ['Dia', 'Comprador', 'Fornecedor', 'Categoria', 'Prioridade']
+                  if column in scs_df.columns]
+
+    return scs_df.groupby(dimensions, observed=True, dropna=False).agg(
+        qtd=('Valor', 'size'),
+        valor=('Valor', 'sum'),
+        tmc_soma=('TMC', 'sum'),
+        tmc_qtd=('TMC', 'count'),
+        pmp_soma=('PMP', 'sum'),
+        pmp_qtd=('PMP', 'count'),
+        pmp_valor_soma=('pmp_valor', 'sum')
+    ).reset_index()
+
+
+def aggregate_cube(cubo, dimension):
+    """Soma o cubo por uma dimensão e deriva Valor, TMC e PMP médios e PMPP ponderado"""
+    agregado = cubo.groupby(dimension, observed=True)[CUBE_MEASURES].sum().reset_index()
+
+    agregado['Valor'] = agregado['valor']
+    agregado['TMC'] = safe_divide(agregado['tmc_soma'], agregado['tmc_qtd'])
+    agregado['PMP'] = safe_divide(agregado['pmp_soma'], agregado['pmp_qtd'])
+    agregado['PMPP'] = safe_divide(agregado['pmp_valor_soma'], agregado['valor'])
+
+    return agregado
+
+
+# Dimensões disponíveis para o PMPP; Departamento não está no cubo e vem das linhas das SCs
+PMPP_DIMENSIONS = ['Comprador', 'Fornecedor', 'Categoria', 'Departamento', 'Mês']
+
+
+def weighted_term_by_dimension(cubo, scs_df, dimension):
+    """PMPP e participação no spend por dimensão, a partir do cubo quando a dimensão existe nele"""
+    if dimension == 'Mês':
+        cubo = cubo.assign(Mês=cubo['Dia'].dt.strftime('%Y-%m'))
+
+    if dimension in cubo.columns:
+        agregado = aggregate_cube(cubo, dimension)[[dimension, 'Valor', 'PMPP']]
+    else:
+        agregado = pd.DataFrame({
+            'Valor': scs_df.groupby(dimension, observed=True)['Valor'].sum(),
+            'PMPP': weighted_mean(scs_df, dimension, 'PMP', 'Valor')
+        }).reset_index()
+
+    agregado['Participacao'] = share_of_total(agregado['Valor'])
+    return agregado
+
+
+# Rótulo da linha que agrega tudo o que ficou fora de um ranking
+OUTROS_LABEL = 'Outros'
+
+
+def sum_by_dimensions(cubo, dimensions, measure='valor'):
+    """Soma a medida do cubo por várias dimensões a partir de um único agrupamento"""
+    dimensions = [dimension for dimension in dimensions if dimension in cubo.columns]
+    if not dimensions:
+        return {}
+
+    # Uma passada reduz o cubo às combinações das dimensões; cada dimensão sai dessa redução.
+    # Sem ordenar as chaves: top_n_with_outros ordena só o que vai exibir. Chaves ausentes ficam
+    # nas duas passadas para que as somas fechem com o total filtrado
+    reduzido = cubo.groupby(dimensions, observed=True, dropna=False, sort=False)[measure].sum()
+    return {dimension: reduzido.groupby(level=dimension, observed=True, dropna=False, sort=False).sum()
+            for dimension in dimensions}
+
+
+def top_n_with_outros(somas, n, dimension):
+    """
+    Top n de uma série de somas por seleção parcial, com o restante numa linha 'Outros' (a soma sem
+    chave, por exemplo sem fornecedor, não entra no ranking e fica em 'Outros')
+    """
+    valores = somas.to_numpy(dtype=float)
+    candidatos = np.flatnonzero(somas.index.notna())
+
+    # argpartition separa os n maiores sem ordenar o resto; só eles são ordenados
+    if len(candidatos) > n:
+        escolhidos = candidatos[np.argpartition(-valores[candidatos], n - 1)[:n]]
+    else:
+        escolhidos = candidatos
+    escolhidos = escolhidos[np.argsort(-valores[escolhidos], kind='stable')]
+
+    ranking = pd.DataFrame({
+        dimension: somas.index[escolhidos].astype(object),
+        'Valor': valores[escolhidos],
+        'Itens': 1,
+        'Outros': False
+    })
+
+    restantes = np.ones(len(valores), dtype=bool)
+    restantes[escolhidos] = False
+    if restantes.any():
+        outros = pd.DataFrame({
+            dimension: [OUTROS_LABEL],
+            'Valor': [valores[restantes].sum()],
+            'Itens': [int(restantes.sum())],
+            'Outros': [True]
+        })
+        ranking = pd.concat([ranking, outros], ignore_index=True)
+
+    return ranking
+
+
+def describe_outros(ranking, rotulo):
+    """Texto da linha 'Outros' de um ranking, ou None quando o ranking cobre todos os itens"""
+    outros = ranking[ranking['Outros']]
+    if outros.empty:
+        return None
+
+    participacao = safe_divide(outros['Valor'].iloc[0], ranking['Valor'].sum()) * 100
+    return (f"{OUTROS_LABEL}: {outros['Itens'].iloc[0]} {rotulo} somam "
+            f"R$ {outros['Valor'].iloc[0]:,.2f} ({participacao:.1f}% do gasto)")
+
+
+def rank_products_by_category(scs_df, categoria_col, descricao_col, categorias, n=5):
+    """Top n produtos de cada categoria em um único agrupamento (Categoria, Descrição)"""
+    linhas = scs_df[scs_df[categoria_col].isin(categorias)]
+
+    # dropna=False mantém produtos sem descrição no total e na contagem da categoria
+    produtos = linhas.groupby([categoria_col, descricao_col], observed=True, dropna=False)['Valor'].agg(
+        ['sum', 'count']
+    ).reset_index()
+    produtos.columns = [categoria_col, 'Produto', 'Valor Total', 'Quantidade Pedidos']
+
+    total_categoria = produtos.groupby(categoria_col, observed=True)['Valor Total'].transform('sum')
+    produtos['% da Categoria'] = (safe_divide(produtos['Valor Total'], total_categoria) * 100).round(1)
+    produtos_unicos = produtos.groupby(categoria_col, observed=True).size()
+
+    top_produtos = produtos.dropna(subset=['Produto']).sort_values(
+        [categoria_col, 'Valor Total'], ascending=[True, False], kind='stable'
+    ).groupby(categoria_col, observed=True).head(n)
+
+    # Formatação de todas as categorias de uma vez
+    # (map com f-string: uma seleção vazia também devolve a coluna, sem somar texto a float)
+    top_produtos['Valor Formatado'] = top_produtos['Valor Total'].map(lambda valor: f'R$ {valor:,.2f}')
+    top_produtos['% Formatado'] = top_produtos['% da Categoria'].astype(str) + '%'
+
+    return top_produtos, produtos_unicos
+
+
+def compute_buyer_kpis(cubo, saving_df, saving_col=None, comprador_col_saving=None):
+    """Indicadores por comprador (spend, SCs, TMC, PMPS, PMPP, saving e % saving) em uma única agregação"""
+    # Cubo das SCs e linhas de saving empilhados: um único groupby soma todas as medidas
+    partes = [cubo[['Comprador'] + CUBE_MEASURES]]
+
+    if saving_col and comprador_col_saving:
+        partes.append(pd.DataFrame({
+            'Comprador': saving_df[comprador_col_saving],
+            'saving': saving_df[saving_col],
+            'saving_qtd': 1
+        }))
+
+    medidas = pd.concat(partes, ignore_index=True).reindex(
+        columns=['Comprador'] + CUBE_MEASURES + ['saving', 'saving_qtd']
+    )
+    kpis = medidas.groupby('Comprador', observed=True).sum().reset_index()
+
+    kpis['Valor'] = kpis['valor']
+    kpis['Quantidade'] = kpis['qtd']
+    kpis['TMC'] = safe_divide(kpis['tmc_soma'], kpis['tmc_qtd'])
+    kpis['PMP'] = safe_divide(kpis['pmp_soma'], kpis['pmp_qtd'])
+    kpis['PMPP'] = safe_divide(kpis['pmp_valor_soma'], kpis['valor'])
+    kpis['Saving'] = kpis['saving']
+
+    # % saving só para compradores com SCs e saving no período
+    com_compras_e_saving = (kpis['Quantidade'] > 0) & (kpis['saving_qtd'] > 0)
+    kpis['Percentual_Saving'] = (safe_divide(kpis['Saving'], kpis['Valor']) * 100).where(com_compras_e_saving)
+
+    return kpis
+
+
+# Tolerância padrão (R$) da auditoria de valores
+AUDIT_VALUE_TOLERANCE = 0.01
+
+# Como tratar pedidos com várias linhas na aba SC's
+AUDIT_MULTILINE_STRATEGIES = {
+    'primeira': 'Primeira linha do pedido',
+    'soma': 'Soma das linhas do pedido',
+    'sinalizar': 'Sinalizar para revisão'
+}
+
+
+def order_keys(saving_pedidos, scs_pedidos):
+    """Normaliza os números de pedido das duas abas para um tipo comum de chave de junção"""
+    if pd.api.types.is_numeric_dtype(saving_pedidos) and pd.api.types.is_numeric_dtype(scs_pedidos):
+        return saving_pedidos.astype('float64'), scs_pedidos.astype('float64')
+
+    # Tipos diferentes (texto x número): compara pela representação em texto
+    return (saving_pedidos.where(saving_pedidos.isna(), saving_pedidos.astype(str).str.strip()),
+            scs_pedidos.where(scs_pedidos.isna(), scs_pedidos.astype(str).str.strip()))
+
+
+def join_orders(saving_df, scs_df, pedido_col_saving, pedido_col_scs, valor_final_col=None,
+                valor_col_scs=None, data_col_saving=None, data_col_scs=None):
+    """Junta cada linha do Saving ao resumo do pedido nas SCs (primeira linha, soma e quantidade de linhas)"""
+    auditar_valores = bool(valor_final_col and valor_col_scs)
+    auditar_datas = bool(data_col_saving and data_col_scs)
+    chaves_saving, chaves_scs = order_keys(saving_df[pedido_col_saving], scs_df[pedido_col_scs])
+
+    # Lado SC's resumido por pedido: primeira linha, soma e quantidade de linhas
+    scs = pd.DataFrame({'Pedido': chaves_scs})
+    if auditar_valores:
+        scs['valor'] = scs_df[valor_col_scs]
+    if auditar_datas:
+        scs['data'] = scs_df[data_col_scs]
+    scs = scs.dropna(subset=['Pedido'])
+
+    # Primeira linha do pedido = primeira na ordem da planilha, não a de data mais antiga: no banco pela
+    # posição da linha no pedido e pelo id; em memória pelo índice, que guarda a posição na planilha
+    ordem_planilha = [coluna for coluna in ('linha', 'id') if coluna in scs_df.columns]
+    if ordem_planilha:
+        scs = scs.loc[scs_df.loc[scs.index, ordem_planilha].sort_values(ordem_planilha, kind='stable').index]
+    else:
+        scs = scs.sort_index(kind='stable')
+
+    por_pedido = scs.drop_duplicates('Pedido').set_index('Pedido')
+    agrupado = scs.groupby('Pedido', sort=False)
+    por_pedido['Linhas SC'] = agrupado.size()
+    if auditar_valores:
+        por_pedido['soma'] = agrupado['valor'].sum()
+
+    saving = pd.DataFrame({'Pedido': saving_df[pedido_col_saving], 'chave': chaves_saving})
+    if auditar_valores:
+        saving['Valor Final Saving'] = saving_df[valor_final_col]
+    if auditar_datas:
+        saving['data_saving'] = saving_df[data_col_saving]
+
+    return saving.merge(por_pedido, how='left', left_on='chave', right_index=True, sort=False)
+
+
+def classify_orders(conciliacao, tolerancia=AUDIT_VALUE_TOLERANCE, estrategia='primeira'):
+    """Marca as divergências de valor e de data de uma conciliação, com a tolerância e a estratégia escolhidas"""
+    conciliacao = conciliacao.copy()
+    conciliacao['Encontrado'] = conciliacao['Linhas SC'].notna()
+
+    if 'Valor Final Saving' in conciliacao.columns and 'valor' in conciliacao.columns:
+        conciliacao['Valor SC\'s'] = conciliacao['soma' if estrategia == 'soma' else 'valor']
+        diferenca = conciliacao['Valor SC\'s'] - conciliacao['Valor Final Saving']
+        divergente = diferenca.abs() > tolerancia
+
+        conciliacao['Diferença'] = diferenca.where(divergente, 0.0)
+        conciliacao['Status'] = np.where(divergente, 'DIVERGÊNCIA', 'OK')
+        if estrategia == 'sinalizar':
+            conciliacao.loc[conciliacao['Linhas SC'] > 1, 'Status'] = 'MÚLTIPLAS LINHAS'
+
+    if 'data_saving' in conciliacao.columns and 'data' in conciliacao.columns:
+        # A data da SC é sempre a da primeira linha do pedido
+        data_scs = pd.to_datetime(conciliacao['data'], errors='coerce').dt.normalize()
+        data_saving = pd.to_datetime(conciliacao['data_saving'], errors='coerce').dt.normalize()
+        dias = (data_saving - data_scs).dt.days
+        divergente = dias != 0
+
+        conciliacao['Data SC\'s'] = data_scs.dt.strftime('%d/%m/%Y')
+        conciliacao['Data Saving'] = data_saving.dt.strftime('%d/%m/%Y')
+        conciliacao['Diferença (dias)'] = dias.where(divergente, 0).astype('Int64')
+        conciliacao['Status Data'] = np.where(divergente, 'DIVERGÊNCIA', 'OK')
+
+    return conciliacao
+
+
+@st.cache_data(max_entries=16)
+def load_audit_from_database(upload_id, data_inicio, data_fim, trimestres_selecionados=None,
+                             meses_selecionados=None, incluir_fins_semana=True,
+                             comprador_selecionado='Todos'):
+    """Busca no banco a conciliação gravada no upload, só das linhas do Saving que atendem aos filtros"""
+    query, params = build_filter_query(
+        'audit_results', data_inicio, data_fim, trimestres_selecionados, meses_selecionados,
+        incluir_fins_semana, comprador_selecionado
+    )
+
+    with get_connection_manager().read() as conn:
+        conciliacao = pd.read_sql_query(query + ' ORDER BY t.data, t.saving_id', conn, params=params)
+
+    conciliacao['data'] = pd.to_datetime(conciliacao['data'])
+    conciliacao['data_scs'] = pd.to_datetime(conciliacao['data_scs'])
+    return conciliacao.rename(columns={
+        'pedido': 'Pedido', 'valor_final': 'Valor Final Saving', 'data': 'data_saving',
+        'linhas_sc': 'Linhas SC', 'valor_scs': 'valor', 'valor_scs_soma': 'soma', 'data_scs': 'data'
+    })
+
+
+def split_audit(conciliacao, status_col, colunas, colunas_sem_sc):
+    """Separa uma das auditorias da conciliação em conformes, divergentes e pedidos sem SC"""
+    encontrados = conciliacao.loc[conciliacao['Encontrado'], colunas + ['Linhas SC', status_col]]
+    encontrados = encontrados.astype({'Linhas SC': 'int64'}).rename(columns={status_col: 'Status'})
+
+    conformes = encontrados[encontrados['Status'] == 'OK']
+    divergentes = encontrados[encontrados['Status'] != 'OK']
+    sem_correspondencia = conciliacao.loc[~conciliacao['Encontrado'], colunas_sem_sc]
+
+    return conformes, divergentes, sem_correspondencia
 
 
 # Função para exibir informações do último upload
@@ -601,13 +1873,177 @@ st.markdown("""
         text-align: center;
         background: rgba(239, 135, 64, 0.05);
     }
+
+    /* Tooltips de ajuda dos títulos das seções (larguras ajustáveis por seção) */
+    .tooltip-container {
+        position: relative;
+        display: inline-block;
+        margin-left: 8px;
+    }
+
+    .help-icon {
+        display: inline-flex;
+        align-items: center;
+        justify-content: center;
+        width: 18px;
+        height: 18px;
+        background: linear-gradient(135deg, #EF8740, #FF6B35);
+        color: white;
+        border-radius: 50%;
+        font-size: 12px;
+        font-weight: bold;
+        cursor: help;
+        transition: all 0.3s ease;
+        box-shadow: 0 2px 8px rgba(239, 135, 64, 0.3);
+    }
+
+    .help-icon:hover {
+        transform: scale(1.1);
+        box-shadow: 0 4px 15px rgba(239, 135, 64, 0.5);
+    }
+
+    .tooltip-content {
+        position: absolute;
+        bottom: 130%;
+        left: 50%;
+        transform: translateX(-50%);
+        background: linear-gradient(145deg, #2c3e50, #34495e);
+        color: white;
+        padding: 16px 20px;
+        border-radius: 12px;
+        white-space: nowrap;
+        opacity: 0;
+        visibility: hidden;
+        transition: all 0.3s cubic-bezier(0.68, -0.55, 0.265, 1.55);
+        z-index: 1000;
+        min-width: var(--tooltip-min, 380px);
+        max-width: var(--tooltip-max, 450px);
+        white-space: normal;
+        text-align: left;
+        font-size: 13px;
+        line-height: 1.4;
+        box-shadow: 0 10px 30px rgba(0, 0, 0, 0.3);
+        border: 1px solid rgba(255, 255, 255, 0.1);
+    }
+
+    .tooltip-arrow {
+        position: absolute;
+        top: 100%;
+        left: 50%;
+        transform: translateX(-50%);
+        width: 0;
+        height: 0;
+        border-left: 8px solid transparent;
+        border-right: 8px solid transparent;
+        border-top: 8px solid #2c3e50;
+    }
+
+    .tooltip-container:hover .tooltip-content {
+        opacity: 1;
+        visibility: visible;
+        transform: translateX(-50%) translateY(-5px);
+    }
+
+    @media (max-width: 768px) {
+        .tooltip-content {
+            min-width: var(--tooltip-min-mobile, 320px);
+            font-size: 12px;
+            padding: 14px 16px;
+        }
+    }
 </style>
 """, unsafe_allow_html=True)
 
 
+# Função para localizar colunas da planilha
+def find_column(df, possible_names):
+    """Encontra a primeira coluna que existe no DataFrame"""
+    for name in possible_names:
+        if name in df.columns:
+            return name
+    return None
+
+
+def get_column_by_position(df, position):
+    """Retorna o nome da coluna pela posição (0-indexed)"""
+    if position < len(df.columns):
+        return df.columns[position]
+    return None
+
+
+# Identidade visual Mobi dos gráficos, aplicada sobre o template padrão do plotly
+MOBI_COLORS = ['#EF8740', '#000000', '#FFA366', '#333333', '#FFB580']
+
+pio.templates['mobi'] = go.layout.Template(
+    layout=dict(
+        colorway=MOBI_COLORS,
+        piecolorway=MOBI_COLORS,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(size=11, color='#000000'),
+        title=dict(font=dict(size=14, color='#000000'))
+    ),
+    data=dict(
+        bar=[go.Bar(textfont=dict(size=14, color='#000000'), width=0.6)],
+        pie=[go.Pie(textposition='inside', textinfo='percent+label', textfont=dict(size=13, color='white'))]
+    )
+)
+MOBI_TEMPLATE = 'plotly+mobi'
+
+
+def frame_fingerprint(df):
+    """Hash barato de um DataFrame pequeno (valores, índice, colunas e tipos) para chave de cache"""
+    conteudo = pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes()
+    estrutura = repr((list(df.columns), [str(dtype) for dtype in df.dtypes])).encode()
+    return hashlib.md5(conteudo + estrutura).hexdigest()
+
+
+@st.cache_data(max_entries=256)
+def build_chart_json(fingerprint, kind, spec, _dados):
+    """Monta a figura no template Mobi e devolve o JSON pronto, reaproveitado entre execuções e sessões"""
+    if kind == 'pie':
+        fig = px.pie(_dados, values=spec['values'], names=spec['names'], title=spec['title'],
+                     template=MOBI_TEMPLATE)
+    else:
+        fig = px.bar(_dados, x=spec['x'], y=spec['y'], title=spec['title'], text=spec['text'],
+                     hover_data=spec['hover_data'], labels=spec['labels'], template=MOBI_TEMPLATE)
+        # O plotly express fixa textposition='auto' nas barras: o rótulo por fora vai na própria figura
+        fig.update_traces(texttemplate=spec['texttemplate'], textposition='outside')
+        # Sem barras (frame vazio ou só valores ausentes) o topo do eixo é o mínimo pedido
+        maximo = _dados[spec['y']].max()
+        topo = spec['min_top'] if pd.isna(maximo) else max(maximo * spec['headroom'], spec['min_top'])
+        fig.update_layout(yaxis=dict(range=[0, topo]))
+        if spec['tickangle'] is not None:
+            fig.update_layout(xaxis_tickangle=spec['tickangle'])
+
+    fig.update_layout(margin=dict(l=20, r=20, t=spec['margin_top'], b=spec['margin_bottom']), height=spec['height'])
+    return fig.to_json()
+
+
+def bar_chart(dados, x, y, title, text, texttemplate, height=450, margin_top=50, margin_bottom=50,
+              tickangle=None, headroom=1.30, min_top=0, hover_data=None, labels=None):
+    """Gráfico de barras no padrão Mobi; a figura só é montada quando os dados agregados mudam"""
+    dados = dados[list(dict.fromkeys([x, y, text] + list(hover_data or {})))]
+    spec = dict(x=x, y=y, title=title, text=text, texttemplate=texttemplate, height=height,
+                margin_top=margin_top, margin_bottom=margin_bottom, tickangle=tickangle,
+                headroom=headroom, min_top=min_top, hover_data=hover_data, labels=labels)
+    return json.loads(build_chart_json(frame_fingerprint(dados), 'bar', spec, dados))
+
+
+def pie_chart(dados, values, names, title, height=400, margin_top=50, margin_bottom=20):
+    """Gráfico de pizza no padrão Mobi; a figura só é montada quando os dados agregados mudam"""
+    dados = dados[[names, values]]
+    spec = dict(values=values, names=names, title=title, height=height,
+                margin_top=margin_top, margin_bottom=margin_bottom)
+    return json.loads(build_chart_json(frame_fingerprint(dados), 'pie', spec, dados))
+
+
 # Função para criar KPI cards
 def create_kpi_card(value, label, format_type="currency"):
-    if format_type == "currency":
+    if pd.isna(value):
+        # Filtros sem dados: média sem denominador
+        formatted_value = "-"
+    elif format_type == "currency":
         formatted_value = f"R$ {value:,.2f}"
     elif format_type == "percentage":
         formatted_value = f"{value:.1f}%"
@@ -626,7 +2062,9 @@ def create_kpi_card(value, label, format_type="currency"):
 
 # Função para carregar dados
 @st.cache_data
-def load_data(uploaded_file):
+def load_data(file_hash, _uploaded_file):
+    """Lê as duas abas da planilha; o cache é identificado pelo hash do conteúdo"""
+    uploaded_file = _uploaded_file
     if uploaded_file is not None:
         try:
             # Carregar o arquivo Excel enviado pelo usuário
@@ -674,185 +2112,115 @@ def create_sample_data():
         'Comprador': ['CARLOS', 'ANA', 'MATHEUS']
     }
 
-    return pd.DataFrame(scs_data), pd.DataFrame(saving_data)
-
-
-# Função principal
-def main():
-    # Inicializar banco de dados
-    init_database()
-
-    # Container simples com logo e título centralizados
-    st.markdown("""
-    <div style="text-align: center; padding: 1rem 0 2rem 0; margin-bottom: 1rem;">
-    """, unsafe_allow_html=True)
-
-    # Logo centralizada
-    logo_path = r"C:\Users\Pedro Curry\OneDrive\Área de Trabalho\Logos - B.I\Logo Mobi.jpeg"
-
-    if os.path.exists(logo_path):
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            st.image(logo_path, width=300)
-
-    # Título centralizado logo abaixo
-    st.markdown("""
-    <h1 style="font-size: clamp(1.8rem, 4vw, 2.5rem); font-weight: 700; 
-               color: #EF8740; text-align: center; margin: 1.5rem 0 0 0; 
-               text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-               background: linear-gradient(135deg, #EF8740 0%, #000000 100%);
-               -webkit-background-clip: text; -webkit-text-fill-color: transparent;
-               background-clip: text;">
-        🚛 Dashboard Supply Chain - Mobi Transportes
-    </h1>
-    """, unsafe_allow_html=True)
-
-    st.markdown("</div>", unsafe_allow_html=True)
-
-    # Upload do arquivo
-    st.markdown("### 📁 Upload do Arquivo de Dados")
-    uploaded_file = st.file_uploader(
-        "Faça upload do arquivo 'KPIs- Compras (Base de Dados).xlsx'",
-        type=['xlsx', 'xls'],
-        help="Arquivo deve conter as abas 'SC's' e 'Saving'"
-    )
-
-    # Carregar dados
-    scs_df = None
-    saving_df = None
-    upload_info = None
-
-    if uploaded_file is not None:
-        # Processar novo upload
-        scs_df, saving_df = load_data(uploaded_file)
-        # Adicione este código logo após o título principal, antes dos filtros da sidebar
-
-        if upload_info is not None and not upload_info.empty:
-            last_update = pd.to_datetime(upload_info.iloc[0]['last_update'])
-            formatted_date = last_update.strftime("%d/%m/%Y às %H:%M")
-
-            st.markdown(f"""
-           <div style="background: linear-gradient(135deg, #EF8740 0%, #000000 90%); 
-                       color: white; padding: 1rem; border-radius: 8px; margin: 1rem 0;
-                       text-align: center; box-shadow: 0 2px 10px rgba(239, 135, 64, 0.3);">
-               <h4 style="margin: 0; font-weight: 600;">📅 Última Atualização: {formatted_date}</h4>
-           </div>
-           """, unsafe_allow_html=True)
-
-        if scs_df is not None and saving_df is not None:
-            # Salvar no banco de dados
-            success, result = save_to_database(scs_df, saving_df, uploaded_file.name)
-
-            if success:
-                st.success("✅ Arquivo carregado e salvo no banco de dados com sucesso!")
-                st.markdown("---")
-
-                # Limpar cache para forçar reload dos dados
-                load_from_database.clear()
-
-                # Carregar dados atualizados do banco
-                scs_df, saving_df, upload_info = load_from_database()
-
-                # Mostrar informações da atualização
-                display_last_update_info(upload_info)
-
-            else:
-                st.error(f"❌ Erro ao salvar no banco de dados: {result}")
-                st.markdown("### 🔍 Usando dados do upload atual")
-        else:
-            st.error("❌ Erro ao carregar o arquivo. Verifique se ele contém as abas 'SC's' e 'Saving'.")
-    else:
-        # Tentar carregar dados existentes do banco
-        scs_df, saving_df, upload_info = load_from_database()
-
-        if scs_df is not None and saving_df is not None:
-            st.info("📤 Dados carregados do banco de dados local. Faça upload de um novo arquivo para atualizar.")
-            # Mostrar informações da última atualização
-            display_last_update_info(upload_info)
-            st.markdown("---")
-        else:
-            st.info("📤 Por favor, faça upload do arquivo Excel para começar a análise.")
-            st.markdown("---")
-            st.markdown("### 🔍 Preview com Dados de Exemplo")
-            st.info("Enquanto isso, você pode ver como o dashboard funciona com dados de exemplo:")
-
-            # Usar dados de exemplo
-            scs_df, saving_df = create_sample_data()
-            st.warning("⚠️ Os dados mostrados abaixo são apenas exemplos para demonstração.")
+    scs_df, saving_df = apply_categorical_schema(pd.DataFrame(scs_data), pd.DataFrame(saving_data))
+    return sort_by_date(scs_df), sort_by_date(saving_df)
 
-    scs_filtered = pd.DataFrame()
 
-    # Sidebar com filtros baseados na tabela calendário
-    if scs_df is not None and not scs_df.empty:
-        st.sidebar.markdown("## 🔧 Filtros")
-
-        # Filtro por comprador
-        compradores = ['Todos'] + list(scs_df['Comprador'].unique())
-        comprador_selecionado = st.sidebar.selectbox("Comprador:", compradores)
-
-        # Carregar dimensão de datas para filtros
-        dim_datas = load_date_dimension()
-
-        if dim_datas is not None and not dim_datas.empty:
-            # Usar min/max da dimensão de datas
-            data_min = dim_datas['data_key'].min().date()
-            data_max = dim_datas['data_key'].max().date()
-
-            # Filtros de período usando dimensão
-            st.sidebar.markdown("### 📅 Período")
-            data_inicio = st.sidebar.date_input("Data Início:", data_min, min_value=data_min, max_value=data_max)
-            data_fim = st.sidebar.date_input("Data Fim:", data_max, min_value=data_min, max_value=data_max)
-
-            # Filtros adicionais da dimensão
-            st.sidebar.markdown("### 📊 Filtros Temporais")
-
-            # Filtro por trimestre
-            trimestres_disponiveis = sorted(dim_datas['trimestre'].unique())
-            trimestres_selecionados = st.sidebar.multiselect(
-                "Trimestres:",
-                trimestres_disponiveis,
-                default=trimestres_disponiveis,
-                format_func=lambda x: f"Q{x}"
-            )
-
-            # Filtro por mês
-            meses_disponiveis = sorted(dim_datas['mes'].unique())
-            meses_selecionados = st.sidebar.multiselect(
-                "Meses:",
-                meses_disponiveis,
-                default=meses_disponiveis,
-                format_func=lambda x: ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun',
-                                       'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez'][x - 1]
-            )
-
-            # Filtro por dia da semana
-            incluir_fins_semana = st.sidebar.checkbox("Incluir fins de semana", value=True)
-
-        else:
-            # Fallback para método original se dimensão não estiver disponível
-            st.sidebar.warning("⚠️ Dimensão de datas não disponível. Usando filtros básicos.")
-            data_inicio = st.sidebar.date_input("Data Início:", min(scs_df['Data']))
-            data_fim = st.sidebar.date_input("Data Fim:", max(scs_df['Data']))
-            trimestres_selecionados = None
-            meses_selecionados = None
-            incluir_fins_semana = True
-
-        # Aplicar filtros usando a tabela calendário
-        scs_filtered, saving_filtered = apply_calendar_filters(
-            scs_df, saving_df, data_inicio, data_fim,
-            trimestres_selecionados, meses_selecionados, incluir_fins_semana
-        )
+class DashboardContext:
+    """
+    Filtros de uma execução sobre as abas compartilhadas do processo: a sessão guarda só as linhas
+    selecionadas, e os recortes e agregados só são montados quando uma seção os usa
+    """
 
-        # Aplicar filtro por comprador APÓS os filtros de data
-        if comprador_selecionado != 'Todos':
-            scs_filtered = scs_filtered[scs_filtered['Comprador'] == comprador_selecionado]
-            # Também filtrar saving por comprador se necessário
-            if 'Comprador' in saving_filtered.columns:
-                saving_filtered = saving_filtered[saving_filtered['Comprador'] == comprador_selecionado]
+    def __init__(self, scs_df, saving_df, selecoes, upload_info, filtros, versao_dados):
+        self.scs_df = scs_df
+        self.saving_df = saving_df
+        self.selecoes = selecoes
+        self.upload_info = upload_info
+        self.filtros = filtros
+        self.versao_dados = versao_dados
+        self._recortes = {}
+
+    def _recorte(self, posicao, df):
+        """Linhas selecionadas de uma aba, recortadas na primeira vez que são pedidas"""
+        if posicao not in self._recortes:
+            self._recortes[posicao] = df.iloc[self.selecoes[posicao]]
+        return self._recortes[posicao]
+
+    @property
+    def scs_filtered(self):
+        """SCs que atendem aos filtros"""
+        return self._recorte(0, self.scs_df)
+
+    @property
+    def saving_filtered(self):
+        """Savings que atendem aos filtros"""
+        return self._recorte(1, self.saving_df)
+
+    @property
+    def from_database(self):
+        """Se os dados vêm do banco (e não de exemplo ou de um upload não salvo)"""
+        return self.upload_info is not None and not self.upload_info.empty
+
+    def assinatura(self, campos=FILTER_FIELDS):
+        """Versão dos dados e valores dos filtros de que um resultado depende"""
+        valores = (self.filtros[campo] for campo in campos)
+        return (self.versao_dados,) + tuple(tuple(valor) if isinstance(valor, list) else valor
+                                            for valor in valores)
+
+    def memo(self, nome, calcular, campos=FILTER_FIELDS, extras=()):
+        """Resultado memorizado pela versão dos dados, pelos filtros declarados e pelos controles da seção"""
+        if self.versao_dados is None:
+            return calcular()
+
+        cache = get_section_cache()
+        chave = (nome, self.assinatura(campos), tuple(extras))
+        resultado = cache.get(chave)
+        if resultado is None:
+            resultado = calcular()
+            cache.put(chave, resultado, payload_size(resultado))
+        return resultado
+
+    @property
+    def cubo(self):
+        """Cubo das SCs filtradas: do banco, pré-calculado no upload, ou montado em memória"""
+        if self.from_database:
+            return self.memo('cubo', lambda: load_cube_from_database(int(self.upload_info.iloc[0]['id']),
+                                                                     **self.filtros))
+        return self.memo('cubo', lambda: build_purchase_cube(self.scs_filtered))
+
+    @property
+    def kpis_comprador(self):
+        """Indicadores por comprador usados nas seções de gastos, prazos e savings"""
+        return self.memo('kpis_comprador', lambda: compute_buyer_kpis(
+            self.cubo, self.saving_filtered,
+            find_column(self.saving_filtered, ['Redução R$', 'Reducao R$', 'Saving', 'Economia', 'Redução']),
+            find_column(self.saving_filtered, ['Comprador', 'Buyer', 'Responsável'])
+        ))
+
+    @property
+    def compras_comprador(self):
+        """Compradores com SCs no período"""
+        kpis = self.kpis_comprador
+        return kpis[kpis['Quantidade'] > 0]
+
+    @property
+    def gastos_por_dimensao(self):
+        """Gasto por fornecedor e por categoria para os rankings, num único agrupamento do cubo"""
+        return self.memo('gastos_por_dimensao', lambda: sum_by_dimensions(self.cubo, ['Fornecedor', 'Categoria']))
+
+
+def spend_section_data(ctx):
+    """Gráfico e KPI da seção de gastos"""
+    # Gráfico Spend por comprador
+    spend_por_comprador = ctx.compras_comprador[['Comprador', 'Valor']]
+    return {
+        'grafico': bar_chart(
+            spend_por_comprador,
+            x='Comprador',
+            y='Valor',
+            title="💳 Spend Total por Comprador",
+            text='Valor',
+            texttemplate='<b>R$ %{text:,.0f}</b>'
+        ),
+        'spend_total': ctx.cubo['valor'].sum()
+    }
 
-    else:
-        scs_filtered = pd.DataFrame()
 
+@st.fragment
+def render_spend_section(ctx):
+    """Seção de gastos por comprador"""
+    dados = ctx.memo('secao_gastos', lambda: spend_section_data(ctx))
 
     # === SEÇÃO 1: SPENDING ANALYSIS ===
     st.markdown('''
@@ -870,125 +2238,42 @@ def main():
             </div>
         </span>
     </div>
-
-    <style>
-        .tooltip-container {
-            position: relative;
-            display: inline-block;
-            margin-left: 8px;
-        }
-
-        .help-icon {
-            display: inline-flex;
-            align-items: center;
-            justify-content: center;
-            width: 18px;
-            height: 18px;
-            background: linear-gradient(135deg, #EF8740, #FF6B35);
-            color: white;
-            border-radius: 50%;
-            font-size: 12px;
-            font-weight: bold;
-            cursor: help;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 8px rgba(239, 135, 64, 0.3);
-        }
-
-        .help-icon:hover {
-            transform: scale(1.1);
-            box-shadow: 0 4px 15px rgba(239, 135, 64, 0.5);
-        }
-
-        .tooltip-content {
-            position: absolute;
-            bottom: 130%;
-            left: 50%;
-            transform: translateX(-50%);
-            background: linear-gradient(145deg, #2c3e50, #34495e);
-            color: white;
-            padding: 16px 20px;
-            border-radius: 12px;
-            white-space: nowrap;
-            opacity: 0;
-            visibility: hidden;
-            transition: all 0.3s cubic-bezier(0.68, -0.55, 0.265, 1.55);
-            z-index: 1000;
-            min-width: 380px;
-            max-width: 450px;
-            white-space: normal;
-            text-align: left;
-            font-size: 13px;
-            line-height: 1.4;
-            box-shadow: 0 10px 30px rgba(0, 0, 0, 0.3);
-            border: 1px solid rgba(255, 255, 255, 0.1);
-        }
-
-        .tooltip-arrow {
-            position: absolute;
-            top: 100%;
-            left: 50%;
-            transform: translateX(-50%);
-            width: 0;
-            height: 0;
-            border-left: 8px solid transparent;
-            border-right: 8px solid transparent;
-            border-top: 8px solid #2c3e50;
-        }
-
-        .tooltip-container:hover .tooltip-content {
-            opacity: 1;
-            visibility: visible;
-            transform: translateX(-50%) translateY(-5px);
-        }
-
-        @media (max-width: 768px) {
-            .tooltip-content {
-                min-width: 320px;
-                font-size: 12px;
-                padding: 14px 16px;
-            }
-        }
-    </style>
     ''', unsafe_allow_html=True)
 
     # Layout responsivo
     col1, col2 = st.columns([3, 1])  # Proporção ajustada
 
     with col1:
-        # Gráfico Spend por comprador
-        spend_por_comprador = scs_filtered.groupby('Comprador')['Valor'].sum().reset_index()
-        fig_spend = px.bar(
-            spend_por_comprador,
-            x='Comprador',
-            y='Valor',
-            title="💳 Spend Total por Comprador",
-            text='Valor'
-        )
-        # Aplicar cores da Mobi Transportes
-        fig_spend.update_traces(
-            marker_color='#EF8740',
-            texttemplate='<b>R$ %{text:,.0f}</b>',
-            textposition='outside',
-            textfont_size=14,
-            textfont_color='#000000',
-            width=0.6  # Barras mais estreitas
-        )
-        fig_spend.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(size=11, color='#000000'),
-            title_font_size=14,
-            title_font_color='#000000',
-            margin=dict(l=20, r=20, t=50, b=50),  # Margem superior aumentada
-            height=450,  # Altura aumentada para acomodar rótulos
-            yaxis=dict(range=[0, spend_por_comprador['Valor'].max() * 1.30])  # 15% acima do valor máximo
-        )
-        st.plotly_chart(fig_spend, use_container_width=True)
+        st.plotly_chart(dados['grafico'], use_container_width=True)
 
     with col2:
         # KPI Spend Total
-        spend_total = scs_filtered['Valor'].sum()
-        st.markdown(create_kpi_card(spend_total, "Spend Total"), unsafe_allow_html=True)
+        st.markdown(create_kpi_card(dados['spend_total'], "Spend Total"), unsafe_allow_html=True)
+
+
+def tmc_section_data(ctx):
+    """Gráfico e KPI da seção de TMC"""
+    cubo = ctx.cubo
+
+    # Gráfico TMC por comprador
+    tmc_por_comprador = ctx.compras_comprador[['Comprador', 'TMC']]
+    return {
+        'grafico': bar_chart(
+            tmc_por_comprador,
+            x='Comprador',
+            y='TMC',
+            title="📅 Tempo Médio de Compras por Comprador",
+            text='TMC',
+            texttemplate='<b>%{text:.1f} dias</b>'
+        ),
+        'tmc_geral': safe_divide(cubo['tmc_soma'].sum(), cubo['tmc_qtd'].sum())
+    }
+
+
+@st.fragment
+def render_tmc_section(ctx):
+    """Seção de tempo médio de compras (TMC)"""
+    dados = ctx.memo('secao_tmc', lambda: tmc_section_data(ctx))
 
     # === SEÇÃO 2: TEMPO MÉDIO DE COMPRAS ===
     st.markdown('''
@@ -996,7 +2281,7 @@ def main():
         ⏱️ Análise de Tempo (TMC) 
         <span class="tooltip-container">
             <span class="help-icon">?</span>
-            <div class="tooltip-content">
+            <div class="tooltip-content" style="--tooltip-min: 320px; --tooltip-max: 400px; --tooltip-min-mobile: 280px;">
                 <div class="tooltip-arrow"></div>
                 <strong>TMC - Tempo Médio de Compras</strong><br><br>
                 Métrica que indica quantos dias em média cada comprador leva para processar e finalizar uma compra, desde a solicitação até a conclusão do pedido.<br><br>
@@ -1004,123 +2289,41 @@ def main():
             </div>
         </span>
     </div>
-
-    <style>
-        .tooltip-container {
-            position: relative;
-            display: inline-block;
-            margin-left: 8px;
-        }
-
-        .help-icon {
-            display: inline-flex;
-            align-items: center;
-            justify-content: center;
-            width: 18px;
-            height: 18px;
-            background: linear-gradient(135deg, #EF8740, #FF6B35);
-            color: white;
-            border-radius: 50%;
-            font-size: 12px;
-            font-weight: bold;
-            cursor: help;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 8px rgba(239, 135, 64, 0.3);
-        }
-
-        .help-icon:hover {
-            transform: scale(1.1);
-            box-shadow: 0 4px 15px rgba(239, 135, 64, 0.5);
-        }
-
-        .tooltip-content {
-            position: absolute;
-            bottom: 130%;
-            left: 50%;
-            transform: translateX(-50%);
-            background: linear-gradient(145deg, #2c3e50, #34495e);
-            color: white;
-            padding: 16px 20px;
-            border-radius: 12px;
-            white-space: nowrap;
-            opacity: 0;
-            visibility: hidden;
-            transition: all 0.3s cubic-bezier(0.68, -0.55, 0.265, 1.55);
-            z-index: 1000;
-            min-width: 320px;
-            max-width: 400px;
-            white-space: normal;
-            text-align: left;
-            font-size: 13px;
-            line-height: 1.4;
-            box-shadow: 0 10px 30px rgba(0, 0, 0, 0.3);
-            border: 1px solid rgba(255, 255, 255, 0.1);
-        }
-
-        .tooltip-arrow {
-            position: absolute;
-            top: 100%;
-            left: 50%;
-            transform: translateX(-50%);
-            width: 0;
-            height: 0;
-            border-left: 8px solid transparent;
-            border-right: 8px solid transparent;
-            border-top: 8px solid #2c3e50;
-        }
-
-        .tooltip-container:hover .tooltip-content {
-            opacity: 1;
-            visibility: visible;
-            transform: translateX(-50%) translateY(-5px);
-        }
-
-        @media (max-width: 768px) {
-            .tooltip-content {
-                min-width: 280px;
-                font-size: 12px;
-                padding: 14px 16px;
-            }
-        }
-    </style>
     ''', unsafe_allow_html=True)
 
     col1, col2 = st.columns([3, 1])
 
     with col1:
-        # Gráfico TMC por comprador
-        tmc_por_comprador = scs_filtered.groupby('Comprador')['TMC'].mean().reset_index()
-        fig_tmc = px.bar(
-            tmc_por_comprador,
-            x='Comprador',
-            y='TMC',
-            title="📅 Tempo Médio de Compras por Comprador",
-            text='TMC'
-        )
-        fig_tmc.update_traces(
-            marker_color='#EF8740',
-            texttemplate='<b>%{text:.1f} dias</b>',
-            textposition='outside',
-            textfont_size=14,
-            textfont_color='#000000',
-            width=0.6
-        )
-        fig_tmc.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(size=11, color='#000000'),
-            title_font_size=14,
-            title_font_color='#000000',
-            margin=dict(l=20, r=20, t=50, b=50),
-            height=450,
-            yaxis=dict(range=[0, tmc_por_comprador['TMC'].max() * 1.30])
-        )
-        st.plotly_chart(fig_tmc, use_container_width=True)
+        st.plotly_chart(dados['grafico'], use_container_width=True)
 
     with col2:
         # KPI TMC Geral
-        tmc_geral = scs_filtered['TMC'].mean()
-        st.markdown(create_kpi_card(tmc_geral, "TMC Médio Geral", "days"), unsafe_allow_html=True)
+        st.markdown(create_kpi_card(dados['tmc_geral'], "TMC Médio Geral", "days"), unsafe_allow_html=True)
+
+
+def pmps_section_data(ctx):
+    """Gráfico e KPI da seção de PMPS"""
+    cubo = ctx.cubo
+
+    # Gráfico PMPS por comprador
+    pmps_por_comprador = ctx.compras_comprador[['Comprador', 'PMP']]
+    return {
+        'grafico': bar_chart(
+            pmps_por_comprador,
+            x='Comprador',
+            y='PMP',
+            title="📋 PMPS por Comprador",
+            text='PMP',
+            texttemplate='<b>%{text:.1f} dias</b>'
+        ),
+        'pmps_geral': safe_divide(cubo['pmp_soma'].sum(), cubo['pmp_qtd'].sum())
+    }
+
+
+@st.fragment
+def render_pmps_section(ctx):
+    """Seção de prazo médio de pagamento simples (PMPS)"""
+    dados = ctx.memo('secao_pmps', lambda: pmps_section_data(ctx))
 
     # === SEÇÃO 3: PMPS (Prazo Médio de Pagamento Simples) ===
     st.markdown('''
@@ -1137,124 +2340,53 @@ def main():
             </div>
         </span>
     </div>
-
-    <style>
-        .tooltip-container {
-            position: relative;
-            display: inline-block;
-            margin-left: 8px;
-        }
-
-        .help-icon {
-            display: inline-flex;
-            align-items: center;
-            justify-content: center;
-            width: 18px;
-            height: 18px;
-            background: linear-gradient(135deg, #EF8740, #FF6B35);
-            color: white;
-            border-radius: 50%;
-            font-size: 12px;
-            font-weight: bold;
-            cursor: help;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 8px rgba(239, 135, 64, 0.3);
-        }
-
-        .help-icon:hover {
-            transform: scale(1.1);
-            box-shadow: 0 4px 15px rgba(239, 135, 64, 0.5);
-        }
-
-        .tooltip-content {
-            position: absolute;
-            bottom: 130%;
-            left: 50%;
-            transform: translateX(-50%);
-            background: linear-gradient(145deg, #2c3e50, #34495e);
-            color: white;
-            padding: 16px 20px;
-            border-radius: 12px;
-            white-space: nowrap;
-            opacity: 0;
-            visibility: hidden;
-            transition: all 0.3s cubic-bezier(0.68, -0.55, 0.265, 1.55);
-            z-index: 1000;
-            min-width: 380px;
-            max-width: 450px;
-            white-space: normal;
-            text-align: left;
-            font-size: 13px;
-            line-height: 1.4;
-            box-shadow: 0 10px 30px rgba(0, 0, 0, 0.3);
-            border: 1px solid rgba(255, 255, 255, 0.1);
-        }
-
-        .tooltip-arrow {
-            position: absolute;
-            top: 100%;
-            left: 50%;
-            transform: translateX(-50%);
-            width: 0;
-            height: 0;
-            border-left: 8px solid transparent;
-            border-right: 8px solid transparent;
-            border-top: 8px solid #2c3e50;
-        }
-
-        .tooltip-container:hover .tooltip-content {
-            opacity: 1;
-            visibility: visible;
-            transform: translateX(-50%) translateY(-5px);
-        }
-
-        @media (max-width: 768px) {
-            .tooltip-content {
-                min-width: 320px;
-                font-size: 12px;
-                padding: 14px 16px;
-            }
-        }
-    </style>
     ''', unsafe_allow_html=True)
 
     col1, col2 = st.columns([3, 1])
 
     with col1:
-        # Gráfico PMPS por comprador
-        pmps_por_comprador = scs_filtered.groupby('Comprador')['PMP'].mean().reset_index()
-        fig_pmps = px.bar(
-            pmps_por_comprador,
-            x='Comprador',
-            y='PMP',
-            title="📋 PMPS por Comprador",
-            text='PMP'
-        )
-        fig_pmps.update_traces(
-            marker_color='#EF8740',
-            texttemplate='<b>%{text:.1f} dias</b>',
-            textposition='outside',
-            textfont_size=14,
-            textfont_color='#000000',
-            width=0.6
-        )
-        fig_pmps.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(size=11, color='#000000'),
-            title_font_size=14,
-            title_font_color='#000000',
-            margin=dict(l=20, r=20, t=50, b=50),
-            height=450,
-            yaxis=dict(range=[0, pmps_por_comprador['PMP'].max() * 1.30])
-        )
-        st.plotly_chart(fig_pmps, use_container_width=True)
+        st.plotly_chart(dados['grafico'], use_container_width=True)
 
     with col2:
         # KPI PMPS Geral
-        pmps_geral = scs_filtered['PMP'].mean()
-        st.markdown(create_kpi_card(pmps_geral, "PMPS Médio Geral", "days"), unsafe_allow_html=True)
+        st.markdown(create_kpi_card(dados['pmps_geral'], "PMPS Médio Geral", "days"), unsafe_allow_html=True)
+
+
+def pmpp_chart_data(ctx, dimensao_pmpp):
+    """Gráfico do PMPP pela dimensão escolhida"""
+    # Calcular PMPP pela dimensão escolhida
+    pmpp_por_dimensao = weighted_term_by_dimension(ctx.cubo, ctx.scs_filtered, dimensao_pmpp).dropna(subset=['PMPP'])
+    if dimensao_pmpp == 'Mês':
+        pmpp_por_dimensao = pmpp_por_dimensao.sort_values('Mês')
+    elif dimensao_pmpp in ('Fornecedor', 'Categoria'):
+        # Muitos valores possíveis: mostra os 15 de maior spend
+        pmpp_por_dimensao = pmpp_por_dimensao.nlargest(15, 'Valor')
+
+    return bar_chart(
+        pmpp_por_dimensao,
+        x=dimensao_pmpp,
+        y='PMPP',
+        title=f"⚖️ PMPP por {dimensao_pmpp}",
+        text='PMPP',
+        hover_data={'Participacao': ':.1%'},
+        labels={'Participacao': '% do Spend'},
+        texttemplate='<b>%{text:.1f} dias</b>'
+    )
+
+
+def pmpp_kpi_data(ctx):
+    """KPIs de PMPP geral e prazo mediano ponderado"""
+    cubo = ctx.cubo
+    return {
+        'pmpp_geral': safe_divide(cubo['pmp_valor_soma'].sum(), cubo['valor'].sum()),
+        # Prazo mediano ponderado pelo valor: metade do spend tem prazo até este valor
+        'pmpp_mediano': weighted_percentile(ctx.scs_filtered, None, 'PMP', 'Valor', 0.5)
+    }
+
 
+@st.fragment
+def render_pmpp_section(ctx):
+    """Seção de prazo médio de pagamento ponderado (PMPP)"""
     # === SEÇÃO 4: PMPP (Prazo Médio de Pagamento Ponderado) ===
     st.markdown('''
     <div class="section-header">
@@ -1270,127 +2402,62 @@ def main():
             </div>
         </span>
     </div>
+    ''', unsafe_allow_html=True)
 
-    <style>
-        .tooltip-container {
-            position: relative;
-            display: inline-block;
-            margin-left: 8px;
-        }
+    col1, col2 = st.columns([3, 1])
 
-        .help-icon {
-            display: inline-flex;
-            align-items: center;
-            justify-content: center;
-            width: 18px;
-            height: 18px;
-            background: linear-gradient(135deg, #EF8740, #FF6B35);
-            color: white;
-            border-radius: 50%;
-            font-size: 12px;
-            font-weight: bold;
-            cursor: help;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 8px rgba(239, 135, 64, 0.3);
-        }
+    with col1:
+        # As dimensões disponíveis só dependem das colunas dos dados, não dos filtros
+        dimensoes_pmpp = ctx.memo('pmpp_dimensoes', lambda: [
+            dimensao for dimensao in PMPP_DIMENSIONS
+            if dimensao in ctx.cubo.columns or dimensao in ctx.scs_filtered.columns or dimensao == 'Mês'
+        ], campos=())
+        dimensao_pmpp = st.selectbox("Agrupar PMPP por", dimensoes_pmpp, key='pmpp_dimensao')
+
+        fig_pmpp = ctx.memo('secao_pmpp_grafico', lambda: pmpp_chart_data(ctx, dimensao_pmpp),
+                            extras=(dimensao_pmpp,))
+        st.plotly_chart(fig_pmpp, use_container_width=True)
 
-        .help-icon:hover {
-            transform: scale(1.1);
-            box-shadow: 0 4px 15px rgba(239, 135, 64, 0.5);
-        }
+    with col2:
+        kpis = ctx.memo('secao_pmpp_kpis', lambda: pmpp_kpi_data(ctx))
 
-        .tooltip-content {
-            position: absolute;
-            bottom: 130%;
-            left: 50%;
-            transform: translateX(-50%);
-            background: linear-gradient(145deg, #2c3e50, #34495e);
-            color: white;
-            padding: 16px 20px;
-            border-radius: 12px;
-            white-space: nowrap;
-            opacity: 0;
-            visibility: hidden;
-            transition: all 0.3s cubic-bezier(0.68, -0.55, 0.265, 1.55);
-            z-index: 1000;
-            min-width: 380px;
-            max-width: 450px;
-            white-space: normal;
-            text-align: left;
-            font-size: 13px;
-            line-height: 1.4;
-            box-shadow: 0 10px 30px rgba(0, 0, 0, 0.3);
-            border: 1px solid rgba(255, 255, 255, 0.1);
-        }
+        # KPI PMPP Geral
+        st.markdown(create_kpi_card(kpis['pmpp_geral'], "PMPP Médio Geral", "days"), unsafe_allow_html=True)
 
-        .tooltip-arrow {
-            position: absolute;
-            top: 100%;
-            left: 50%;
-            transform: translateX(-50%);
-            width: 0;
-            height: 0;
-            border-left: 8px solid transparent;
-            border-right: 8px solid transparent;
-            border-top: 8px solid #2c3e50;
-        }
+        # Prazo mediano ponderado
+        st.markdown(create_kpi_card(kpis['pmpp_mediano'], "Prazo Mediano Ponderado", "days"),
+                    unsafe_allow_html=True)
 
-        .tooltip-container:hover .tooltip-content {
-            opacity: 1;
-            visibility: visible;
-            transform: translateX(-50%) translateY(-5px);
-        }
 
-        @media (max-width: 768px) {
-            .tooltip-content {
-                min-width: 320px;
-                font-size: 12px;
-                padding: 14px 16px;
-            }
-        }
-    </style>
-    ''', unsafe_allow_html=True)
+def top_spend_section_data(ctx, dimensao, rotulo, titulo):
+    """Gráfico dos 5 maiores gastos de uma dimensão e o resumo da linha 'Outros' (None sem a coluna)"""
+    if dimensao not in ctx.cubo.columns:
+        return {'grafico': None, 'resumo_outros': None}
 
-    col1, col2 = st.columns([3, 1])
+    # Top 5; os demais ficam na linha 'Outros'
+    ranking = top_n_with_outros(ctx.gastos_por_dimensao[dimensao], 5, dimensao)
+    gastos = ranking[~ranking['Outros']]
 
-    with col1:
-        # Calcular PMPP por comprador
-        pmpp_por_comprador = scs_filtered.groupby('Comprador').apply(
-            lambda x: (x['PMP'] * x['Valor']).sum() / x['Valor'].sum()
-        ).reset_index()
-        pmpp_por_comprador.columns = ['Comprador', 'PMPP']
-
-        fig_pmpp = px.bar(
-            pmpp_por_comprador,
-            x='Comprador',
-            y='PMPP',
-            title="⚖️ PMPP por Comprador",
-            text='PMPP'
-        )
-        fig_pmpp.update_traces(
-            marker_color='#EF8740',
-            texttemplate='<b>%{text:.1f} dias</b>',
-            textposition='outside',
-            textfont_size=14,
-            textfont_color='#000000',
-            width=0.6
-        )
-        fig_pmpp.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(size=11, color='#000000'),
-            title_font_size=14,
-            title_font_color='#000000',
-            margin=dict(l=20, r=20, t=50, b=50),
-            height=450,
-            yaxis=dict(range=[0, pmpp_por_comprador['PMPP'].max() * 1.30])
-        )
-        st.plotly_chart(fig_pmpp, use_container_width=True)
+    return {
+        'grafico': bar_chart(
+            gastos,
+            x=dimensao,
+            y='Valor',
+            title=titulo,
+            text='Valor',
+            texttemplate='<b>R$ %{text:,.0f}</b>',
+            tickangle=-45
+        ),
+        'resumo_outros': describe_outros(ranking, rotulo)
+    }
 
-    with col2:
-        # KPI PMPP Geral
-        pmpp_geral = (scs_filtered['PMP'] * scs_filtered['Valor']).sum() / scs_filtered['Valor'].sum()
-        st.markdown(create_kpi_card(pmpp_geral, "PMPP Médio Geral", "days"), unsafe_allow_html=True)
+
+@st.fragment
+def render_suppliers_section(ctx):
+    """Seção dos 5 fornecedores de maior gasto"""
+    dados = ctx.memo('secao_fornecedores', lambda: top_spend_section_data(
+        ctx, 'Fornecedor', 'fornecedores', "🏆 Top 5 Fornecedores por Gasto Total"
+    ))
 
     # === SEÇÃO 5: ANÁLISE DE FORNECEDORES ===
     st.markdown('''
@@ -1398,7 +2465,7 @@ def main():
         🏢 Top 5 Gastos por Fornecedor
         <span class="tooltip-container">
             <span class="help-icon">?</span>
-            <div class="tooltip-content">
+            <div class="tooltip-content" style="--tooltip-min: 400px; --tooltip-max: 480px; --tooltip-min-mobile: 340px;">
                 <div class="tooltip-arrow"></div>
                 <strong>Top 5 Gastos por Fornecedor</strong><br><br>
                 Identifica os 5 fornecedores que mais receberam recursos financeiros no período, permitindo análise de concentração de gastos e dependência de fornecedores.<br><br>
@@ -1408,130 +2475,33 @@ def main():
             </div>
         </span>
     </div>
-
-    <style>
-        .tooltip-container {
-            position: relative;
-            display: inline-block;
-            margin-left: 8px;
-        }
-
-        .help-icon {
-            display: inline-flex;
-            align-items: center;
-            justify-content: center;
-            width: 18px;
-            height: 18px;
-            background: linear-gradient(135deg, #EF8740, #FF6B35);
-            color: white;
-            border-radius: 50%;
-            font-size: 12px;
-            font-weight: bold;
-            cursor: help;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 8px rgba(239, 135, 64, 0.3);
-        }
-
-        .help-icon:hover {
-            transform: scale(1.1);
-            box-shadow: 0 4px 15px rgba(239, 135, 64, 0.5);
-        }
-
-        .tooltip-content {
-            position: absolute;
-            bottom: 130%;
-            left: 50%;
-            transform: translateX(-50%);
-            background: linear-gradient(145deg, #2c3e50, #34495e);
-            color: white;
-            padding: 16px 20px;
-            border-radius: 12px;
-            white-space: nowrap;
-            opacity: 0;
-            visibility: hidden;
-            transition: all 0.3s cubic-bezier(0.68, -0.55, 0.265, 1.55);
-            z-index: 1000;
-            min-width: 400px;
-            max-width: 480px;
-            white-space: normal;
-            text-align: left;
-            font-size: 13px;
-            line-height: 1.4;
-            box-shadow: 0 10px 30px rgba(0, 0, 0, 0.3);
-            border: 1px solid rgba(255, 255, 255, 0.1);
-        }
-
-        .tooltip-arrow {
-            position: absolute;
-            top: 100%;
-            left: 50%;
-            transform: translateX(-50%);
-            width: 0;
-            height: 0;
-            border-left: 8px solid transparent;
-            border-right: 8px solid transparent;
-            border-top: 8px solid #2c3e50;
-        }
-
-        .tooltip-container:hover .tooltip-content {
-            opacity: 1;
-            visibility: visible;
-            transform: translateX(-50%) translateY(-5px);
-        }
-
-        @media (max-width: 768px) {
-            .tooltip-content {
-                min-width: 340px;
-                font-size: 12px;
-                padding: 14px 16px;
-            }
-        }
-    </style>
     ''', unsafe_allow_html=True)
 
     # Verificar se a coluna Fornecedor existe
-    if 'Fornecedor' in scs_filtered.columns:
-        # Calcular gastos por fornecedor e pegar top 5
-        gastos_fornecedor = scs_filtered.groupby('Fornecedor')['Valor'].sum().reset_index()
-        gastos_fornecedor = gastos_fornecedor.sort_values('Valor', ascending=False).head(5)
-
-        fig_fornecedor = px.bar(
-            gastos_fornecedor,
-            x='Fornecedor',
-            y='Valor',
-            title="🏆 Top 5 Fornecedores por Gasto Total",
-            text='Valor'
-        )
-        fig_fornecedor.update_traces(
-            marker_color='#EF8740',
-            texttemplate='<b>R$ %{text:,.0f}</b>',
-            textposition='outside',
-            textfont_size=14,
-            textfont_color='#000000',
-            width=0.6
-        )
-        fig_fornecedor.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(size=11, color='#000000'),
-            title_font_size=14,
-            title_font_color='#000000',
-            margin=dict(l=20, r=20, t=50, b=50),
-            height=450,
-            xaxis_tickangle=-45,
-            yaxis=dict(range=[0, gastos_fornecedor['Valor'].max() * 1.30])
-        )
-        st.plotly_chart(fig_fornecedor, use_container_width=True)
+    if dados['grafico'] is not None:
+        st.plotly_chart(dados['grafico'], use_container_width=True)
+
+        if dados['resumo_outros']:
+            st.caption(dados['resumo_outros'])
     else:
         st.warning("⚠️ Coluna 'Fornecedor' não encontrada nos dados")
 
+
+@st.fragment
+def render_categories_section(ctx):
+    """Seção das 5 categorias de maior gasto"""
+    # O cubo traz a categoria pelo nome (ou pela coluna G, em planilhas sem o cabeçalho)
+    dados = ctx.memo('secao_categorias', lambda: top_spend_section_data(
+        ctx, 'Categoria', 'categorias', "🏆 Top 5 Categorias por Gasto Total"
+    ))
+
     # === SEÇÃO: TOP 5 CATEGORIAS ===
     st.markdown('''
     <div class="section-header">
         📦 Top 5 Gastos por Categoria
         <span class="tooltip-container">
             <span class="help-icon">?</span>
-            <div class="tooltip-content">
+            <div class="tooltip-content" style="--tooltip-min: 420px; --tooltip-max: 500px; --tooltip-min-mobile: 350px;">
                 <div class="tooltip-arrow"></div>
                 <strong>Top 5 Gastos por Categoria</strong><br><br>
                 Identifica as 5 categorias de produtos e serviços que mais consomem recursos financeiros, permitindo análise de onde estão concentrados os maiores investimentos em compras.<br><br>
@@ -1541,132 +2511,53 @@ def main():
             </div>
         </span>
     </div>
+    ''', unsafe_allow_html=True)
 
-    <style>
-        .tooltip-container {
-            position: relative;
-            display: inline-block;
-            margin-left: 8px;
-        }
-
-        .help-icon {
-            display: inline-flex;
-            align-items: center;
-            justify-content: center;
-            width: 18px;
-            height: 18px;
-            background: linear-gradient(135deg, #EF8740, #FF6B35);
-            color: white;
-            border-radius: 50%;
-            font-size: 12px;
-            font-weight: bold;
-            cursor: help;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 8px rgba(239, 135, 64, 0.3);
-        }
-
-        .help-icon:hover {
-            transform: scale(1.1);
-            box-shadow: 0 4px 15px rgba(239, 135, 64, 0.5);
-        }
+    # Verificar se existe a coluna Categoria (pode ser 'Categoria', coluna G, ou posição 6)
+    if dados['grafico'] is not None:
+        st.plotly_chart(dados['grafico'], use_container_width=True)
 
-        .tooltip-content {
-            position: absolute;
-            bottom: 130%;
-            left: 50%;
-            transform: translateX(-50%);
-            background: linear-gradient(145deg, #2c3e50, #34495e);
-            color: white;
-            padding: 16px 20px;
-            border-radius: 12px;
-            white-space: nowrap;
-            opacity: 0;
-            visibility: hidden;
-            transition: all 0.3s cubic-bezier(0.68, -0.55, 0.265, 1.55);
-            z-index: 1000;
-            min-width: 420px;
-            max-width: 500px;
-            white-space: normal;
-            text-align: left;
-            font-size: 13px;
-            line-height: 1.4;
-            box-shadow: 0 10px 30px rgba(0, 0, 0, 0.3);
-            border: 1px solid rgba(255, 255, 255, 0.1);
-        }
+        if dados['resumo_outros']:
+            st.caption(dados['resumo_outros'])
+    else:
+        st.warning("⚠️ Coluna 'Categoria' não encontrada nos dados (esperada na coluna G - posição 6)")
 
-        .tooltip-arrow {
-            position: absolute;
-            top: 100%;
-            left: 50%;
-            transform: translateX(-50%);
-            width: 0;
-            height: 0;
-            border-left: 8px solid transparent;
-            border-right: 8px solid transparent;
-            border-top: 8px solid #2c3e50;
-        }
 
-        .tooltip-container:hover .tooltip-content {
-            opacity: 1;
-            visibility: visible;
-            transform: translateX(-50%) translateY(-5px);
-        }
+def priorities_section_data(ctx):
+    """Gráficos de prioridades por quantidade e por valor"""
+    prioridades = aggregate_cube(ctx.cubo, 'Prioridade')
 
-        @media (max-width: 768px) {
-            .tooltip-content {
-                min-width: 350px;
-                font-size: 12px;
-                padding: 14px 16px;
-            }
-        }
-    </style>
-    ''', unsafe_allow_html=True)
+    # Gráfico de pizza - Prioridades por Quantidade
+    prioridade_counts = prioridades.set_index('Prioridade')['qtd'].sort_values(ascending=False)
+    # Categorias sem SCs no filtro ficam fora da pizza
+    prioridade_counts = prioridade_counts[prioridade_counts > 0]
 
-    # Verificar se existe a coluna Categoria (pode ser 'Categoria', coluna G, ou posição 6)
-    categoria_col = None
+    # Gráfico de barras - Prioridades por Valor (ordenado do maior para o menor)
+    prioridade_valores = prioridades[['Prioridade', 'Valor']].sort_values('Valor', ascending=False)
 
-    # Tentar encontrar a coluna por nome primeiro
-    if 'Categoria' in scs_filtered.columns:
-        categoria_col = 'Categoria'
-    else:
-        # Tentar pela posição (coluna G = posição 6)
-        if len(scs_filtered.columns) > 6:
-            categoria_col = scs_filtered.columns[6]
-
-    if categoria_col is not None:
-        # Calcular gastos por categoria e pegar top 5
-        gastos_categoria = scs_filtered.groupby(categoria_col)['Valor'].sum().reset_index()
-        gastos_categoria = gastos_categoria.sort_values('Valor', ascending=False).head(5)
-
-        fig_categoria = px.bar(
-            gastos_categoria,
-            x=categoria_col,
+    return {
+        'grafico_qtd': pie_chart(
+            prioridade_counts.reset_index(),
+            values='qtd',
+            names='Prioridade',
+            title="📊 Distribuição por Quantidade"
+        ),
+        'grafico_valor': bar_chart(
+            prioridade_valores,
+            x='Prioridade',
             y='Valor',
-            title="🏆 Top 5 Categorias por Gasto Total",
-            text='Valor'
-        )
-        fig_categoria.update_traces(
-            marker_color='#EF8740',
+            title="💰 Distribuição por Valor",
+            text='Valor',
             texttemplate='<b>R$ %{text:,.0f}</b>',
-            textposition='outside',
-            textfont_size=14,
-            textfont_color='#000000',
-            width=0.6
-        )
-        fig_categoria.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(size=11, color='#000000'),
-            title_font_size=14,
-            title_font_color='#000000',
-            margin=dict(l=20, r=20, t=50, b=50),
-            height=450,
-            xaxis_tickangle=-45,
-            yaxis=dict(range=[0, gastos_categoria['Valor'].max() * 1.30])
+            height=400
         )
-        st.plotly_chart(fig_categoria, use_container_width=True)
-    else:
-        st.warning("⚠️ Coluna 'Categoria' não encontrada nos dados (esperada na coluna G - posição 6)")
+    }
+
+
+@st.fragment
+def render_priorities_section(ctx):
+    """Seção de prioridades"""
+    dados = ctx.memo('secao_prioridades', lambda: priorities_section_data(ctx))
 
     # === SEÇÃO 6: ANÁLISE DE PRIORIDADES ===
     st.markdown('''
@@ -1674,7 +2565,7 @@ def main():
         🎯 Análise de Prioridades
         <span class="tooltip-container">
             <span class="help-icon">?</span>
-            <div class="tooltip-content">
+            <div class="tooltip-content" style="--tooltip-min: 420px; --tooltip-max: 500px; --tooltip-min-mobile: 360px;">
                 <div class="tooltip-arrow"></div>
                 <strong>Análise de Prioridades</strong><br><br>
                 Mostra a distribuição das compras por nível de prioridade (Normal, Urgente, Emergente), tanto em quantidade quanto em valor financeiro, permitindo avaliar a qualidade do processo.<br><br>
@@ -1685,168 +2576,82 @@ def main():
             </div>
         </span>
     </div>
-
-    <style>
-        .tooltip-container {
-            position: relative;
-            display: inline-block;
-            margin-left: 8px;
-        }
-
-        .help-icon {
-            display: inline-flex;
-            align-items: center;
-            justify-content: center;
-            width: 18px;
-            height: 18px;
-            background: linear-gradient(135deg, #EF8740, #FF6B35);
-            color: white;
-            border-radius: 50%;
-            font-size: 12px;
-            font-weight: bold;
-            cursor: help;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 8px rgba(239, 135, 64, 0.3);
-        }
-
-        .help-icon:hover {
-            transform: scale(1.1);
-            box-shadow: 0 4px 15px rgba(239, 135, 64, 0.5);
-        }
-
-        .tooltip-content {
-            position: absolute;
-            bottom: 130%;
-            left: 50%;
-            transform: translateX(-50%);
-            background: linear-gradient(145deg, #2c3e50, #34495e);
-            color: white;
-            padding: 16px 20px;
-            border-radius: 12px;
-            white-space: nowrap;
-            opacity: 0;
-            visibility: hidden;
-            transition: all 0.3s cubic-bezier(0.68, -0.55, 0.265, 1.55);
-            z-index: 1000;
-            min-width: 420px;
-            max-width: 500px;
-            white-space: normal;
-            text-align: left;
-            font-size: 13px;
-            line-height: 1.4;
-            box-shadow: 0 10px 30px rgba(0, 0, 0, 0.3);
-            border: 1px solid rgba(255, 255, 255, 0.1);
-        }
-
-        .tooltip-arrow {
-            position: absolute;
-            top: 100%;
-            left: 50%;
-            transform: translateX(-50%);
-            width: 0;
-            height: 0;
-            border-left: 8px solid transparent;
-            border-right: 8px solid transparent;
-            border-top: 8px solid #2c3e50;
-        }
-
-        .tooltip-container:hover .tooltip-content {
-            opacity: 1;
-            visibility: visible;
-            transform: translateX(-50%) translateY(-5px);
-        }
-
-        @media (max-width: 768px) {
-            .tooltip-content {
-                min-width: 360px;
-                font-size: 12px;
-                padding: 14px 16px;
-            }
-        }
-    </style>
     ''', unsafe_allow_html=True)
 
     col1, col2 = st.columns(2)
 
     with col1:
         # Gráfico de pizza - Prioridades por Quantidade
-        prioridade_counts = scs_filtered['Prioridade'].value_counts()
-        fig_pizza_qtd = px.pie(
-            values=prioridade_counts.values,
-            names=prioridade_counts.index,
-            title="📊 Distribuição por Quantidade",
-            color_discrete_sequence=['#EF8740', '#000000', '#FFA366', '#333333', '#FFB580']
-        )
-        fig_pizza_qtd.update_traces(
-            textposition='inside',
-            textinfo='percent+label',
-            textfont_size=13,
-            textfont_color='white'
-        )
-        fig_pizza_qtd.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(size=11, color='#000000'),
-            title_font_size=14,
-            title_font_color='#000000',
-            margin=dict(l=20, r=20, t=50, b=20),
-            height=400
-        )
-        st.plotly_chart(fig_pizza_qtd, use_container_width=True)
+        st.plotly_chart(dados['grafico_qtd'], use_container_width=True)
 
     with col2:
-        # Gráfico de barras - Prioridades por Valor (ordenado do maior para o menor)
-        prioridade_valores = scs_filtered.groupby('Prioridade')['Valor'].sum().reset_index()
-        prioridade_valores = prioridade_valores.sort_values('Valor', ascending=False)  # Ordenar do maior para o menor
-
-        fig_bar_valor = px.bar(
-            prioridade_valores,
-            x='Prioridade',
-            y='Valor',
-            title="💰 Distribuição por Valor",
-            text='Valor'
-        )
-        fig_bar_valor.update_traces(
-            marker_color='#EF8740',
-            texttemplate='<b>R$ %{text:,.0f}</b>',
-            textposition='outside',
-            textfont_size=14,
-            textfont_color='#000000',
-            width=0.6
-        )
-        fig_bar_valor.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(size=11, color='#000000'),
-            title_font_size=14,
-            title_font_color='#000000',
-            margin=dict(l=20, r=20, t=50, b=50),
-            height=400,
-            yaxis=dict(range=[0, prioridade_valores['Valor'].max() * 1.30])
-        )
-        st.plotly_chart(fig_bar_valor, use_container_width=True)
+        # Gráfico de barras - Prioridades por Valor
+        st.plotly_chart(dados['grafico_valor'], use_container_width=True)
 
     # Funções auxiliares para mapeamento de colunas
-    def find_column(df, possible_names):
-        """Encontra a primeira coluna que existe no DataFrame"""
-        for name in possible_names:
-            if name in df.columns:
-                return name
-        return None
 
-    def get_column_by_position(df, position):
-        """Retorna o nome da coluna pela posição (0-indexed)"""
-        if position < len(df.columns):
-            return df.columns[position]
-        return None
 
+def savings_section_data(ctx):
+    """Gráficos e KPI da seção de savings (gráficos None sem as colunas de saving)"""
+    saving_filtered = ctx.saving_filtered
+
+    # Mapear coluna de saving
+    saving_col = find_column(saving_filtered, ['Redução R$', 'Reducao R$', 'Saving', 'Economia', 'Redução'])
+    comprador_col_saving = find_column(saving_filtered, ['Comprador', 'Buyer', 'Responsável'])
+
+    if not (saving_col and comprador_col_saving):
+        return {'grafico': None, 'saving_total': None, 'grafico_percentual': None}
+
+    kpis_comprador = ctx.kpis_comprador
+
+    # Gráfico Saving por comprador
+    saving_por_comprador = kpis_comprador[kpis_comprador['saving_qtd'] > 0]
+    fig_saving = bar_chart(
+        saving_por_comprador,
+        x='Comprador',
+        y='Saving',
+        title="💰 Savings por Comprador",
+        text='Saving',
+        labels={'Comprador': comprador_col_saving, 'Saving': saving_col},
+        texttemplate='<b>R$ %{text:,.0f}</b>',
+        height=400,
+        margin_top=80,
+        margin_bottom=20,
+        headroom=1.4,
+        min_top=100
+    )
+
+    # Saving total ÷ compras totais, já calculado para compradores com SCs e saving,
+    # do maior para o menor percentual
+    percentual_saving = kpis_comprador.dropna(subset=['Percentual_Saving'])
+    percentual_saving = percentual_saving.sort_values('Percentual_Saving', ascending=False)
+
+    fig_perc_saving = bar_chart(
+        percentual_saving,
+        x='Comprador',
+        y='Percentual_Saving',
+        title="📊 % Saving por Comprador (Saving Total ÷ Compras Totais)",
+        text='Percentual_Saving',
+        texttemplate='<b>%{text:.1f}%</b>'
+    )
+
+    return {
+        'grafico': fig_saving,
+        'saving_total': saving_filtered[saving_col].sum(),
+        'grafico_percentual': fig_perc_saving
+    }
+
+
+@st.fragment
+def render_savings_section(ctx):
+    """Seção de savings"""
     # === SEÇÃO 6: ANÁLISE DE SAVINGS ===
     st.markdown('''
     <div class="section-header">
         💎 Análise de Savings
         <span class="tooltip-container">
             <span class="help-icon">?</span>
-            <div class="tooltip-content">
+            <div class="tooltip-content" style="--tooltip-min: 400px; --tooltip-max: 480px; --tooltip-min-mobile: 340px;">
                 <div class="tooltip-arrow"></div>
                 <strong>Savings - Economia em Compras</strong><br><br>
                 Representa o valor economizado através de negociações, descontos por volume, mudanças de fornecedor ou outras estratégias de redução de custos.<br><br>
@@ -1856,139 +2661,31 @@ def main():
             </div>
         </span>
     </div>
-
-    <style>
-        .tooltip-container {
-            position: relative;
-            display: inline-block;
-            margin-left: 8px;
-        }
-
-        .help-icon {
-            display: inline-flex;
-            align-items: center;
-            justify-content: center;
-            width: 18px;
-            height: 18px;
-            background: linear-gradient(135deg, #EF8740, #FF6B35);
-            color: white;
-            border-radius: 50%;
-            font-size: 12px;
-            font-weight: bold;
-            cursor: help;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 8px rgba(239, 135, 64, 0.3);
-        }
-
-        .help-icon:hover {
-            transform: scale(1.1);
-            box-shadow: 0 4px 15px rgba(239, 135, 64, 0.5);
-        }
-
-        .tooltip-content {
-            position: absolute;
-            bottom: 130%;
-            left: 50%;
-            transform: translateX(-50%);
-            background: linear-gradient(145deg, #2c3e50, #34495e);
-            color: white;
-            padding: 16px 20px;
-            border-radius: 12px;
-            white-space: nowrap;
-            opacity: 0;
-            visibility: hidden;
-            transition: all 0.3s cubic-bezier(0.68, -0.55, 0.265, 1.55);
-            z-index: 1000;
-            min-width: 400px;
-            max-width: 480px;
-            white-space: normal;
-            text-align: left;
-            font-size: 13px;
-            line-height: 1.4;
-            box-shadow: 0 10px 30px rgba(0, 0, 0, 0.3);
-            border: 1px solid rgba(255, 255, 255, 0.1);
-        }
-
-        .tooltip-arrow {
-            position: absolute;
-            top: 100%;
-            left: 50%;
-            transform: translateX(-50%);
-            width: 0;
-            height: 0;
-            border-left: 8px solid transparent;
-            border-right: 8px solid transparent;
-            border-top: 8px solid #2c3e50;
-        }
-
-        .tooltip-container:hover .tooltip-content {
-            opacity: 1;
-            visibility: visible;
-            transform: translateX(-50%) translateY(-5px);
-        }
-
-        @media (max-width: 768px) {
-            .tooltip-content {
-                min-width: 340px;
-                font-size: 12px;
-                padding: 14px 16px;
-            }
-        }
-    </style>
     ''', unsafe_allow_html=True)
 
-    if not saving_df.empty:
-        # Mapear coluna de saving
-        saving_col = find_column(saving_filtered, ['Redução R$', 'Reducao R$', 'Saving', 'Economia', 'Redução'])
-        comprador_col_saving = find_column(saving_filtered, ['Comprador', 'Buyer', 'Responsável'])
+    if not ctx.saving_df.empty:
+        dados = ctx.memo('secao_savings', lambda: savings_section_data(ctx))
 
-        if saving_col and comprador_col_saving:
+        if dados['grafico'] is not None:
             col1, col2 = st.columns([3, 1])
 
             with col1:
                 # Gráfico Saving por comprador
-                saving_por_comprador = saving_filtered.groupby(comprador_col_saving)[saving_col].sum().reset_index()
-                fig_saving = px.bar(
-                    saving_por_comprador,
-                    x=comprador_col_saving,
-                    y=saving_col,
-                    title="💰 Savings por Comprador",
-                    text=saving_col
-                )
-                fig_saving.update_traces(
-                    marker_color='#EF8740',
-                    texttemplate='<b>R$ %{text:,.0f}</b>',
-                    textposition='outside',
-                    textfont_size=14,
-                    textfont_color='#000000',
-                    width=0.6
-                )
-                fig_saving.update_layout(
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    font=dict(size=11, color='#000000'),
-                    title_font_size=14,
-                    title_font_color='#000000',
-                    margin=dict(l=20, r=20, t=80, b=20),
-                    height=400,
-                    yaxis=dict(range=[0, max(saving_por_comprador[saving_col].max() * 1.4, 100)])
-                )
-                st.plotly_chart(fig_saving, use_container_width=True)
+                st.plotly_chart(dados['grafico'], use_container_width=True)
 
             with col2:
                 # KPI Saving Total
-                saving_total = saving_filtered[saving_col].sum()
-                st.markdown(create_kpi_card(saving_total, "Saving Total"), unsafe_allow_html=True)
+                st.markdown(create_kpi_card(dados['saving_total'], "Saving Total"), unsafe_allow_html=True)
 
 
             # Gráfico Percentual de Saving por Comprador (abaixo dos anteriores)
-            if comprador_col_saving:
+            if dados['grafico_percentual'] is not None:
                 st.markdown('''
                 <div style="font-size: 1.2rem; font-weight: 600; color: #000000; margin: 1.5rem 0 1rem 0;">
                     📈 Percentual de Saving por Comprador
                     <span class="tooltip-container">
                         <span class="help-icon">?</span>
-                        <div class="tooltip-content">
+                        <div class="tooltip-content" style="--tooltip-min: 400px; --tooltip-max: 480px; --tooltip-min-mobile: 340px;">
                             <div class="tooltip-arrow"></div>
                             <strong>% Saving por Comprador</strong><br><br>
                             Mostra a eficiência de cada comprador em gerar economias, calculando o percentual do saving total obtido em relação ao valor total de suas compras.<br><br>
@@ -1998,147 +2695,79 @@ def main():
                         </div>
                     </span>
                 </div>
-
-                <style>
-                    .tooltip-container {
-                        position: relative;
-                        display: inline-block;
-                        margin-left: 8px;
-                    }
-
-                    .help-icon {
-                        display: inline-flex;
-                        align-items: center;
-                        justify-content: center;
-                        width: 18px;
-                        height: 18px;
-                        background: linear-gradient(135deg, #EF8740, #FF6B35);
-                        color: white;
-                        border-radius: 50%;
-                        font-size: 12px;
-                        font-weight: bold;
-                        cursor: help;
-                        transition: all 0.3s ease;
-                        box-shadow: 0 2px 8px rgba(239, 135, 64, 0.3);
-                    }
-
-                    .help-icon:hover {
-                        transform: scale(1.1);
-                        box-shadow: 0 4px 15px rgba(239, 135, 64, 0.5);
-                    }
-
-                    .tooltip-content {
-                        position: absolute;
-                        bottom: 130%;
-                        left: 50%;
-                        transform: translateX(-50%);
-                        background: linear-gradient(145deg, #2c3e50, #34495e);
-                        color: white;
-                        padding: 16px 20px;
-                        border-radius: 12px;
-                        white-space: nowrap;
-                        opacity: 0;
-                        visibility: hidden;
-                        transition: all 0.3s cubic-bezier(0.68, -0.55, 0.265, 1.55);
-                        z-index: 1000;
-                        min-width: 400px;
-                        max-width: 480px;
-                        white-space: normal;
-                        text-align: left;
-                        font-size: 13px;
-                        line-height: 1.4;
-                        box-shadow: 0 10px 30px rgba(0, 0, 0, 0.3);
-                        border: 1px solid rgba(255, 255, 255, 0.1);
-                    }
-
-                    .tooltip-arrow {
-                        position: absolute;
-                        top: 100%;
-                        left: 50%;
-                        transform: translateX(-50%);
-                        width: 0;
-                        height: 0;
-                        border-left: 8px solid transparent;
-                        border-right: 8px solid transparent;
-                        border-top: 8px solid #2c3e50;
-                    }
-
-                    .tooltip-container:hover .tooltip-content {
-                        opacity: 1;
-                        visibility: visible;
-                        transform: translateX(-50%) translateY(-5px);
-                    }
-
-                    @media (max-width: 768px) {
-                        .tooltip-content {
-                            min-width: 340px;
-                            font-size: 12px;
-                            padding: 14px 16px;
-                        }
-                    }
-                </style>
                 ''', unsafe_allow_html=True)
 
-                # Calcular saving total por comprador (da aba Saving)
-                saving_por_comprador_total = saving_filtered.groupby(comprador_col_saving)[saving_col].sum().reset_index()
+                st.plotly_chart(dados['grafico_percentual'], use_container_width=True)
+        else:
+            st.warning("⚠️ Colunas de saving não encontradas na aba Saving")
+    else:
+        st.info("ℹ️ Nenhum dado de saving disponível")
 
-                # Calcular compras totais por comprador (da aba SC's)
-                compras_por_comprador = scs_filtered.groupby('Comprador')['Valor'].sum().reset_index()
 
-                # Fazer merge dos dados
-                percentual_saving = pd.merge(
-                    saving_por_comprador_total,
-                    compras_por_comprador,
-                    left_on=comprador_col_saving,
-                    right_on='Comprador',
-                    how='inner'
-                )
+def audit_columns(scs_df, saving_df):
+    """Colunas de pedido, valor e data usadas pelas auditorias nas abas SC's e Saving"""
+    return {
+        # Buscar colunas na aba Saving (coluna B = posição 2)
+        'pedido_saving': get_column_by_position(saving_df, 2),  # Coluna B
+        'valor_final': find_column(saving_df, ['VALOR FINAL', 'Valor Final', 'Valor_Final', 'ValorFinal']),
 
-                # Calcular percentual de saving
-                percentual_saving['Percentual_Saving'] = (percentual_saving[saving_col] / percentual_saving[
-                    'Valor']) * 100
+        # Buscar colunas na aba SC's (coluna I = posição 9)
+        'pedido_scs': get_column_by_position(scs_df, 9),  # Coluna I
+        'valor_scs': find_column(scs_df, ['Valor', 'VALOR', 'Valor Total', 'Total']),
 
-                # Ordenar do maior para o menor percentual
-                percentual_saving = percentual_saving.sort_values('Percentual_Saving', ascending=False)
+        # Colunas de data usadas pela auditoria de datas, na mesma junção
+        'data_scs': find_column(scs_df, ['Data', 'Data da Compra', 'Data Compra', 'DATA']),
+        'data_saving': find_column(saving_df, ['Data', 'DATA', 'Data Saving'])
+    }
+
+
+def audit_section_data(ctx, colunas, tolerancia, estrategia):
+    """Pedidos conformes, divergentes e sem correspondência das auditorias de valores e de datas"""
+    # Junção única Saving x SC's pelo número do pedido, usada pelas auditorias de valores e de datas
+    # Só os pedidos do Saving no período e comprador selecionados
+    conciliacao = None
+    if ctx.from_database:
+        # Dados do banco: a conciliação foi gravada no upload e só é classificada aqui
+        conciliacao = classify_orders(
+            load_audit_from_database(int(ctx.upload_info.iloc[0]['id']), **ctx.filtros),
+            tolerancia, estrategia
+        )
+    elif colunas['pedido_saving'] and colunas['pedido_scs']:
+        # Em memória: a junção é memorizada; só a classificação segue a tolerância e a estratégia
+        conciliacao = classify_orders(
+            ctx.memo('conciliacao', lambda: join_orders(
+                ctx.saving_filtered, ctx.scs_df, colunas['pedido_saving'], colunas['pedido_scs'],
+                colunas['valor_final'], colunas['valor_scs'], colunas['data_saving'], colunas['data_scs']
+            )),
+            tolerancia, estrategia
+        )
+
+    dados = {'valores': None, 'datas': None}
+    if all([colunas['pedido_saving'], colunas['valor_final'], colunas['pedido_scs'], colunas['valor_scs']]):
+        dados['valores'] = split_audit(
+            conciliacao, 'Status', ['Pedido', 'Valor SC\'s', 'Valor Final Saving', 'Diferença'],
+            ['Pedido', 'Valor Final Saving']
+        )
+
+    if all([colunas['pedido_saving'], colunas['data_saving'], colunas['pedido_scs'], colunas['data_scs']]):
+        # Mesma conciliação da auditoria de valores: só separa as colunas de data
+        dados['datas'] = split_audit(
+            conciliacao, 'Status Data', ['Pedido', 'Data SC\'s', 'Data Saving', 'Diferença (dias)'],
+            ['Pedido', 'Data Saving']
+        )
+    return dados
 
-                fig_perc_saving = px.bar(
-                    percentual_saving,
-                    x='Comprador',
-                    y='Percentual_Saving',
-                    title="📊 % Saving por Comprador (Saving Total ÷ Compras Totais)",
-                    text='Percentual_Saving'
-                )
-                fig_perc_saving.update_traces(
-                    marker_color='#EF8740',
-                    texttemplate='<b>%{text:.1f}%</b>',
-                    textposition='outside',
-                    textfont_size=14,
-                    textfont_color='#000000',
-                    width=0.6
-                )
-                fig_perc_saving.update_layout(
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    font=dict(size=11, color='#000000'),
-                    title_font_size=14,
-                    title_font_color='#000000',
-                    margin=dict(l=20, r=20, t=50, b=50),
-                    height=450,
-                    yaxis=dict(range=[0, percentual_saving['Percentual_Saving'].max() * 1.30])
-                )
-                st.plotly_chart(fig_perc_saving, use_container_width=True)
-        else:
-            st.warning("⚠️ Colunas de saving não encontradas na aba Saving")
-    else:
-        st.info("ℹ️ Nenhum dado de saving disponível")
 
+@st.fragment
+def render_audit_section(ctx):
+    """Seção de auditoria de valores e de datas"""
     # === SEÇÃO 8: AUDITORIA ===
     st.markdown('''
     <div class="section-header">
         🔍 Auditoria de Valores
         <span class="tooltip-container">
             <span class="help-icon">?</span>
-            <div class="tooltip-content">
+            <div class="tooltip-content" style="--tooltip-min: 440px; --tooltip-max: 520px; --tooltip-min-mobile: 370px;">
                 <div class="tooltip-arrow"></div>
                 <strong>Auditoria de Valores</strong><br><br>
                 Validação automática que compara os valores entre as abas SC's e Saving para identificar inconsistências nos dados. Garante a integridade das informações financeiras.<br><br>
@@ -2149,96 +2778,15 @@ def main():
             </div>
         </span>
     </div>
-
-    <style>
-        .tooltip-container {
-            position: relative;
-            display: inline-block;
-            margin-left: 8px;
-        }
-
-        .help-icon {
-            display: inline-flex;
-            align-items: center;
-            justify-content: center;
-            width: 18px;
-            height: 18px;
-            background: linear-gradient(135deg, #EF8740, #FF6B35);
-            color: white;
-            border-radius: 50%;
-            font-size: 12px;
-            font-weight: bold;
-            cursor: help;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 8px rgba(239, 135, 64, 0.3);
-        }
-
-        .help-icon:hover {
-            transform: scale(1.1);
-            box-shadow: 0 4px 15px rgba(239, 135, 64, 0.5);
-        }
-
-        .tooltip-content {
-            position: absolute;
-            bottom: 130%;
-            left: 50%;
-            transform: translateX(-50%);
-            background: linear-gradient(145deg, #2c3e50, #34495e);
-            color: white;
-            padding: 16px 20px;
-            border-radius: 12px;
-            white-space: nowrap;
-            opacity: 0;
-            visibility: hidden;
-            transition: all 0.3s cubic-bezier(0.68, -0.55, 0.265, 1.55);
-            z-index: 1000;
-            min-width: 440px;
-            max-width: 520px;
-            white-space: normal;
-            text-align: left;
-            font-size: 13px;
-            line-height: 1.4;
-            box-shadow: 0 10px 30px rgba(0, 0, 0, 0.3);
-            border: 1px solid rgba(255, 255, 255, 0.1);
-        }
-
-        .tooltip-arrow {
-            position: absolute;
-            top: 100%;
-            left: 50%;
-            transform: translateX(-50%);
-            width: 0;
-            height: 0;
-            border-left: 8px solid transparent;
-            border-right: 8px solid transparent;
-            border-top: 8px solid #2c3e50;
-        }
-
-        .tooltip-container:hover .tooltip-content {
-            opacity: 1;
-            visibility: visible;
-            transform: translateX(-50%) translateY(-5px);
-        }
-
-        @media (max-width: 768px) {
-            .tooltip-content {
-                min-width: 370px;
-                font-size: 12px;
-                padding: 14px 16px;
-            }
-        }
-    </style>
     ''', unsafe_allow_html=True)
 
     # Estrutura de dados removida (não exibir no dashboard)
 
-    # Buscar colunas na aba Saving (coluna B = posição 2)
-    pedido_col_saving = get_column_by_position(saving_df, 2)  # Coluna B
-    valor_final_col = find_column(saving_df, ['VALOR FINAL', 'Valor Final', 'Valor_Final', 'ValorFinal'])
-
-    # Buscar colunas na aba SC's (coluna I = posição 9)
-    pedido_col_scs = get_column_by_position(scs_df, 9)  # Coluna I
-    valor_col_scs = find_column(scs_df, ['Valor', 'VALOR', 'Valor Total', 'Total'])
+    # O mapeamento só depende das colunas das abas, não dos filtros
+    colunas = ctx.memo('auditoria_colunas', lambda: audit_columns(ctx.scs_df, ctx.saving_df), campos=())
+    pedido_col_saving, valor_final_col = colunas['pedido_saving'], colunas['valor_final']
+    pedido_col_scs, valor_col_scs = colunas['pedido_scs'], colunas['valor_scs']
+    data_col_scs, data_col_saving = colunas['data_scs'], colunas['data_saving']
 
     st.markdown("#### 🔗 Mapeamento de Colunas")
     col1, col2 = st.columns(2)
@@ -2251,37 +2799,28 @@ def main():
         st.info(f"**Saving - Pedido:** {pedido_col_saving}")
         st.info(f"**Saving - Valor Final:** {valor_final_col}")
 
-    # Realizar auditoria apenas se todas as colunas foram encontradas
+    st.caption("Auditoria dos pedidos do Saving no período e comprador selecionados na barra lateral.")
+
+    tolerancia, estrategia = AUDIT_VALUE_TOLERANCE, 'primeira'
     if all([pedido_col_saving, valor_final_col, pedido_col_scs, valor_col_scs]):
-        audit_results = []
-
-        for _, saving_row in saving_df.iterrows():
-            pedido_num = saving_row[pedido_col_saving]
-            valor_final_saving = saving_row[valor_final_col]
-
-            # Buscar pedido correspondente na aba SC's
-            scs_match = scs_df[scs_df[pedido_col_scs] == pedido_num]
-
-            if not scs_match.empty:
-                valor_scs = scs_match[valor_col_scs].iloc[0]
-
-                # Verificar se os valores são diferentes (tolerância de R$ 0.01)
-                if abs(valor_scs - valor_final_saving) > 0.01:
-                    audit_results.append({
-                        'Pedido': pedido_num,
-                        'Valor SC\'s': valor_scs,
-                        'Valor Final Saving': valor_final_saving,
-                        'Diferença': valor_scs - valor_final_saving,
-                        'Status': 'DIVERGÊNCIA'
-                    })
-                else:
-                    audit_results.append({
-                        'Pedido': pedido_num,
-                        'Valor SC\'s': valor_scs,
-                        'Valor Final Saving': valor_final_saving,
-                        'Diferença': 0.0,
-                        'Status': 'OK'
-                    })
+        col1, col2 = st.columns(2)
+
+        with col1:
+            tolerancia = st.number_input("Tolerância (R$):", min_value=0.0, value=AUDIT_VALUE_TOLERANCE,
+                                         step=0.01, format="%.2f", key='auditoria_tolerancia')
+
+        with col2:
+            estrategia = st.selectbox("Pedidos com várias linhas nas SC's:", list(AUDIT_MULTILINE_STRATEGIES),
+                                      format_func=AUDIT_MULTILINE_STRATEGIES.get, key='auditoria_estrategia')
+
+    # Auditorias classificadas pela tolerância e estratégia escolhidas, memorizadas com os filtros
+    auditoria = ctx.memo('secao_auditoria', lambda: audit_section_data(ctx, colunas, tolerancia, estrategia),
+                         extras=(tolerancia, estrategia))
+
+    # Realizar auditoria apenas se todas as colunas foram encontradas
+    if auditoria['valores'] is not None:
+        conformes, divergencias, sem_correspondencia = auditoria['valores']
+        audit_results = len(conformes) + len(divergencias) > 0
     else:
         missing_cols = []
         if not pedido_col_saving:
@@ -2295,15 +2834,9 @@ def main():
 
         st.error(f"❌ **Não foi possível realizar a auditoria.**")
         st.error(f"**Colunas não encontradas:** {', '.join(missing_cols)}")
-        audit_results = []
+        audit_results = False
 
     if audit_results:
-        audit_df = pd.DataFrame(audit_results)
-
-        # Separar divergências
-        divergencias = audit_df[audit_df['Status'] == 'DIVERGÊNCIA']
-        conformes = audit_df[audit_df['Status'] == 'OK']
-
         col1, col2 = st.columns(2)
 
         with col1:
@@ -2321,13 +2854,17 @@ def main():
             else:
                 st.markdown('<div class="audit-success">Nenhuma divergência encontrada!</div>', unsafe_allow_html=True)
 
+        if not sem_correspondencia.empty:
+            with st.expander(f"🔎 Pedidos do Saving sem SC correspondente: {len(sem_correspondencia)}"):
+                st.dataframe(sem_correspondencia, use_container_width=True)
+
     # === AUDITORIA DE DATAS ===
     st.markdown('''
     <div style="font-size: 1.1rem; font-weight: 600; color: #000000; margin: 1.5rem 0 1rem 0;">
         📅 Auditoria de Datas
         <span class="tooltip-container">
             <span class="help-icon">?</span>
-            <div class="tooltip-content">
+            <div class="tooltip-content" style="--tooltip-min: 450px; --tooltip-max: 530px; --tooltip-min-mobile: 380px;">
                 <div class="tooltip-arrow"></div>
                 <strong>Auditoria de Datas</strong><br><br>
                 Validação que compara as datas entre as abas SC's e Saving para o mesmo número de pedido, identificando inconsistências temporais que podem indicar problemas de registro.<br><br>
@@ -2338,129 +2875,12 @@ def main():
             </div>
         </span>
     </div>
-
-    <style>
-        .tooltip-container {
-            position: relative;
-            display: inline-block;
-            margin-left: 8px;
-        }
-
-        .help-icon {
-            display: inline-flex;
-            align-items: center;
-            justify-content: center;
-            width: 18px;
-            height: 18px;
-            background: linear-gradient(135deg, #EF8740, #FF6B35);
-            color: white;
-            border-radius: 50%;
-            font-size: 12px;
-            font-weight: bold;
-            cursor: help;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 8px rgba(239, 135, 64, 0.3);
-        }
-
-        .help-icon:hover {
-            transform: scale(1.1);
-            box-shadow: 0 4px 15px rgba(239, 135, 64, 0.5);
-        }
-
-        .tooltip-content {
-            position: absolute;
-            bottom: 130%;
-            left: 50%;
-            transform: translateX(-50%);
-            background: linear-gradient(145deg, #2c3e50, #34495e);
-            color: white;
-            padding: 16px 20px;
-            border-radius: 12px;
-            white-space: nowrap;
-            opacity: 0;
-            visibility: hidden;
-            transition: all 0.3s cubic-bezier(0.68, -0.55, 0.265, 1.55);
-            z-index: 1000;
-            min-width: 450px;
-            max-width: 530px;
-            white-space: normal;
-            text-align: left;
-            font-size: 13px;
-            line-height: 1.4;
-            box-shadow: 0 10px 30px rgba(0, 0, 0, 0.3);
-            border: 1px solid rgba(255, 255, 255, 0.1);
-        }
-
-        .tooltip-arrow {
-            position: absolute;
-            top: 100%;
-            left: 50%;
-            transform: translateX(-50%);
-            width: 0;
-            height: 0;
-            border-left: 8px solid transparent;
-            border-right: 8px solid transparent;
-            border-top: 8px solid #2c3e50;
-        }
-
-        .tooltip-container:hover .tooltip-content {
-            opacity: 1;
-            visibility: visible;
-            transform: translateX(-50%) translateY(-5px);
-        }
-
-        @media (max-width: 768px) {
-            .tooltip-content {
-                min-width: 380px;
-                font-size: 12px;
-                padding: 14px 16px;
-            }
-        }
-    </style>
     ''', unsafe_allow_html=True)
 
-    # Buscar colunas de data
-    data_col_scs = find_column(scs_df, ['Data', 'Data da Compra', 'Data Compra', 'DATA'])
-    data_col_saving = find_column(saving_df, ['Data', 'DATA', 'Data Saving'])
-
-    if all([pedido_col_saving, data_col_saving, pedido_col_scs, data_col_scs]):
-        audit_dates_results = []
-
-        for _, saving_row in saving_df.iterrows():
-            pedido_num = saving_row[pedido_col_saving]
-            data_saving = pd.to_datetime(saving_row[data_col_saving]).date()
-
-            # Buscar pedido correspondente na aba SC's
-            scs_match = scs_df[scs_df[pedido_col_scs] == pedido_num]
-
-            if not scs_match.empty:
-                data_scs = pd.to_datetime(scs_match[data_col_scs].iloc[0]).date()
-
-                # Verificar se as datas são diferentes
-                if data_scs != data_saving:
-                    audit_dates_results.append({
-                        'Pedido': pedido_num,
-                        'Data SC\'s': data_scs.strftime('%d/%m/%Y'),
-                        'Data Saving': data_saving.strftime('%d/%m/%Y'),
-                        'Diferença (dias)': (data_saving - data_scs).days,
-                        'Status': 'DIVERGÊNCIA'
-                    })
-                else:
-                    audit_dates_results.append({
-                        'Pedido': pedido_num,
-                        'Data SC\'s': data_scs.strftime('%d/%m/%Y'),
-                        'Data Saving': data_saving.strftime('%d/%m/%Y'),
-                        'Diferença (dias)': 0,
-                        'Status': 'OK'
-                    })
-
-        if audit_dates_results:
-            audit_dates_df = pd.DataFrame(audit_dates_results)
-
-            # Separar divergências de datas
-            divergencias_datas = audit_dates_df[audit_dates_df['Status'] == 'DIVERGÊNCIA']
-            conformes_datas = audit_dates_df[audit_dates_df['Status'] == 'OK']
+    if auditoria['datas'] is not None:
+        conformes_datas, divergencias_datas, _ = auditoria['datas']
 
+        if len(conformes_datas) + len(divergencias_datas) > 0:
             col1, col2 = st.columns(2)
 
             with col1:
@@ -2489,13 +2909,86 @@ def main():
         st.error(f"❌ **Auditoria de datas não disponível.**")
         st.error(f"**Colunas de data não encontradas:** {', '.join(missing_date_cols)}")
 
+
+def summary_kpi_data(ctx):
+    """KPIs do resumo executivo"""
+    cubo = ctx.cubo
+    saving_df = ctx.saving_df
+
+    # Calcular saving percentage de forma segura
+    if not saving_df.empty:
+        valor_inicial_col = find_column(saving_df, ['VALOR INICIAL', 'Valor Inicial', 'Valor_Inicial'])
+        saving_col = find_column(saving_df, ['Redução R$', 'Reducao R$', 'Saving', 'Economia'])
+
+        if saving_col:
+            saving_percentage = safe_divide(saving_df[saving_col].sum(), cubo['valor'].sum()) * 100
+        else:
+            saving_percentage = 0
+    else:
+        saving_percentage = 0
+
+    return {
+        'total_pedidos': int(cubo['qtd'].sum()),
+        'total_fornecedores': cubo['Fornecedor'].nunique() if 'Fornecedor' in cubo.columns else 0,
+        'saving_percentage': saving_percentage,
+        'pedidos_com_saving': len(saving_df) if not saving_df.empty else 0
+    }
+
+
+def top_products_data(ctx, categoria_col, descricao_col):
+    """Top 10 categorias por gasto com as tabelas dos 5 produtos de maior valor de cada uma"""
+    scs_filtered = ctx.scs_filtered
+    gastos_por_dimensao = ctx.gastos_por_dimensao
+
+    # Top 10 categorias por gasto total, reaproveitando as somas do cubo quando a coluna é a mesma
+    if categoria_col in gastos_por_dimensao:
+        gastos_categorias = gastos_por_dimensao[categoria_col]
+    else:
+        gastos_categorias = scs_filtered.groupby(categoria_col, observed=True, dropna=False)['Valor'].sum()
+    ranking_categorias = top_n_with_outros(gastos_categorias, 10, categoria_col)
+    top_categorias = ranking_categorias[~ranking_categorias['Outros']]
+
+    # Top 5 produtos de todas as categorias do top 10 em uma única passada
+    produtos_ranqueados, produtos_unicos = rank_products_by_category(
+        scs_filtered, categoria_col, descricao_col, top_categorias[categoria_col], 5
+    )
+    produtos_por_categoria = dict(tuple(produtos_ranqueados.groupby(categoria_col, observed=True)))
+
+    categorias = []
+    for categoria_nome, categoria_valor in zip(top_categorias[categoria_col], top_categorias['Valor']):
+        top_produtos = produtos_por_categoria.get(categoria_nome, produtos_ranqueados.iloc[0:0])
+
+        # Tabela dos top 5 produtos
+        tabela_exibicao = top_produtos[
+            ['Produto', 'Valor Formatado', '% Formatado', 'Quantidade Pedidos']].copy()
+        tabela_exibicao.columns = ['📦 Produto', '💰 Valor Total', '📊 % da Categoria', '🔢 Qtd Pedidos']
+
+        # Resetar index para mostrar ranking
+        tabela_exibicao.index = range(1, len(tabela_exibicao) + 1)
+
+        categorias.append({
+            'nome': categoria_nome,
+            'valor': categoria_valor,
+            'tabela': tabela_exibicao,
+            'produtos_unicos': produtos_unicos.get(categoria_nome, 0),
+            'percentual_top': top_produtos['% da Categoria'].sum()
+        })
+
+    return {'categorias': categorias, 'resumo_outros': describe_outros(ranking_categorias, 'categorias')}
+
+
+@st.fragment
+def render_summary_section(ctx):
+    """Seção de resumo executivo e top produtos por categoria"""
+    kpis = ctx.memo('secao_resumo_kpis', lambda: summary_kpi_data(ctx))
+
     # === RESUMO EXECUTIVO ===
     st.markdown('''
     <div class="section-header">
         📈 Resumo Executivo
         <span class="tooltip-container">
             <span class="help-icon">?</span>
-            <div class="tooltip-content">
+            <div class="tooltip-content" style="--tooltip-min: 460px; --tooltip-max: 540px; --tooltip-min-mobile: 390px;">
                 <div class="tooltip-arrow"></div>
                 <strong>Resumo Executivo</strong><br><br>
                 Visão consolidada dos principais KPIs do dashboard, apresentando métricas estratégicas para tomada de decisão executiva de forma rápida e objetiva.<br><br>
@@ -2506,114 +2999,24 @@ def main():
             </div>
         </span>
     </div>
-
-    <style>
-        .tooltip-container {
-            position: relative;
-            display: inline-block;
-            margin-left: 8px;
-        }
-
-        .help-icon {
-            display: inline-flex;
-            align-items: center;
-            justify-content: center;
-            width: 18px;
-            height: 18px;
-            background: linear-gradient(135deg, #EF8740, #FF6B35);
-            color: white;
-            border-radius: 50%;
-            font-size: 12px;
-            font-weight: bold;
-            cursor: help;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 8px rgba(239, 135, 64, 0.3);
-        }
-
-        .help-icon:hover {
-            transform: scale(1.1);
-            box-shadow: 0 4px 15px rgba(239, 135, 64, 0.5);
-        }
-
-        .tooltip-content {
-            position: absolute;
-            bottom: 130%;
-            left: 50%;
-            transform: translateX(-50%);
-            background: linear-gradient(145deg, #2c3e50, #34495e);
-            color: white;
-            padding: 16px 20px;
-            border-radius: 12px;
-            white-space: nowrap;
-            opacity: 0;
-            visibility: hidden;
-            transition: all 0.3s cubic-bezier(0.68, -0.55, 0.265, 1.55);
-            z-index: 1000;
-            min-width: 460px;
-            max-width: 540px;
-            white-space: normal;
-            text-align: left;
-            font-size: 13px;
-            line-height: 1.4;
-            box-shadow: 0 10px 30px rgba(0, 0, 0, 0.3);
-            border: 1px solid rgba(255, 255, 255, 0.1);
-        }
-
-        .tooltip-arrow {
-            position: absolute;
-            top: 100%;
-            left: 50%;
-            transform: translateX(-50%);
-            width: 0;
-            height: 0;
-            border-left: 8px solid transparent;
-            border-right: 8px solid transparent;
-            border-top: 8px solid #2c3e50;
-        }
-
-        .tooltip-container:hover .tooltip-content {
-            opacity: 1;
-            visibility: visible;
-            transform: translateX(-50%) translateY(-5px);
-        }
-
-        @media (max-width: 768px) {
-            .tooltip-content {
-                min-width: 390px;
-                font-size: 12px;
-                padding: 14px 16px;
-            }
-        }
-    </style>
     ''', unsafe_allow_html=True)
 
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        total_pedidos = len(scs_filtered)
-        st.markdown(create_kpi_card(total_pedidos, "Total de Pedidos", "number"), unsafe_allow_html=True)
+        st.markdown(create_kpi_card(kpis['total_pedidos'], "Total de Pedidos", "number"), unsafe_allow_html=True)
 
     with col2:
-        total_fornecedores = scs_filtered['Fornecedor'].nunique() if 'Fornecedor' in scs_filtered.columns else 0
-        st.markdown(create_kpi_card(total_fornecedores, "Fornecedores Ativos", "number"), unsafe_allow_html=True)
+        st.markdown(create_kpi_card(kpis['total_fornecedores'], "Fornecedores Ativos", "number"),
+                    unsafe_allow_html=True)
 
     with col3:
-        # Calcular saving percentage de forma segura
-        if not saving_df.empty:
-            valor_inicial_col = find_column(saving_df, ['VALOR INICIAL', 'Valor Inicial', 'Valor_Inicial'])
-            saving_col = find_column(saving_df, ['Redução R$', 'Reducao R$', 'Saving', 'Economia'])
-
-            if saving_col:
-                saving_percentage = (saving_df[saving_col].sum() / scs_filtered['Valor'].sum() * 100)
-            else:
-                saving_percentage = 0
-        else:
-            saving_percentage = 0
-        st.markdown(create_kpi_card(saving_percentage, "% Saving Médio", "percentage"), unsafe_allow_html=True)
+        st.markdown(create_kpi_card(kpis['saving_percentage'], "% Saving Médio", "percentage"),
+                    unsafe_allow_html=True)
 
     with col4:
-        pedidos_com_saving = len(saving_df) if not saving_df.empty else 0
-        st.markdown(create_kpi_card(pedidos_com_saving, "Pedidos c/ Saving", "number"), unsafe_allow_html=True)
+        st.markdown(create_kpi_card(kpis['pedidos_com_saving'], "Pedidos c/ Saving", "number"),
+                    unsafe_allow_html=True)
 
     # === SEÇÃO: TOP PRODUTOS POR CATEGORIA ===
     st.markdown('''
@@ -2621,7 +3024,7 @@ def main():
         🏆 Top Produtos por Categoria (Top 10)
         <span class="tooltip-container">
             <span class="help-icon">?</span>
-            <div class="tooltip-content">
+            <div class="tooltip-content" style="--tooltip-min: 480px; --tooltip-max: 560px; --tooltip-min-mobile: 400px;">
                 <div class="tooltip-arrow"></div>
                 <strong>Top Produtos por Categoria (Top 10)</strong><br><br>
                 Análise detalhada que identifica os 5 produtos mais caros dentro de cada uma das 10 categorias que mais consomem recursos, permitindo foco nas negociações de maior impacto.<br><br>
@@ -2632,136 +3035,33 @@ def main():
             </div>
         </span>
     </div>
-
-    <style>
-        .tooltip-container {
-            position: relative;
-            display: inline-block;
-            margin-left: 8px;
-        }
-
-        .help-icon {
-            display: inline-flex;
-            align-items: center;
-            justify-content: center;
-            width: 18px;
-            height: 18px;
-            background: linear-gradient(135deg, #EF8740, #FF6B35);
-            color: white;
-            border-radius: 50%;
-            font-size: 12px;
-            font-weight: bold;
-            cursor: help;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 8px rgba(239, 135, 64, 0.3);
-        }
-
-        .help-icon:hover {
-            transform: scale(1.1);
-            box-shadow: 0 4px 15px rgba(239, 135, 64, 0.5);
-        }
-
-        .tooltip-content {
-            position: absolute;
-            bottom: 130%;
-            left: 50%;
-            transform: translateX(-50%);
-            background: linear-gradient(145deg, #2c3e50, #34495e);
-            color: white;
-            padding: 16px 20px;
-            border-radius: 12px;
-            white-space: nowrap;
-            opacity: 0;
-            visibility: hidden;
-            transition: all 0.3s cubic-bezier(0.68, -0.55, 0.265, 1.55);
-            z-index: 1000;
-            min-width: 480px;
-            max-width: 560px;
-            white-space: normal;
-            text-align: left;
-            font-size: 13px;
-            line-height: 1.4;
-            box-shadow: 0 10px 30px rgba(0, 0, 0, 0.3);
-            border: 1px solid rgba(255, 255, 255, 0.1);
-        }
-
-        .tooltip-arrow {
-            position: absolute;
-            top: 100%;
-            left: 50%;
-            transform: translateX(-50%);
-            width: 0;
-            height: 0;
-            border-left: 8px solid transparent;
-            border-right: 8px solid transparent;
-            border-top: 8px solid #2c3e50;
-        }
-
-        .tooltip-container:hover .tooltip-content {
-            opacity: 1;
-            visibility: visible;
-            transform: translateX(-50%) translateY(-5px);
-        }
-
-        @media (max-width: 768px) {
-            .tooltip-content {
-                min-width: 400px;
-                font-size: 12px;
-                padding: 14px 16px;
-            }
-        }
-    </style>
     ''', unsafe_allow_html=True)
 
-    # Verificar se existe a coluna Categoria e Descrição
-    categoria_col = find_column(scs_filtered, ['Categoria', 'CATEGORIA', 'Category'])
-    descricao_col = find_column(scs_filtered, ['Descrição', 'DESCRIÇÃO', 'Descricao', 'Description', 'Produto'])
+    # Verificar se existe a coluna Categoria e Descrição (só dependem das colunas das SCs)
+    categoria_col, descricao_col = ctx.memo('resumo_colunas', lambda: (
+        find_column(ctx.scs_filtered, ['Categoria', 'CATEGORIA', 'Category']),
+        find_column(ctx.scs_filtered, ['Descrição', 'DESCRIÇÃO', 'Descricao', 'Description', 'Produto'])
+    ), campos=())
 
     if categoria_col and descricao_col:
-        # Calcular top 10 categorias por gasto total
-        top_categorias = scs_filtered.groupby(categoria_col)['Valor'].sum().reset_index()
-        top_categorias = top_categorias.sort_values('Valor', ascending=False).head(10)
-
-        st.markdown(f"#### 📊 Análise das {len(top_categorias)} categorias com maior gasto")
-
-        # Para cada categoria do top 10, encontrar os top 5 produtos
-        for idx, categoria_row in top_categorias.iterrows():
-            categoria_nome = categoria_row[categoria_col]
-            categoria_valor = categoria_row['Valor']
-
-            # Filtrar produtos dessa categoria
-            produtos_categoria = scs_filtered[scs_filtered[categoria_col] == categoria_nome]
-
-            # Calcular top 5 produtos por gasto total na categoria
-            top_produtos = produtos_categoria.groupby(descricao_col)['Valor'].agg(['sum', 'count']).reset_index()
-            top_produtos.columns = ['Produto', 'Valor Total', 'Quantidade Pedidos']
-            top_produtos = top_produtos.sort_values('Valor Total', ascending=False).head(5)
+        produtos = ctx.memo('secao_resumo_produtos', lambda: top_products_data(ctx, categoria_col, descricao_col))
 
-            # Calcular percentual em relação ao total da categoria
-            top_produtos['% da Categoria'] = (top_produtos['Valor Total'] / categoria_valor * 100).round(1)
+        st.markdown(f"#### 📊 Análise das {len(produtos['categorias'])} categorias com maior gasto")
 
-            # Formatar valores para exibição
-            top_produtos['Valor Formatado'] = top_produtos['Valor Total'].apply(lambda x: f"R$ {x:,.2f}")
-            top_produtos['% Formatado'] = top_produtos['% da Categoria'].apply(lambda x: f"{x}%")
+        if produtos['resumo_outros']:
+            st.caption(produtos['resumo_outros'])
 
+        for categoria in produtos['categorias']:
             # Criar expander para cada categoria
-            with st.expander(f"🔍 **{categoria_nome}** - Total: R$ {categoria_valor:,.2f}", expanded=False):
+            with st.expander(f"🔍 **{categoria['nome']}** - Total: R$ {categoria['valor']:,.2f}", expanded=False):
                 # Exibir tabela dos top 5 produtos
-                tabela_exibicao = top_produtos[
-                    ['Produto', 'Valor Formatado', '% Formatado', 'Quantidade Pedidos']].copy()
-                tabela_exibicao.columns = ['📦 Produto', '💰 Valor Total', '📊 % da Categoria', '🔢 Qtd Pedidos']
-
-                # Resetar index para mostrar ranking
-                tabela_exibicao.index = range(1, len(tabela_exibicao) + 1)
-
-                st.dataframe(tabela_exibicao, use_container_width=True)
+                st.dataframe(categoria['tabela'], use_container_width=True)
 
                 # Mostrar resumo da categoria
-                total_produtos_categoria = len(produtos_categoria[descricao_col].unique())
                 st.markdown(f"""
                 <div style="background: rgba(239, 135, 64, 0.1); padding: 0.5rem; border-radius: 5px; margin-top: 0.5rem;">
-                    <small><strong>Resumo:</strong> {total_produtos_categoria} produtos únicos | 
-                    Top 5 representa {top_produtos['% da Categoria'].sum():.1f}% do gasto da categoria</small>
+                    <small><strong>Resumo:</strong> {categoria['produtos_unicos']} produtos únicos | 
+                    Top 5 representa {categoria['percentual_top']:.1f}% do gasto da categoria</small>
                 </div>
                 """, unsafe_allow_html=True)
 
@@ -2775,5 +3075,270 @@ def main():
         st.error(f"❌ **Análise não disponível.**")
         st.error(f"**Colunas não encontradas:** {', '.join(missing_cols)}")
 
+
+# Seções do dashboard: só a escolhida é calculada e desenhada a cada execução
+DASHBOARD_SECTIONS = {
+    '💰 Gastos': render_spend_section,
+    '⏱️ TMC': render_tmc_section,
+    '💳 PMPS': render_pmps_section,
+    '⚖️ PMPP': render_pmpp_section,
+    '🏢 Fornecedores': render_suppliers_section,
+    '📦 Categorias': render_categories_section,
+    '🎯 Prioridades': render_priorities_section,
+    '💎 Savings': render_savings_section,
+    '🔍 Auditoria': render_audit_section,
+    '📈 Resumo Executivo': render_summary_section
+}
+
+
+@st.fragment
+def render_dashboard(scs_df, saving_df, upload_info, versao_dados):
+    """Filtros da sidebar e seção escolhida; mudar um filtro reexecuta só este fragmento"""
+    # Filtro por comprador
+    compradores = ['Todos'] + list(scs_df['Comprador'].unique())
+    comprador_selecionado = st.sidebar.selectbox("Comprador:", compradores)
+
+    # Carregar dimensão de datas para filtros
+    dim_datas = load_date_dimension()
+
+    if dim_datas is not None and not dim_datas.empty:
+        # Usar min/max da dimensão de datas
+        data_min = dim_datas['data_key'].min().date()
+        data_max = dim_datas['data_key'].max().date()
+
+        # Filtros de período usando dimensão
+        st.sidebar.markdown("### 📅 Período")
+        data_inicio = st.sidebar.date_input("Data Início:", data_min, min_value=data_min, max_value=data_max)
+        data_fim = st.sidebar.date_input("Data Fim:", data_max, min_value=data_min, max_value=data_max)
+
+        # Filtros adicionais da dimensão
+        st.sidebar.markdown("### 📊 Filtros Temporais")
+
+        # Filtro por trimestre
+        trimestres_disponiveis = sorted(dim_datas['trimestre'].unique())
+        trimestres_selecionados = st.sidebar.multiselect(
+            "Trimestres:",
+            trimestres_disponiveis,
+            default=trimestres_disponiveis,
+            format_func=lambda x: f"Q{x}"
+        )
+
+        # Filtro por mês
+        meses_disponiveis = sorted(dim_datas['mes'].unique())
+        meses_selecionados = st.sidebar.multiselect(
+            "Meses:",
+            meses_disponiveis,
+            default=meses_disponiveis,
+            format_func=lambda x: ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun',
+                                   'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez'][x - 1]
+        )
+
+        # Filtro por dia da semana
+        incluir_fins_semana = st.sidebar.checkbox("Incluir fins de semana", value=True)
+
+    else:
+        # Fallback para método original se dimensão não estiver disponível
+        st.sidebar.warning("⚠️ Dimensão de datas não disponível. Usando filtros básicos.")
+        data_inicio = st.sidebar.date_input("Data Início:", min(scs_df['Data']))
+        data_fim = st.sidebar.date_input("Data Fim:", max(scs_df['Data']))
+        trimestres_selecionados = None
+        meses_selecionados = None
+        incluir_fins_semana = True
+
+    # Selecionar as linhas pelos filtros de calendário e comprador nos índices das abas ordenadas por data
+    selecoes = select_filtered_rows(
+        scs_df, saving_df, data_inicio, data_fim, trimestres_selecionados,
+        meses_selecionados, incluir_fins_semana, comprador_selecionado, versao_dados
+    )
+
+    # Recortes, cubo e agregados ficam por conta das seções, calculados só quando a seção é aberta
+    ctx = DashboardContext(
+        scs_df, saving_df, selecoes, upload_info,
+        {
+            'data_inicio': data_inicio,
+            'data_fim': data_fim,
+            'trimestres_selecionados': trimestres_selecionados,
+            'meses_selecionados': meses_selecionados,
+            'incluir_fins_semana': incluir_fins_semana,
+            'comprador_selecionado': comprador_selecionado
+        },
+        versao_dados
+    )
+
+    secao = st.radio("Seção:", list(DASHBOARD_SECTIONS), horizontal=True, key='secao')
+    DASHBOARD_SECTIONS[secao](ctx)
+
+
+# Função principal
+def main():
+    # Inicializar banco de dados
+    init_database()
+
+    # Container simples com logo e título centralizados
+    st.markdown("""
+    <div style="text-align: center; padding: 1rem 0 2rem 0; margin-bottom: 1rem;">
+    """, unsafe_allow_html=True)
+
+    # Logo centralizada
+    logo_path = r"C:\Users\Pedro Curry\OneDrive\Área de Trabalho\Logos - B.I\Logo Mobi.jpeg"
+
+    if os.path.exists(logo_path):
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col2:
+            st.image(logo_path, width=300)
+
+    # Título centralizado logo abaixo
+    st.markdown("""
+    <h1 style="font-size: clamp(1.8rem, 4vw, 2.5rem); font-weight: 700; 
+               color: #EF8740; text-align: center; margin: 1.5rem 0 0 0; 
+               text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
+               background: linear-gradient(135deg, #EF8740 0%, #000000 100%);
+               -webkit-background-clip: text; -webkit-text-fill-color: transparent;
+               background-clip: text;">
+        🚛 Dashboard Supply Chain - Mobi Transportes
+    </h1>
+    """, unsafe_allow_html=True)
+
+    st.markdown("</div>", unsafe_allow_html=True)
+
+    # Upload do arquivo
+    st.markdown("### 📁 Upload do Arquivo de Dados")
+    uploaded_file = st.file_uploader(
+        "Faça upload do arquivo 'KPIs- Compras (Base de Dados).xlsx'",
+        type=['xlsx', 'xls'],
+        help="Arquivo deve conter as abas 'SC's' e 'Saving'"
+    )
+
+    # Modo de atualização do banco
+    nomes_modos = {
+        'incremental': "Incremental (atualiza os pedidos presentes na planilha)",
+        'substituir': "Substituir tudo (recarga completa)"
+    }
+    modo_atualizacao = st.radio(
+        "Modo de atualização:",
+        ['incremental', 'substituir'],
+        format_func=nomes_modos.get,
+        horizontal=True,
+        help=("No modo incremental cada pedido da planilha substitui as linhas gravadas do pedido (linhas "
+              "novas, alteradas ou removidas); pedidos ausentes da planilha são mantidos. Para remover "
+              "pedidos inteiros, use a recarga completa")
+    )
+
+    # Carregar dados
+    scs_df = None
+    saving_df = None
+    upload_info = None
+    versao_dados = None
+
+    # Identificar o arquivo pelo conteúdo para não reprocessar uploads repetidos
+    file_hash = get_upload_hash(uploaded_file) if uploaded_file is not None else None
+
+    if file_hash is not None and is_upload_already_loaded(file_hash, modo_atualizacao):
+        # Mesmo conteúdo e modo do último upload: usar o banco sem reprocessar o arquivo
+        scs_df, saving_df, upload_info = load_from_database()
+
+        st.info(f"♻️ Arquivo '{uploaded_file.name}' ignorado: o mesmo conteúdo já foi carregado no modo "
+                f"\"{nomes_modos[modo_atualizacao]}\". Nenhum reprocessamento necessário.")
+        display_last_update_info(upload_info)
+        st.markdown("---")
+    elif uploaded_file is not None:
+        # Processar novo upload
+        if uploaded_file.name.lower().endswith('.xlsx'):
+            # Planilhas .xlsx: abas lidas em paralelo ou, em máquina de um processador, em streaming
+            progresso = st.progress(0.0, text="📥 Processando arquivo...")
+
+            def atualizar_progresso(aba, linhas, total_linhas):
+                fracao = min(linhas / total_linhas, 1.0) if total_linhas else 0.0
+                progresso.progress(fracao, text=f"📥 Aba {aba}: {linhas:,} linhas gravadas")
+
+            success, result = ingest_workbook(uploaded_file, uploaded_file.name, file_hash,
+                                              atualizar_progresso, modo_atualizacao)
+            progresso.empty()
+        else:
+            # Planilhas .xls não têm leitura em streaming e são carregadas inteiras
+            scs_df, saving_df = load_data(file_hash, uploaded_file)
+
+            if scs_df is not None and saving_df is not None:
+                # Salvar no banco de dados
+                success, result = save_to_database(scs_df, saving_df, uploaded_file.name, file_hash,
+                                                   modo_atualizacao)
+            else:
+                success, result = None, None
+        # Adicione este código logo após o título principal, antes dos filtros da sidebar
+
+        if upload_info is not None and not upload_info.empty:
+            last_update = pd.to_datetime(upload_info.iloc[0]['last_update'])
+            formatted_date = last_update.strftime("%d/%m/%Y às %H:%M")
+
+            st.markdown(f"""
+           <div style="background: linear-gradient(135deg, #EF8740 0%, #000000 90%); 
+                       color: white; padding: 1rem; border-radius: 8px; margin: 1rem 0;
+                       text-align: center; box-shadow: 0 2px 10px rgba(239, 135, 64, 0.3);">
+               <h4 style="margin: 0; font-weight: 600;">📅 Última Atualização: {formatted_date}</h4>
+           </div>
+           """, unsafe_allow_html=True)
+
+        if success:
+            st.success("✅ Arquivo carregado e salvo no banco de dados com sucesso!")
+            st.markdown("---")
+
+            # Limpar cache para forçar reload dos dados
+            load_from_database.clear()
+            load_date_dimension.clear()
+
+            # Carregar dados atualizados do banco
+            scs_df, saving_df, upload_info = load_from_database()
+
+            # Mostrar informações da atualização
+            display_last_update_info(upload_info)
+
+        elif success is None:
+            st.error("❌ Erro ao carregar o arquivo. Verifique se ele contém as abas 'SC's' e 'Saving'.")
+        else:
+            st.error(f"❌ Erro ao salvar no banco de dados: {result}")
+
+            if scs_df is None:
+                # A carga em streaming é desfeita por inteiro; seguir com os dados já salvos
+                scs_df, saving_df, upload_info = load_from_database()
+                st.markdown("### 🔍 Usando dados já salvos no banco")
+            else:
+                scs_df, saving_df = apply_categorical_schema(scs_df, saving_df)
+                scs_df, saving_df = sort_by_date(scs_df), sort_by_date(saving_df)
+                versao_dados = file_hash
+                st.markdown("### 🔍 Usando dados do upload atual")
+    else:
+        # Tentar carregar dados existentes do banco
+        scs_df, saving_df, upload_info = load_from_database()
+
+        if scs_df is not None and saving_df is not None:
+            st.info("📤 Dados carregados do banco de dados local. Faça upload de um novo arquivo para atualizar.")
+            # Mostrar informações da última atualização
+            display_last_update_info(upload_info)
+            st.markdown("---")
+        else:
+            st.info("📤 Por favor, faça upload do arquivo Excel para começar a análise.")
+            st.markdown("---")
+            st.markdown("### 🔍 Preview com Dados de Exemplo")
+            st.info("Enquanto isso, você pode ver como o dashboard funciona com dados de exemplo:")
+
+            # Usar dados de exemplo
+            scs_df, saving_df = create_sample_data()
+            versao_dados = 'exemplo'
+            st.warning("⚠️ Os dados mostrados abaixo são apenas exemplos para demonstração.")
+
+    # Sidebar com filtros baseados na tabela calendário
+    if scs_df is not None and not scs_df.empty:
+        if upload_info is not None and not upload_info.empty:
+            # Dados do banco: a versão é o upload que gerou o snapshot
+            versao_dados = f"{upload_info.iloc[0]['id']}-{upload_info.iloc[0]['last_update']}"
+
+        st.sidebar.markdown("## 🔧 Filtros")
+
+        # Filtros e seções reexecutam como fragmentos, sem repetir upload e inicialização do banco
+        render_dashboard(scs_df, saving_df, upload_info, versao_dados)
+
+    else:
+        st.info("ℹ️ Nenhum dado disponível para exibir.")
+
 if __name__ == "__main__":
     main()
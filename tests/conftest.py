@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Banco dos testes num diretório temporário, definido antes de o app ser importado
+os.environ.setdefault('SUPPLY_CHAIN_DB', os.path.join(tempfile.mkdtemp(prefix='supplymobi_'), 'supply_chain.db'))
+
+# O app é um módulo na raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
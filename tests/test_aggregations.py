@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from supplymobi import OUTROS_LABEL, safe_divide, sum_by_dimensions, top_n_with_outros
+
+
+def test_safe_divide_scalars():
+    assert safe_divide(10, 4) == 2.5
+    assert np.isnan(safe_divide(10, 0))
+    assert np.isnan(safe_divide(0.0, 0.0))
+
+
+def test_safe_divide_arrays():
+    resultado = safe_divide(np.array([10, 5, 0]), np.array([4, 0, 0]))
+
+    assert isinstance(resultado, np.ndarray)
+    np.testing.assert_array_equal(resultado, [2.5, np.nan, np.nan])
+
+
+def test_safe_divide_array_by_scalar():
+    np.testing.assert_array_equal(safe_divide(np.array([1.0, 2.0]), 0), [np.nan, np.nan])
+    np.testing.assert_array_equal(safe_divide(np.array([1.0, 2.0]), 2), [0.5, 1.0])
+
+
+def test_safe_divide_series():
+    numerador = pd.Series([10.0, 5.0, 3.0], index=['a', 'b', 'c'])
+    denominador = pd.Series([0.0, 4.0, 2.0], index=['c', 'a', 'b'])
+
+    resultado = safe_divide(numerador, denominador)
+
+    # O denominador é alinhado pelo índice, não pela posição
+    pd.testing.assert_series_equal(resultado, pd.Series([2.5, 2.5, np.nan], index=['a', 'b', 'c']))
+
+
+def test_safe_divide_series_by_array_and_scalar():
+    numerador = pd.Series([10.0, 5.0], index=['x', 'y'])
+
+    pd.testing.assert_series_equal(safe_divide(numerador, np.array([2.0, 0.0])),
+                                   pd.Series([5.0, np.nan], index=['x', 'y']))
+    assert safe_divide(numerador, 0).isna().all()
+
+
+def test_ranking_totals_include_missing_keys():
+    cubo = pd.DataFrame({
+        'Fornecedor': pd.Categorical(['F1', None, 'F2', 'F3', None]),
+        'Categoria': ['C1', 'C1', None, 'C2', 'C2'],
+        'valor': [100.0, 40.0, 30.0, 20.0, 10.0],
+    })
+
+    somas = sum_by_dimensions(cubo, ['Fornecedor', 'Categoria'])
+
+    for dimensao in ['Fornecedor', 'Categoria']:
+        assert somas[dimensao].sum() == cubo['valor'].sum()
+
+        # A chave ausente não entra no top n, mas a soma dela fica em 'Outros'
+        ranking = top_n_with_outros(somas[dimensao], 2, dimensao)
+        assert ranking['Valor'].sum() == cubo['valor'].sum()
+        assert ranking[~ranking['Outros']][dimensao].notna().all()
+
+    ranking = top_n_with_outros(somas['Fornecedor'], 2, 'Fornecedor')
+    assert list(ranking['Fornecedor']) == ['F1', 'F2', OUTROS_LABEL]
+    assert list(ranking['Valor']) == [100.0, 30.0, 70.0]
@@ -0,0 +1,70 @@
+import sqlite3
+
+import pandas as pd
+
+from supplymobi import classify_orders, join_orders, refresh_audit_results, sort_by_date
+
+# Pedido 100 com duas linhas: a primeira da planilha tem data mais recente que a segunda
+SCS_PLANILHA = pd.DataFrame({
+    'Data': pd.to_datetime(['2025-03-10', '2025-03-01', '2025-03-05']),
+    'Pedido': [100, 100, 200],
+    'Valor': [150.0, 90.0, 40.0],
+})
+
+SAVING = pd.DataFrame({
+    'Data': pd.to_datetime(['2025-03-10', '2025-03-05']),
+    'Número Pedido': [100, 200],
+    'VALOR FINAL': [150.0, 40.0],
+})
+
+
+def first_line_values(scs_df):
+    """Valor SC's da estratégia 'primeira' por pedido do Saving"""
+    conciliacao = join_orders(SAVING, scs_df, 'Número Pedido', 'Pedido', 'VALOR FINAL', 'Valor', 'Data', 'Data')
+    classificada = classify_orders(conciliacao, 0.01, 'primeira')
+    return dict(zip(classificada['Pedido'], classificada['Valor SC\'s']))
+
+
+def test_first_line_follows_sheet_order_in_memory():
+    # As abas em memória são ordenadas por data; a primeira linha continua sendo a da planilha
+    assert first_line_values(sort_by_date(SCS_PLANILHA)) == {100: 150.0, 200: 40.0}
+
+
+def test_first_line_follows_line_and_id_from_database():
+    # Frames do banco vêm ordenados por data, com a posição da linha no pedido e o id
+    scs_df = SCS_PLANILHA.assign(id=[1, 2, 3], linha=[0, 1, 0]).iloc[[1, 2, 0]].reset_index(drop=True)
+
+    assert first_line_values(scs_df) == {100: 150.0, 200: 40.0}
+
+
+def test_first_line_follows_sheet_order_in_sql():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE scs (id INTEGER PRIMARY KEY, data DATE, pedido INTEGER, valor REAL, linha INTEGER)')
+    conn.execute('''
+        CREATE TABLE saving (id INTEGER PRIMARY KEY, data DATE, numero_pedido INTEGER,
+                             valor_final REAL, comprador TEXT)
+    ''')
+    conn.execute('''
+        CREATE TABLE audit_results (saving_id INTEGER, pedido INTEGER, comprador TEXT, data DATE,
+                                    valor_final REAL, linhas_sc INTEGER, valor_scs REAL,
+                                    valor_scs_soma REAL, data_scs DATE)
+    ''')
+    conn.executemany('INSERT INTO scs (data, pedido, valor, linha) VALUES (?, ?, ?, ?)', [
+        ('2025-03-10 00:00:00', 100, 150.0, 0),
+        ('2025-03-01 00:00:00', 100, 90.0, 1),
+        ('2025-03-05 00:00:00', 200, 40.0, 0),
+    ])
+    conn.executemany('INSERT INTO saving (data, numero_pedido, valor_final) VALUES (?, ?, ?)', [
+        ('2025-03-10 00:00:00', 100, 150.0),
+        ('2025-03-05 00:00:00', 200, 40.0),
+    ])
+
+    refresh_audit_results(conn)
+
+    resultado = conn.execute('''
+        SELECT pedido, valor_scs, data_scs, linhas_sc, valor_scs_soma FROM audit_results ORDER BY pedido
+    ''').fetchall()
+    assert resultado == [
+        (100, 150.0, '2025-03-10 00:00:00', 2, 240.0),
+        (200, 40.0, '2025-03-05 00:00:00', 1, 40.0),
+    ]
@@ -0,0 +1,58 @@
+import threading
+
+from supplymobi import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used_within_budget():
+    cache = LRUCache(100)
+    cache.put('a', 1, 40)
+    cache.put('b', 2, 40)
+
+    # 'a' usado por último: 'b' é o primeiro a sair quando o orçamento estoura
+    assert cache.get('a') == 1
+    cache.put('c', 3, 40)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.bytes == 80
+
+
+def test_lru_cache_replaces_existing_key_and_skips_oversized_values():
+    cache = LRUCache(100)
+    cache.put('a', 1, 60)
+    cache.put('a', 2, 30)
+    assert (cache.get('a'), cache.bytes) == (2, 30)
+
+    # Maior que o orçamento inteiro: não é guardado nem descarta as demais entradas
+    cache.put('grande', 3, 101)
+    assert cache.get('grande') is None
+    assert (cache.get('a'), cache.bytes) == (2, 30)
+
+
+def test_lru_cache_evicts_several_entries_for_a_large_value():
+    cache = LRUCache(100)
+    for chave in 'abcd':
+        cache.put(chave, chave, 25)
+
+    cache.put('e', 'e', 70)
+
+    assert [cache.get(chave) for chave in 'abcde'] == [None, None, None, 'd', 'e']
+    assert cache.bytes == 95
+
+
+def test_lru_cache_stays_within_budget_under_concurrent_puts():
+    cache = LRUCache(1000)
+
+    def gravar(inicio):
+        for i in range(inicio, inicio + 500):
+            cache.put(i, i, 7)
+            cache.get(i - 3)
+
+    threads = [threading.Thread(target=gravar, args=(inicio,)) for inicio in range(0, 4000, 500)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cache.bytes <= 1000
+    assert cache.bytes == 7 * sum(cache.get(i) is not None for i in range(4000))
@@ -0,0 +1,54 @@
+import pandas as pd
+
+from supplymobi import build_calendar_frame, get_connection_manager, init_database, save_to_database
+
+MESES = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+         'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+DIAS_SEMANA = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+
+
+def test_calendar_frame_matches_timestamp_attributes():
+    # Virada de ano e 29 de fevereiro
+    calendario = build_calendar_frame('2023-12-25', '2024-03-05')
+
+    assert len(calendario) == 72
+    for linha in calendario.itertuples(index=False):
+        data = pd.Timestamp(linha.data_key)
+
+        assert (linha.ano, linha.mes, linha.dia) == (data.year, data.month, data.day)
+        assert linha.nome_mes == MESES[data.month - 1]
+        assert linha.trimestre == data.quarter
+        assert linha.semestre == (1 if data.month <= 6 else 2)
+        assert linha.dia_semana == data.weekday()
+        assert linha.nome_dia_semana == DIAS_SEMANA[data.weekday()]
+        assert linha.dia_ano == data.dayofyear
+        assert linha.semana_ano == data.isocalendar()[1]
+        assert linha.eh_fim_semana == (data.weekday() >= 5)
+        assert linha.eh_inicio_mes == (data.day == 1)
+        assert linha.eh_fim_mes == data.is_month_end
+
+
+def test_upload_extends_the_date_dimension_without_gaps():
+    init_database()
+    saving = pd.DataFrame({'Data': pd.to_datetime(['2025-03-10']), 'Número Pedido': [100], 'VALOR FINAL': [1.0]})
+
+    def upload(datas, mode):
+        scs = pd.DataFrame({'Data': pd.to_datetime(datas), 'Pedido': [100] * len(datas), 'Valor': [1.0] * len(datas)})
+        assert save_to_database(scs, saving, 'planilha.xlsx', mode=mode)[0]
+
+        with get_connection_manager().read() as conn:
+            return conn.execute('SELECT MIN(data_key), MAX(data_key), COUNT(*) FROM dim_datas').fetchone()
+
+    upload(['2025-03-10'], 'substituir')
+
+    # Datas novas antes e depois do período já coberto
+    inicio, fim, dias = upload(['2023-06-01', '2025-03-10', '2027-01-05'], 'incremental')
+
+    assert inicio <= '2023-06-01' and fim >= '2027-01-05'
+    assert dias == (pd.Timestamp(fim) - pd.Timestamp(inicio)).days + 1
+
+    with get_connection_manager().read() as conn:
+        linha = conn.execute('''
+            SELECT trimestre, nome_mes, nome_dia_semana, eh_fim_semana FROM dim_datas WHERE data_key = '2027-01-03'
+        ''').fetchone()
+    assert linha == (1, 'Janeiro', 'Domingo', 1)
@@ -0,0 +1,109 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from supplymobi import BitmapIndex, DateIndex, select_filtered_rows, sort_by_date
+
+
+def sheet(linhas, seed):
+    """Aba ordenada por Data, com datas ausentes e alguns compradores"""
+    rng = np.random.default_rng(seed)
+    datas = pd.Series(pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 730, linhas), unit='D')
+                      + pd.to_timedelta(rng.integers(0, 24, linhas), unit='h'))
+    datas[rng.random(linhas) < 0.05] = pd.NaT
+    return sort_by_date(pd.DataFrame({
+        'Data': datas,
+        'Comprador': rng.choice(['ANA', 'CARLOS', 'JOAO'], linhas),
+        'Valor': rng.random(linhas),
+    }))
+
+
+def positions(selecao, linhas):
+    """Posições das linhas de uma seleção (fatia ou array de posições)"""
+    return np.arange(linhas)[selecao]
+
+
+def pandas_rows(df, data_inicio, data_fim, trimestres=None, meses=None, incluir_fins_semana=True,
+                comprador='Todos'):
+    """Mesma seleção feita com máscaras booleanas do pandas"""
+    dias = df['Data'].dt.normalize()
+    mascara = (dias >= pd.Timestamp(data_inicio)) & (dias <= pd.Timestamp(data_fim))
+    if trimestres:
+        mascara &= df['Data'].dt.quarter.isin(trimestres)
+    if meses:
+        mascara &= df['Data'].dt.month.isin(meses)
+    if not incluir_fins_semana:
+        mascara &= df['Data'].dt.dayofweek < 5
+    if comprador != 'Todos':
+        mascara &= df['Comprador'] == comprador
+    return np.flatnonzero(mascara.to_numpy())
+
+
+SCS = sheet(1000, 1)
+SAVING = sheet(203, 2)
+
+
+@pytest.mark.parametrize('data_inicio, data_fim', [
+    (date(2024, 3, 1), date(2024, 3, 31)),     # fim inclusive, com horas no último dia
+    (date(2024, 5, 10), date(2024, 5, 10)),    # um único dia
+    (date(2025, 10, 20), date(2025, 1, 2)),    # período invertido
+    (date(2020, 1, 1), date(2023, 12, 31)),    # antes de todas as datas
+    (date(2026, 1, 1), date(2030, 1, 1)),      # depois de todas as datas
+    (date(2000, 1, 1), date(2100, 1, 1)),      # cobre tudo (linhas sem data ficam de fora)
+])
+def test_date_index_matches_pandas_mask(data_inicio, data_fim):
+    linhas = DateIndex(SCS['Data']).range(data_inicio, data_fim)
+
+    np.testing.assert_array_equal(positions(linhas, len(SCS)), pandas_rows(SCS, data_inicio, data_fim))
+
+
+def test_date_index_requires_sorted_dates():
+    with pytest.raises(ValueError):
+        DateIndex(pd.to_datetime(['2025-03-10', '2025-03-01']))
+
+
+@pytest.mark.parametrize('versao', [None, 'teste'])
+@pytest.mark.parametrize('filtros', [
+    {},
+    {'trimestres': [1, 4]},
+    {'meses': [2, 7, 12]},
+    {'incluir_fins_semana': False},
+    {'comprador': 'CARLOS'},
+    {'comprador': 'NINGUEM'},
+    {'trimestres': [2], 'meses': [5, 6, 9], 'incluir_fins_semana': False, 'comprador': 'ANA'},
+])
+def test_select_filtered_rows_matches_pandas_mask(versao, filtros):
+    for data_inicio, data_fim in [(date(2024, 1, 1), date(2025, 12, 31)), (date(2024, 2, 3), date(2024, 11, 17)),
+                                  (date(2025, 6, 1), date(2024, 6, 1))]:
+        selecoes = select_filtered_rows(
+            SCS, SAVING, data_inicio, data_fim, filtros.get('trimestres'), filtros.get('meses'),
+            filtros.get('incluir_fins_semana', True), filtros.get('comprador', 'Todos'), versao=versao
+        )
+
+        for df, selecao in zip((SCS, SAVING), selecoes):
+            np.testing.assert_array_equal(positions(selecao, len(df)),
+                                          pandas_rows(df, data_inicio, data_fim, **filtros))
+
+
+@pytest.mark.parametrize('linhas', [1, 7, 8, 9, 203])
+def test_bitmap_index_round_trip_on_partial_bytes(linhas):
+    df = sheet(linhas, linhas)
+    bitmaps = BitmapIndex(df, DateIndex(df['Data']).ordinais)
+
+    # Fatias começando e terminando no meio de um byte, inclusive vazias
+    for inicio in range(0, linhas + 1, 3):
+        for fim in (inicio, inicio + 1, inicio + 5, linhas):
+            fatia = slice(inicio, min(fim, linhas))
+            esperado = np.arange(linhas)[fatia]
+
+            np.testing.assert_array_equal(positions(bitmaps.select(fatia), linhas), esperado)
+            np.testing.assert_array_equal(
+                positions(bitmaps.select(fatia, comprador_selecionado='ANA'), linhas),
+                esperado[(df['Comprador'].to_numpy() == 'ANA')[fatia]]
+            )
+            np.testing.assert_array_equal(
+                positions(bitmaps.select(fatia, meses_selecionados=[1, 2, 3], incluir_fins_semana=False), linhas),
+                esperado[((df['Data'].dt.month <= 3) & (df['Data'].dt.dayofweek < 5)).to_numpy()[fatia]]
+            )
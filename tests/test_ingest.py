@@ -0,0 +1,149 @@
+from io import BytesIO
+
+import pandas as pd
+
+import supplymobi
+from supplymobi import (
+    get_connection_manager, ingest_workbook, init_database, is_upload_already_loaded, refresh_audit_results,
+    refresh_purchase_cube, save_to_database
+)
+
+SAVING = pd.DataFrame({
+    'Data': pd.to_datetime(['2025-03-10']),
+    'Número Pedido': [100],
+    'VALOR FINAL': [150.0],
+})
+
+
+def scs_sheet(linhas):
+    """Aba SC's com uma linha por (pedido, descrição, valor)"""
+    return pd.DataFrame({
+        'Data': pd.to_datetime(['2025-03-10'] * len(linhas)),
+        'Pedido': [pedido for pedido, _, _ in linhas],
+        'Descrição': [descricao for _, descricao, _ in linhas],
+        'Valor': [valor for _, _, valor in linhas],
+    })
+
+
+def upload(linhas, mode):
+    init_database()
+    success, result = save_to_database(scs_sheet(linhas), SAVING, 'planilha.xlsx', mode=mode)
+    assert success, result
+
+    with get_connection_manager().read() as conn:
+        rows = conn.execute('SELECT id, pedido, descricao, valor, linha FROM scs ORDER BY pedido, linha').fetchall()
+        totals = conn.execute('''
+            SELECT total_scs, total_saving FROM upload_control ORDER BY id DESC LIMIT 1
+        ''').fetchone()
+    return rows, totals
+
+
+def test_new_line_on_existing_order_keeps_the_first_line():
+    before, _ = upload([(100, 'A', 10.0), (200, 'C', 5.0)], 'substituir')
+
+    # Planilha com uma linha nova no início do pedido 100
+    after, _ = upload([(100, 'B', 20.0), (100, 'A', 10.0), (200, 'C', 5.0)], 'incremental')
+
+    assert [row[1:] for row in after] == [(100, 'B', 20.0, 0), (100, 'A', 10.0, 1), (200, 'C', 5.0, 0)]
+    # A linha que já existia não foi sobrescrita: mantém o id e só muda de posição
+    assert after[1][0] == before[0][0]
+
+
+def test_lines_removed_from_an_order_are_deleted():
+    upload([(100, 'A', 10.0), (100, 'B', 20.0), (200, 'C', 5.0)], 'substituir')
+
+    # O pedido 100 perdeu a linha A; o pedido 200 não veio na planilha e é mantido
+    after, _ = upload([(100, 'B', 20.0)], 'incremental')
+
+    assert [row[1:] for row in after] == [(100, 'B', 20.0, 0), (200, 'C', 5.0, 0)]
+
+
+def test_repeated_lines_are_kept_apart():
+    upload([(100, 'A', 10.0), (100, 'A', 10.0)], 'substituir')
+
+    after, _ = upload([(100, 'A', 10.0), (100, 'A', 10.0), (100, 'A', 10.0)], 'incremental')
+
+    assert [row[4] for row in after] == [0, 1, 2]
+
+
+def test_upload_control_records_table_totals():
+    upload([(100, 'A', 10.0), (200, 'C', 5.0)], 'substituir')
+
+    _, totals = upload([(300, 'D', 1.0)], 'incremental')
+
+    assert totals == (3, 1)
+
+
+def test_incremental_refresh_matches_full_rebuild():
+    init_database()
+    scs = pd.DataFrame({
+        'Data': pd.to_datetime(['2025-03-10 08:00', '2025-03-10 15:30', '2025-03-11 00:00', None, '2025-03-12 00:00']),
+        'Pedido': [100, 100, 200, 300, 400],
+        'Comprador': ['Ana', 'Ana', 'Bia', 'Bia', 'Ana'],
+        'Valor': [10.0, 20.0, 5.0, 7.0, 3.0],
+    })
+    saving = pd.DataFrame({
+        'Data': pd.to_datetime(['2025-03-10', '2025-03-11', '2025-03-12']),
+        'Número Pedido': [100, 200, None],
+        'VALOR FINAL': [30.0, 5.0, 1.0],
+    })
+    assert save_to_database(scs, saving, 'planilha.xlsx', mode='substituir')[0]
+
+    # Linha alterada no pedido 100, pedido 300 sem data com valor novo e Saving sem pedido alterado
+    scs.loc[1, 'Valor'] = 25.0
+    scs.loc[3, 'Valor'] = 8.0
+    saving.loc[2, 'VALOR FINAL'] = 2.0
+    assert save_to_database(scs.iloc[[1, 0, 3]], saving, 'planilha.xlsx', mode='incremental')[0]
+
+    def tables(conn):
+        return [
+            sorted(conn.execute('SELECT * FROM fato_compras').fetchall(), key=repr),
+            sorted(conn.execute('SELECT * FROM audit_results').fetchall(), key=repr),
+        ]
+
+    with get_connection_manager().write() as conn:
+        incremental = tables(conn)
+        refresh_purchase_cube(conn)
+        refresh_audit_results(conn)
+        full = tables(conn)
+        conn.rollback()
+
+    assert incremental == full
+    assert ('2025-03-10', 'Ana', None, None, None, 2, 35.0) in [row[:7] for row in full[0]]
+
+
+def workbook_file(scs, saving):
+    """Planilha .xlsx em memória com as abas SC's e Saving"""
+    arquivo = BytesIO()
+    with pd.ExcelWriter(arquivo, engine='openpyxl') as writer:
+        scs.to_excel(writer, sheet_name="SC's", index=False)
+        saving.to_excel(writer, sheet_name='Saving', index=False)
+    arquivo.seek(0)
+    return arquivo
+
+
+def test_single_worker_streams_without_pool(monkeypatch):
+    init_database()
+
+    def no_pool():
+        raise AssertionError('pool criado com um único processador')
+
+    monkeypatch.setattr(supplymobi, 'INGEST_WORKERS', 1)
+    monkeypatch.setattr(supplymobi, 'get_ingest_pool', no_pool)
+
+    arquivo = workbook_file(scs_sheet([(100, 'A', 10.0), (200, 'C', 5.0)]), SAVING)
+    success, result = ingest_workbook(arquivo, 'planilha.xlsx', mode='substituir')
+    assert success, result
+
+    with get_connection_manager().read() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM scs').fetchone()[0] == 2
+
+
+def test_same_file_in_another_mode_is_not_skipped():
+    init_database()
+    success, result = save_to_database(scs_sheet([(100, 'A', 10.0)]), SAVING, 'planilha.xlsx', 'abc123', 'incremental')
+    assert success, result
+
+    assert is_upload_already_loaded('abc123', 'incremental')
+    assert not is_upload_already_loaded('abc123', 'substituir')
+    assert not is_upload_already_loaded('outro', 'incremental')
@@ -0,0 +1,53 @@
+from datetime import date
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from supplymobi import (
+    create_kpi_card, init_database, load_cube_from_database, pmps_section_data, rank_products_by_category,
+    save_to_database, tmc_section_data
+)
+
+
+def empty_cube_context():
+    """Contexto com o cubo do banco vazio: data de início depois da data de fim"""
+    init_database()
+    scs = pd.DataFrame({'Data': pd.to_datetime(['2025-03-10']), 'Pedido': [100], 'Comprador': ['Ana'],
+                        'Valor': [10.0], 'TMC': [4], 'PMP': [30]})
+    saving = pd.DataFrame({'Data': pd.to_datetime(['2025-03-10']), 'Número Pedido': [100], 'VALOR FINAL': [10.0]})
+    assert save_to_database(scs, saving, 'planilha.xlsx', mode='substituir')[0]
+
+    cubo = load_cube_from_database(1, date(2025, 10, 20), date(2025, 1, 2))
+    assert cubo.empty
+
+    return SimpleNamespace(cubo=cubo, compras_comprador=pd.DataFrame(columns=['Comprador', 'TMC', 'PMP']))
+
+
+def test_tmc_and_pmps_sections_with_empty_cube():
+    ctx = empty_cube_context()
+
+    tmc = tmc_section_data(ctx)['tmc_geral']
+    pmps = pmps_section_data(ctx)['pmps_geral']
+
+    assert np.isnan(tmc) and np.isnan(pmps)
+    assert '<div class="metric-value">-</div>' in create_kpi_card(tmc, "TMC Médio Geral", "days")
+
+
+def test_rank_products_with_no_selected_category():
+    scs = pd.DataFrame({'Categoria': ['A', 'B'], 'Descrição': ['P1', 'P2'], 'Valor': [10.0, 5.0]})
+
+    top_produtos, produtos_unicos = rank_products_by_category(scs, 'Categoria', 'Descrição', [])
+
+    assert top_produtos.empty
+    assert {'Valor Formatado', '% Formatado'} <= set(top_produtos.columns)
+    assert produtos_unicos.empty
+
+
+def test_rank_products_formats_values():
+    scs = pd.DataFrame({'Categoria': ['A', 'A', 'B'], 'Descrição': ['P1', 'P2', 'P3'], 'Valor': [1500.0, 500.0, 5.0]})
+
+    top_produtos, _ = rank_products_by_category(scs, 'Categoria', 'Descrição', ['A'])
+
+    assert list(top_produtos['Valor Formatado']) == ['R$ 1,500.00', 'R$ 500.00']
+    assert list(top_produtos['% Formatado']) == ['75.0%', '25.0%']
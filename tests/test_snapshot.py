@@ -0,0 +1,97 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import supplymobi
+from supplymobi import (
+    apply_categorical_schema, get_connection_manager, init_database, read_snapshot, read_tables_from_database,
+    save_to_database, write_snapshot
+)
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(supplymobi, 'SNAPSHOT_DIR', str(tmp_path / 'snapshot'))
+    return tmp_path / 'snapshot'
+
+
+def tables():
+    """Abas com inteiros, reais com NaN, datas com NaT, categorias com ausentes e texto com None"""
+    scs = pd.DataFrame({
+        'id': np.array([1, 2, 3], dtype=np.int64),
+        'Data': pd.to_datetime(['2025-03-10 08:30', None, '2025-03-12 00:00']),
+        'Valor': [10.5, np.nan, 3.0],
+        'Comprador': ['ANA', None, 'CARLOS'],
+        'Descrição': ['FILTRO', None, 'VÁLVULA'],
+    })
+    saving = pd.DataFrame({
+        'id': np.array([], dtype=np.int64),
+        'Data': pd.to_datetime([]),
+        'Comprador': pd.Series([], dtype=object),
+    })
+    return apply_categorical_schema(scs, saving)
+
+
+def test_snapshot_round_trip(snapshot_dir):
+    scs, saving = tables()
+
+    write_snapshot(7, {'scs': scs, 'saving': saving})
+    snapshot = read_snapshot(7)
+
+    pd.testing.assert_frame_equal(snapshot['scs'], scs)
+    assert snapshot['saving'].empty
+    assert list(snapshot['saving'].columns) == list(saving.columns)
+
+    # Mesmo dicionário de categorias nas duas abas; ausentes voltam como código -1
+    assert snapshot['scs']['Comprador'].dtype == snapshot['saving']['Comprador'].dtype
+    assert list(snapshot['scs']['Comprador'].cat.codes) == [0, -1, 1]
+    assert snapshot['scs']['Data'].dtype == scs['Data'].dtype
+    assert pd.isna(snapshot['scs'].loc[1, 'Data']) and pd.isna(snapshot['scs'].loc[1, 'Descrição'])
+
+
+def test_snapshot_of_another_upload_is_ignored(snapshot_dir):
+    scs, saving = tables()
+    write_snapshot(7, {'scs': scs, 'saving': saving})
+
+    assert read_snapshot(8) is None
+
+    # Manifesto copiado para a pasta de outro upload não vale para ele
+    os.rename(snapshot_dir / '7', snapshot_dir / '8')
+    assert read_snapshot(8) is None
+
+    manifest = json.loads((snapshot_dir / '8' / 'manifest.json').read_text(encoding='utf-8'))
+    assert manifest['upload_id'] == 7
+
+
+def test_new_snapshot_replaces_previous_uploads(snapshot_dir):
+    scs, saving = tables()
+    write_snapshot(7, {'scs': scs, 'saving': saving})
+    write_snapshot(8, {'scs': scs.iloc[:1], 'saving': saving})
+
+    assert sorted(os.listdir(snapshot_dir)) == ['8']
+    assert len(read_snapshot(8)['scs']) == 1
+
+
+def test_incremental_upload_rebuilds_the_full_snapshot():
+    init_database()
+    scs = pd.DataFrame({'Data': pd.to_datetime(['2025-03-10', '2025-03-11']), 'Pedido': [100, 200],
+                        'Comprador': ['ANA', 'CARLOS'], 'Valor': [10.0, 5.0]})
+    saving = pd.DataFrame({'Data': pd.to_datetime(['2025-03-10']), 'Número Pedido': [100], 'VALOR FINAL': [9.0]})
+    assert save_to_database(scs, saving, 'planilha.xlsx', mode='substituir')[0]
+
+    # Delta só com o pedido 100 alterado: o snapshot continua com o pedido 200
+    delta = scs.iloc[:1].assign(Valor=12.0)
+    assert save_to_database(delta, saving, 'planilha.xlsx', mode='incremental')[0]
+
+    with get_connection_manager().read() as conn:
+        upload_id = conn.execute('SELECT MAX(id) FROM upload_control').fetchone()[0]
+        banco = read_tables_from_database(conn)
+
+    snapshot = read_snapshot(upload_id)
+
+    assert list(snapshot['scs']['Valor']) == [12.0, 5.0]
+    pd.testing.assert_frame_equal(snapshot['scs'], banco[0])
+    pd.testing.assert_frame_equal(snapshot['saving'], banco[1])
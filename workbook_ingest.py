@@ -0,0 +1,303 @@
+# Leitura e conversão das abas da planilha, sem dependência do Streamlit.
+# Fica em módulo próprio para que as funções possam rodar em processos de trabalho.
+import hashlib
+import multiprocessing
+import os
+import queue
+import sqlite3
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from openpyxl import load_workbook
+
+# Mapeamento das colunas da planilha para as colunas do banco
+SCS_COLUMNS_MAP = {
+    'Data': 'data',
+    'Descrição': 'descricao',
+    'Status': 'status',
+    'Prioridade': 'prioridade',
+    'Solicitante': 'solicitante',
+    'Departamento': 'departamento',
+    'Categoria': 'categoria',
+    'Data da Compra': 'data_compra',
+    'Pedido': 'pedido',
+    'TMC': 'tmc',
+    'PMP': 'pmp',
+    'Valor': 'valor',
+    'Fornecedor': 'fornecedor',
+    'Comprador': 'comprador'
+}
+
+SAVING_COLUMNS_MAP = {
+    'Data': 'data',
+    'Número Pedido': 'numero_pedido',
+    'Fornecedor': 'fornecedor',
+    'VALOR INICIAL': 'valor_inicial',
+    'VALOR FINAL': 'valor_final',
+    'Redução R$': 'reducao_reais',
+    'Redução %': 'reducao_percentual',
+    'Comentários Negocição': 'comentarios_negociacao',
+    'Tipo de Saving': 'tipo_saving',
+    'Comprador': 'comprador'
+}
+
+# Tipos das colunas do banco usados na conversão dos blocos lidos da planilha
+SCS_COLUMN_TYPES = {
+    'data': 'datetime',
+    'data_compra': 'datetime',
+    'pedido': 'number',
+    'tmc': 'number',
+    'pmp': 'number',
+    'valor': 'number'
+}
+
+SAVING_COLUMN_TYPES = {
+    'data': 'datetime',
+    'numero_pedido': 'number',
+    'valor_inicial': 'number',
+    'valor_final': 'number',
+    'reducao_reais': 'number',
+    'reducao_percentual': 'number'
+}
+
+# Abas da planilha com a tabela do banco, o mapeamento e os tipos das colunas
+SHEETS = {
+    "SC's": ('scs', SCS_COLUMNS_MAP, SCS_COLUMN_TYPES),
+    "Saving": ('saving', SAVING_COLUMNS_MAP, SAVING_COLUMN_TYPES),
+}
+
+# Coluna que agrupa as linhas de cada tabela na carga incremental
+KEY_COLUMNS = {
+    'scs': 'pedido',
+    'saving': 'numero_pedido',
+}
+
+# Quantidade de linhas lidas da planilha por bloco na carga em streaming
+INGEST_CHUNK_SIZE = 5000
+
+# Arquivo de staging de um upload: descartável, sem diário nem espera pelo disco
+STAGING_PRAGMAS = {
+    'journal_mode': 'OFF',
+    'synchronous': 'OFF',
+}
+
+def available_cpus():
+    """Processadores que este processo pode usar (respeita o limite do container quando o sistema informa)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Processos usados na leitura paralela (uma aba por processo)
+INGEST_WORKERS = min(2, available_cpus())
+
+
+def iter_sheet_chunks(workbook, sheet_name, chunk_size=INGEST_CHUNK_SIZE):
+    """Lê uma aba da planilha em blocos de tamanho fixo sem carregar a aba inteira"""
+    worksheet = workbook[sheet_name]
+    rows = worksheet.iter_rows(values_only=True)
+
+    header = next(rows, None)
+    if header is None:
+        return
+
+    # Colunas sem título recebem o mesmo nome usado pelo pandas
+    columns = [name if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+
+    width = len(columns)
+
+    while True:
+        raw_block = list(islice(rows, chunk_size))
+        if not raw_block:
+            return
+
+        # Ignorar linhas em branco e alinhar linhas irregulares ao cabeçalho
+        block = [
+            tuple(row[:width]) + (None,) * (width - len(row))
+            for row in raw_block
+            if any(value is not None for value in row)
+        ]
+        if block:
+            yield pd.DataFrame(block, columns=columns)
+
+
+def iter_frame_chunks(df, chunk_size=INGEST_CHUNK_SIZE):
+    """Percorre um DataFrame já carregado nos mesmos blocos da leitura em streaming"""
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+def coerce_chunk(chunk, columns_map, column_types):
+    """Seleciona, renomeia e converte os tipos de um bloco lido da planilha"""
+    available = [col for col in columns_map if col in chunk.columns]
+    chunk = chunk[available].rename(columns=columns_map)
+
+    for column in chunk.columns:
+        column_type = column_types.get(column, 'text')
+        if column_type == 'datetime':
+            chunk[column] = pd.to_datetime(chunk[column], errors='coerce').dt.strftime('%Y-%m-%d %H:%M:%S')
+        elif column_type == 'number':
+            chunk[column] = pd.to_numeric(chunk[column], errors='coerce')
+        else:
+            chunk[column] = chunk[column].where(chunk[column].isna(), chunk[column].astype(str))
+
+    return chunk
+
+
+def open_staging(path):
+    """Abre o arquivo de staging de uma aba, que recebe a planilha antes de ser aplicada no banco"""
+    conn = sqlite3.connect(path)
+    for pragma, value in STAGING_PRAGMAS.items():
+        conn.execute(f'PRAGMA {pragma} = {value}')
+    return conn
+
+
+def row_digest(*values):
+    """Resumo do conteúdo de uma linha, que a identifica dentro do pedido sem depender da posição"""
+    return hashlib.md5(repr(values).encode()).hexdigest()
+
+
+def assign_line_keys(conn, table, key_column, columns_map, order_by):
+    """
+    Numera as linhas de cada pedido (coluna linha) e grava a chave estável da linha (coluna chave_linha):
+    resumo do conteúdo + ocorrência entre linhas iguais do mesmo pedido
+    """
+    conn.create_function('row_digest', -1, row_digest, deterministic=True)
+    digest = f"row_digest({', '.join(columns_map.values())})"
+
+    conn.execute(f'''
+        UPDATE {table}
+        SET linha = numeradas.linha, chave_linha = numeradas.chave_linha
+        FROM (
+            SELECT row_id,
+                   ROW_NUMBER() OVER (PARTITION BY {key_column} ORDER BY {order_by}) - 1 AS linha,
+                   digest || ':' || (ROW_NUMBER() OVER (PARTITION BY {key_column}, digest ORDER BY {order_by}) - 1)
+                       AS chave_linha
+            FROM (SELECT *, rowid AS row_id, {digest} AS digest FROM {table})
+        ) AS numeradas
+        WHERE numeradas.row_id = {table}.rowid
+    ''')
+
+
+def create_staging_table(conn, table, columns_map, declared_types):
+    """Cria a tabela de staging com os mesmos tipos declarados da tabela final"""
+    # Mesmos tipos declarados da tabela final: o resumo da linha é calculado sobre os mesmos valores
+    columns = list(columns_map.values()) + ['upload_timestamp']
+    definitions = ', '.join(f'{column} {declared_types.get(column, "")}' for column in columns)
+
+    conn.execute(f'DROP TABLE IF EXISTS {table}')
+    conn.execute(f'''
+        CREATE TABLE {table} (stage_id INTEGER PRIMARY KEY, {definitions}, linha INTEGER, chave_linha TEXT)
+    ''')
+
+
+def insert_staging_records(conn, table, records, upload_time):
+    """Insere um bloco de registros já convertidos na tabela de staging"""
+    records = records.assign(upload_timestamp=upload_time.strftime('%Y-%m-%d %H:%M:%S'))
+
+    # Valores ausentes viram NULL no SQLite
+    records = records.astype(object).where(records.notna(), None)
+
+    columns = ', '.join(records.columns)
+    placeholders = ', '.join('?' * len(records.columns))
+    conn.executemany(
+        f'INSERT INTO {table} ({columns}) VALUES ({placeholders})',
+        records.itertuples(index=False, name=None)
+    )
+
+
+def stage_chunks(path, sheet_name, chunks, declared_types, upload_time, report=None):
+    """Converte e grava os blocos de uma aba no arquivo de staging; report(linhas) é chamado a cada bloco"""
+    table, columns_map, column_types = SHEETS[sheet_name]
+    conn = open_staging(path)
+
+    try:
+        create_staging_table(conn, table, columns_map, declared_types)
+
+        written = 0
+        for chunk in chunks:
+            records = coerce_chunk(chunk, columns_map, column_types)
+            insert_staging_records(conn, table, records, upload_time)
+
+            written += len(records)
+            if report is not None:
+                report(written)
+
+        # Posição e chave das linhas calculadas aqui, fora do escritor do banco
+        key_column = KEY_COLUMNS[table]
+        assign_line_keys(conn, table, key_column, columns_map, 'stage_id')
+        conn.execute(f'CREATE INDEX ix_{table}_chave_linha ON {table} ({key_column}, chave_linha)')
+
+        conn.commit()
+        return written
+    finally:
+        conn.close()
+
+
+def stage_sheet(workbook_path, sheet_name, path, declared_types, upload_time, progress_queue=None,
+                chunk_size=INGEST_CHUNK_SIZE):
+    """Lê uma aba direto para o arquivo de staging, bloco a bloco, e devolve só o total de linhas"""
+    # Modo read-only: só a aba pedida é percorrida, as demais nem são lidas
+    workbook = load_workbook(workbook_path, read_only=True, data_only=True)
+
+    try:
+        if sheet_name not in workbook.sheetnames:
+            raise ValueError(f"Aba '{sheet_name}' não encontrada no arquivo")
+
+        # O progresso de cada bloco gravado volta ao processo principal pela fila
+        report = None
+        if progress_queue is not None:
+            total_rows = workbook[sheet_name].max_row
+            report = lambda written: progress_queue.put((sheet_name, written, total_rows))
+
+        return stage_chunks(path, sheet_name, iter_sheet_chunks(workbook, sheet_name, chunk_size),
+                            declared_types, upload_time, report)
+    finally:
+        workbook.close()
+
+
+def drain_progress(progress_queue, progress_callback, timeout=None):
+    """Repassa ao callback os avisos de progresso já enviados pelos processos de trabalho"""
+    try:
+        item = progress_queue.get(timeout=timeout) if timeout else progress_queue.get_nowait()
+        while True:
+            progress_callback(*item)
+            item = progress_queue.get_nowait()
+    except queue.Empty:
+        pass
+
+
+def stage_workbook_parallel(workbook_path, pool, paths, declared_types, upload_time,
+                            progress_callback=None, progress_queue=None):
+    """
+    Lê as abas SC's e Saving ao mesmo tempo, uma em cada processo do pool, para os arquivos de staging;
+    os processos recebem só o caminho da planilha, não o conteúdo
+    """
+    if progress_callback is None:
+        progress_queue = None
+
+    futures = {
+        table: pool.submit(stage_sheet, workbook_path, sheet_name, paths[table], declared_types[table],
+                           upload_time, progress_queue)
+        for sheet_name, (table, _, _) in SHEETS.items()
+    }
+
+    if progress_queue is not None:
+        # O callback roda no processo principal enquanto as abas são gravadas
+        while not all(future.done() for future in futures.values()):
+            drain_progress(progress_queue, progress_callback, timeout=0.2)
+        drain_progress(progress_queue, progress_callback)
+
+    return {table: future.result() for table, future in futures.items()}
+
+
+def create_ingest_pool(max_workers=INGEST_WORKERS):
+    """Cria o pool de processos usado na leitura paralela das abas"""
+    # spawn evita herdar as threads do servidor do Streamlit no fork
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def create_progress_manager():
+    """Cria o gerenciador das filas que trazem o progresso dos processos de trabalho"""
+    return multiprocessing.get_context('spawn').Manager()